@@ -4,12 +4,16 @@ import sys
 import os
 import asyncio
 import time
-from agents import Agent, Runner, function_tool, ModelSettings, HostedMCPTool,SQLiteSession,WebSearchTool
+from agents import Agent, function_tool, ModelSettings, HostedMCPTool,SQLiteSession,WebSearchTool
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from question_check_test import checkquestion_with_gpt
+from bi_core import DAG, chat_completion, openai_client, run_agent, stage_agent
+from bi_core.output_models import (
+    AudienceAnalysis, MarketAnalysis, SchemaDescription,
+    output_data, output_json, structured_output
+)
 
 
 ### 传参
@@ -39,11 +43,10 @@ AUDIENCE_ANALYSIS_PROMPT=(Path(__file__).resolve().parent / "demo2" / "audience_
 ### 2. 工具函数
 def audit_table_with_gpt(table_info):
     # print(table_name,schema_data,sample_data)
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    client = openai_client(OPENAI_API_KEY)
     # print(client)
     prompt = f"""
-You are a data compliance expert. Please analyze the following Supabase table according to OpenAI data policies:
-Table information: {table_info}
+You are a data compliance expert. Please analyze the Supabase table given at the end according to OpenAI data policies.
 Requirements:
 1. Identify possible personal contact information or sensitive fields related to religion, politics, minors, etc.;
 2. Explain whether it violates data compliance regulations;
@@ -52,18 +55,21 @@ Requirements:
 5. If contains_sensitive_data is True, output specific fields to contains_sensitive_fields; if contains_sensitive_data is False, contains_sensitive_fields should be null
 6. Output language: English
 7. Return ONLY valid JSON, no additional text or explanations
+Table information: {table_info}
 """
 
     # print(f"正在进行表：{table_info.get('table_name')}的数据审查 ...")
     # print(table_info)
-    response = client.chat.completions.create(
+    response = chat_completion(
+        client,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a data compliance expert. Always respond with valid JSON only."},
             {"role": "user", "content": prompt}
         ],
         response_format={"type": "json_object"},
-        temperature=0
+        temperature=0,
+        stage="data_audit"
     )
     # print(response)
     report = response.choices[0].message.content
@@ -147,123 +153,115 @@ async def main():
         ],
         
     )
-    session = SQLiteSession(USER_NAME,f"{USER_NAME}_conversations.db")    	
-    print(" =======  schema_description  ======= ")
-    schema_analysis = await Runner.run(
-        agent,
-        input="""use supabase mcp tools, give me a description in Supabase public schema.
-        Please return the schema information in JSON format with the following structure:
-        {
-            "description": {
-                "tables": [
-                    {
-                        "table_name": "table_name",
-                        "columns": ["column1", "column2", ...],
-                        "sample_data": [{"column1": "value1", "column2": "value2", ...}]
-                    }
-                ]
-            }
-        }
-        
-        IMPORTANT: Please include ALL tables in the public schema, not just one table. 
-        Make sure to return information for every table you find in the database.
-        """,
-        session=session
-    )
-    schema_analysis_output = schema_analysis.final_output
-    print(f"Schema analysis output: {schema_analysis_output}")
-    try:
-        schema_analysis_json = json.loads(schema_analysis_output)
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
-        print("Creating mock schema data for testing...")
-        schema_analysis_json = {
-            "description": {
-                "tables": [
-                    {
-                        "table_name": "test_table",
-                        "columns": ["id", "name", "created_at"],
-                        "sample_data": [{"id": 1, "name": "test", "created_at": "2024-01-01"}]
-                    }
-                ]
-            }
-        }
+    session = SQLiteSession(USER_NAME,f"{USER_NAME}_conversations.db")
     output_dir = Path(__file__).resolve().parent / "outputs-1"
     output_dir.mkdir(exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    md_path = output_dir / f"schema_description _{timestamp}.md"
-    md_path.write_text(schema_analysis_output, encoding="utf-8")
-    print(" =======  data_check  ======= ")  
-    tables_info = schema_analysis_json.get("description")["tables"]
-    all_allowed,summary = data_check(tables_info)
-    # ----------------------
-    # -------------------------
-    if all_allowed:
+
+    async def schema_stage():
+        print(" =======  schema_description  ======= ")
+        schema_analysis = await run_agent(
+            stage_agent(agent, "schema_description", output_type=structured_output(SchemaDescription)),
+            input="""use supabase mcp tools, give me a description in Supabase public schema.
+            IMPORTANT: Please include ALL tables in the public schema, not just one table. 
+            Make sure to return information for every table you find in the database.
+            """,
+            session=session,
+            stage="schema_description"
+        )
+        schema_analysis_output = output_json(schema_analysis.final_output)
+        schema_analysis_json = output_data(schema_analysis.final_output)
+        print(f"Schema analysis output: {schema_analysis_output}")
+        md_path = output_dir / f"schema_description _{timestamp}.md"
+        md_path.write_text(schema_analysis_output, encoding="utf-8")
+        return schema_analysis_output, schema_analysis_json
+
+    def data_check_stage(schema):
+        print(" =======  data_check  ======= ")
+        tables_info = schema[1].get("description")["tables"]
+        return data_check(tables_info)
+
+    async def market_stage(data_check):
         print("======== Market Analysis ========")
-        market_analysis = await Runner.run(
-            agent,
-            input=MARKET_ANALYSIS_PROMPT,
-            session=session
+        # 阶段提示词放在系统指令中（稳定前缀，便于提示缓存），输入只说明要执行的流程
+        market_analysis = await run_agent(
+            stage_agent(agent, "market_analysis", MARKET_ANALYSIS_PROMPT, structured_output(MarketAnalysis)),
+            input="Run the market analysis workflow from your instructions on the connected Supabase data.",
+            session=session,
+            stage="market_analysis"
         )
-        output = market_analysis.final_output
-        output_dir = Path(__file__).resolve().parent / "outputs-1"
-        output_dir.mkdir(exist_ok=True)
+        output = output_json(market_analysis.final_output)
         md_path = output_dir / f"market_analysis_{timestamp}.md"
         md_path.write_text(output, encoding="utf-8")
         print("market analysis finished.")
+        return output
+
+    async def audience_stage(data_check):
         print("======== audience Analysis =========")
-        audience_analysis = await Runner.run(
-            agent, 
-            input = AUDIENCE_ANALYSIS_PROMPT,
-            session=session
+        audience_analysis = await run_agent(
+            stage_agent(agent, "audience_analysis", AUDIENCE_ANALYSIS_PROMPT, structured_output(AudienceAnalysis)),
+            input = "Run the audience analysis workflow from your instructions on the connected Supabase data.",
+            session=session,
+            stage="audience_analysis"
             )
-        audience_analysis_output = audience_analysis.final_output
-        output_dir = Path(__file__).resolve().parent / "outputs-1"
-        output_dir.mkdir(exist_ok=True)
+        audience_analysis_output = output_json(audience_analysis.final_output)
         md_path = output_dir / f"audience_analysis_{timestamp}.md"
         md_path.write_text(audience_analysis_output, encoding="utf-8")
         print("audience analysis finished.")
+        return audience_analysis_output
 
-        ## 问题审查
+    ## 问题审查
+    def validation_stage(schema, audience):
         print("=======  data modeling validation ========")
-        results_json = json.loads(audience_analysis_output)
+        results_json = json.loads(audience)
         reports_list = []
         for segment in results_json.get("segments", []):
             segment_name = segment.get("segment_name", "unknown_segment")
             for question in segment.get("valued_questions", []):
                 print(f"---- {segment_name}")
-                report = checkquestion_with_gpt(question, schema_analysis_output)
+                report = checkquestion_with_gpt(question, schema[0])
                 reports_list.append(report)
         print(reports_list)
         
         # 保存数据建模验证结果到文件
-        output_dir = Path(__file__).resolve().parent / "outputs-1"
-        output_dir.mkdir(exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        validation_path = output_dir / f"data_modeling_validation_{timestamp}.json"
+        validation_timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        validation_path = output_dir / f"data_modeling_validation_{validation_timestamp}.json"
         validation_path.write_text(json.dumps(reports_list, indent=4, ensure_ascii=False), encoding="utf-8")
         print(f"数据建模验证结果已保存到: {validation_path}")
-    else:
-        output_info = check_result.get("check_report")
-        print(output_info)
+        return reports_list
+
+    def audit_failed_stage(data_check):
+        all_allowed, summary = data_check
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
         
         # 保存审查失败的结果到文件
-        output_dir = Path(__file__).resolve().parent / "outputs-1"
-        output_dir.mkdir(exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        failed_timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         
         # 创建包含all_allowed和summary的完整审查失败结果
         complete_audit_failed_result = {
             "all_allowed": all_allowed,
             "summary": summary,
-            "audit_timestamp": timestamp
+            "audit_timestamp": failed_timestamp
         }
         
-        audit_failed_path = output_dir / f"data_audit_failed_{timestamp}.json"
+        audit_failed_path = output_dir / f"data_audit_failed_{failed_timestamp}.json"
         audit_failed_path.write_text(json.dumps(complete_audit_failed_result, indent=4, ensure_ascii=False), encoding="utf-8")
         print(f"数据审查失败结果已保存到: {audit_failed_path}")
         print(f"all_allowed: {all_allowed}")
         print(f"summary: {json.dumps(summary, indent=2, ensure_ascii=False)}")
-	
+
+    # 按依赖关系执行：审查通过后市场分析与受众分析并行
+    allowed = lambda data_check: data_check[0]
+    pipeline = DAG("bi_result")
+    pipeline.add_stage("schema", schema_stage)
+    pipeline.add_stage("data_check", data_check_stage, inputs=["schema"], blocking=True)
+    pipeline.add_stage("market", market_stage, inputs=["data_check"], when=allowed)
+    pipeline.add_stage("audience", audience_stage, inputs=["data_check"], when=allowed)
+    pipeline.add_stage("validation", validation_stage, inputs=["schema", "audience"], blocking=True)
+    pipeline.add_stage("audit_failed", audit_failed_stage, inputs=["data_check"],
+                       when=lambda data_check: not data_check[0])
+    outcome = await pipeline.run()
+    print(f"stage timings: {json.dumps(outcome.timings)}")
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
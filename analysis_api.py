@@ -3,7 +3,8 @@
 """
 Analysis API - FastAPI wrapper for demo-2.py script
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Literal, Dict, List, Any, Optional
 import asyncio
@@ -11,22 +12,37 @@ import time
 import os
 from datetime import datetime
 from pathlib import Path
+from contextlib import asynccontextmanager
+
+from bi_core.batch import SharedResources, SkipItem, batch_concurrency, max_batch_items, run_batch, summarize_batch
+from bi_core.compression import CompressionMiddleware
+from bi_core.fast_json import FastJSONResponse, dumps
+from bi_core.projection import PageRequest, ProjectionError, view_results
+from bi_core.llm import use_api_key
+from bi_core.sessions import BatchSessions, SessionFork
+from bi_core.startup import HEAVY_MODULES, Warmup, import_modules, read_prompt
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background so the server binds and answers /health
+    # immediately; /ready reports when it has finished
+    warmup.start()
+    yield
+    await warmup.stop()
 
-# Import the core functionality from demo2 package
-from demo2 import (
-    initialize_agent,
-    run_schema_analysis,
-    run_market_analysis, 
-    run_audience_analysis,
-    save_to_database
-)
 
 app = FastAPI(
     title="AI Analysis API",
     version="1.0.0",
-    description="A FastAPI service for AI-powered data analysis using OpenAI Agents and Supabase MCP tools."
+    description="A FastAPI service for AI-powered data analysis using OpenAI Agents and Supabase MCP tools.",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# Compress large responses for clients that accept it
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", 1024)))
+
 # Request Models
 class AnalysisRequest(BaseModel):
     """Analysis request model"""
@@ -54,6 +70,14 @@ class AnalysisRequest(BaseModel):
         default=None,
         description="OpenAI API key (optional, can use env variable)"
     )
+    fields: Optional[List[str]] = Field(
+        default=None,
+        description="JSON pointers into results to return, e.g. /market_analysis/market_segments (default: everything)"
+    )
+    page: Optional[PageRequest] = Field(
+        default=None,
+        description="Cursor pagination of one list-valued section of results"
+    )
 
 class AnalysisResponse(BaseModel):
     """Analysis response model"""
@@ -63,9 +87,37 @@ class AnalysisResponse(BaseModel):
     results: Dict[str, Any] = {}
     files_generated: List[str] = []
     database_saved: bool = False
+    page: Optional[Dict[str, Any]] = None
     execution_time: float
     timestamp: str
 
+class BatchAnalysisResponse(BaseModel):
+    """Batch analysis response model (stream=true sends the items and then this summary as NDJSON lines)"""
+    success: bool
+    analysis_type: str = "batch"
+    message: str
+    summary: Dict[str, int] = {}
+    max_concurrency: int
+    agents_built: int = 0
+    items: List[Dict[str, Any]] = []
+    execution_time: float
+    timestamp: str
+
+# Warm-up: everything the first request would otherwise pay for
+warmup = Warmup()
+
+@warmup.step("import_sdks")
+def warm_import_sdks():
+    # demo2 pulls in the agents SDK and builds the tools
+    return import_modules(HEAVY_MODULES + ("demo2",))
+
+@warmup.step("load_prompts")
+def warm_load_prompts():
+    prompt_files = sorted((Path(__file__).resolve().parent / "demo2").glob("*.md"))
+    for prompt_file in prompt_files:
+        read_prompt(prompt_file)
+    return {"files": len(prompt_files)}
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -76,6 +128,13 @@ async def health_check():
         "service": "AI Analysis API"
     }
 
+# Readiness endpoint
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once the start-up warm-up has finished (503 before), with per-step timings"""
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 # Configuration endpoint
 @app.get("/config")
 async def get_config():
@@ -87,12 +146,87 @@ async def get_config():
         "timestamp": datetime.now().isoformat()
     }
 
+async def execute_analysis(agent, request: AnalysisRequest, session=None):
+    """Run one analysis request with agent; returns (results, files_generated, database_saved)
+
+    session defaults to the user's own; batch runs pass their branch of it.
+    """
+    from demo2 import get_session, run_schema_analysis, run_market_analysis, run_audience_analysis, save_to_database
+
+    session = session if session is not None else get_session(request.user_name)
+    results = {}
+    files_generated = []
+    database_saved = False
+    
+    # Execute analysis based on type
+    if request.analysis_type == "schema":
+        result = await run_schema_analysis(agent, request.user_name, session)
+        results["schema_analysis"] = result["output"]
+        files_generated.extend(result["files"])
+        await save_to_database("schema_analysis", result["output"])
+        database_saved = True
+        
+    elif request.analysis_type == "market":
+        result = await run_market_analysis(agent, request.user_name, session)
+        results["market_analysis"] = result["output"]
+        files_generated.extend(result["files"])
+        await save_to_database("market_analysis", result["output"])
+        database_saved = True
+        
+    elif request.analysis_type == "audience":
+        result = await run_audience_analysis(agent, request.user_name, session)
+        results["audience_analysis"] = result["output"]
+        files_generated.extend(result["files"])
+        await save_to_database("audience_analysis", result["output"])
+        database_saved = True
+        
+    elif request.analysis_type == "all":
+        # Run all analyses in parallel, each on its own branch of the user's
+        # session; the branches are merged in a fixed order once all succeeded
+        async with SessionFork(session) as fork:
+            schema_result, market_result, audience_result = await asyncio.gather(
+                run_schema_analysis(agent, request.user_name, session=fork.branch("schema")),
+                run_market_analysis(agent, request.user_name, session=fork.branch("market")),
+                run_audience_analysis(agent, request.user_name, session=fork.branch("audience"))
+            )
+            await fork.merge("schema", "market", "audience")
+        
+        results = {
+            "schema_analysis": schema_result["output"],
+            "market_analysis": market_result["output"],
+            "audience_analysis": audience_result["output"]
+        }
+        
+        files_generated.extend(schema_result["files"])
+        files_generated.extend(market_result["files"])
+        files_generated.extend(audience_result["files"])
+        
+        # Save all results to database
+        await save_to_database("schema_analysis", schema_result["output"])
+        await save_to_database("market_analysis", market_result["output"])
+        await save_to_database("audience_analysis", audience_result["output"])
+        database_saved = True
+    
+    return results, files_generated, database_saved
+
+def select_results(results: Dict[str, Any], request: AnalysisRequest):
+    """Only the requested fields / page of results; returns (results, page info or None)"""
+    if not request.fields and request.page is None:
+        return results, None
+    try:
+        return view_results(results, request.fields, request.page)
+    except ProjectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Main analysis endpoint
 @app.post("/analyze", response_model=AnalysisResponse)
 async def analyze_data(request: AnalysisRequest):
     """
     Main analysis endpoint that handles different types of analysis requests
     """
+    # Import the core functionality from demo2 package
+    from demo2 import initialize_agent
+
     start_time = time.time()
     
     try:
@@ -126,24 +260,18 @@ async def analyze_data(request: AnalysisRequest):
         # Priority: Use request API key first, then environment variable
         if api_key_to_use and ('*' not in api_key_to_use and len(api_key_to_use) >= 50):
             print(f"Using request API key: {api_key_to_use[:20]}...")
-            os.environ["OPENAI_API_KEY"] = api_key_to_use
         elif env_api_key and ('*' not in env_api_key and len(env_api_key) >= 50):
             print(f"Using environment API key: {env_api_key[:20]}...")
-            os.environ["OPENAI_API_KEY"] = env_api_key
             api_key_to_use = env_api_key
         else:
             # Use fallback API key only if both are invalid
             fallback_key = os.getenv("FALLBACK_OPENAI_API_KEY", "invalid_key")
             print(f"Both request and environment keys are invalid, using fallback: {fallback_key[:20]}...")
-            os.environ["OPENAI_API_KEY"] = fallback_key
             api_key_to_use = fallback_key
         
-        # Set the API key to environment
-        if api_key_to_use:
-            os.environ["OPENAI_API_KEY"] = api_key_to_use
-        
-        # Final debug output
-        final_api_key = os.getenv("OPENAI_API_KEY")
+        # Final debug output; the key is applied to this request's model calls
+        # with use_api_key(), not written to the process environment
+        final_api_key = api_key_to_use
         print(f"Final API key to use: {final_api_key}")
         print(f"Final key length: {len(final_api_key) if final_api_key else 0}")
         print(f"Final key contains asterisks: {'*' in final_api_key if final_api_key else False}")
@@ -156,59 +284,10 @@ async def analyze_data(request: AnalysisRequest):
             user_name=request.user_name
         )
         
-        results = {}
-        files_generated = []
-        # Note: headers are not available in Pydantic model, using default values
-        headers = {"Content-Type": "application/json"}
-        database_saved = False
+        with use_api_key(api_key_to_use):
+            results, files_generated, database_saved = await execute_analysis(agent, request)
         
-        # Execute analysis based on type
-        if request.analysis_type == "schema":
-            result = await run_schema_analysis(agent, request.user_name)
-            results["schema_analysis"] = result["output"]
-            files_generated.extend(result["files"])
-            await save_to_database("schema_analysis", result["output"])
-            database_saved = True
-            
-        elif request.analysis_type == "market":
-            result = await run_market_analysis(agent, request.user_name)
-            results["market_analysis"] = result["output"]
-            files_generated.extend(result["files"])
-            await save_to_database("market_analysis", result["output"])
-            database_saved = True
-            
-        elif request.analysis_type == "audience":
-            result = await run_audience_analysis(agent, request.user_name)
-            results["audience_analysis"] = result["output"]
-            files_generated.extend(result["files"])
-            await save_to_database("audience_analysis", result["output"])
-            database_saved = True
-            
-        elif request.analysis_type == "all":
-            # Run all analyses in parallel
-            tasks = [
-                run_schema_analysis(agent, request.user_name),
-                run_market_analysis(agent, request.user_name),
-                run_audience_analysis(agent, request.user_name)
-            ]
-            
-            schema_result, market_result, audience_result = await asyncio.gather(*tasks)
-            
-            results = {
-                "schema_analysis": schema_result["output"],
-                "market_analysis": market_result["output"],
-                "audience_analysis": audience_result["output"]
-            }
-            
-            files_generated.extend(schema_result["files"])
-            files_generated.extend(market_result["files"])
-            files_generated.extend(audience_result["files"])
-            
-            # Save all results to database
-            await save_to_database("schema_analysis", schema_result["output"])
-            await save_to_database("market_analysis", market_result["output"])
-            await save_to_database("audience_analysis", audience_result["output"])
-            database_saved = True
+        results, page = select_results(results, request)
         
         execution_time = time.time() - start_time
         
@@ -219,6 +298,7 @@ async def analyze_data(request: AnalysisRequest):
             results=results,
             files_generated=files_generated,
             database_saved=database_saved,
+            page=page,
             execution_time=execution_time,
             timestamp=datetime.now().isoformat()
         )
@@ -233,68 +313,85 @@ async def analyze_data(request: AnalysisRequest):
         )
 
 # Batch analysis endpoint
-@app.post("/analyze/batch", response_model=AnalysisResponse)
-async def analyze_batch(requests: List[AnalysisRequest]):
+@app.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(
+    requests: List[AnalysisRequest],
+    stream: bool = Query(default=False, description="Stream one NDJSON line per item as it finishes"),
+    max_concurrency: Optional[int] = Query(default=None, ge=1, description="Items run at once (capped by BATCH_MAX_CONCURRENCY)")
+):
     """
     Batch analysis endpoint for multiple requests
+    Items run concurrently; items for the same project share one agent and
+    identical items share one run. Each run works on its own branch of the
+    user's conversation session; the branches of finished runs are merged in
+    item order after the batch. Every item reports its own status, timing
+    and error, so one failing item does not fail the batch.
     """
+    from demo2 import get_session, initialize_agent
+
+    if len(requests) > max_batch_items():
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {max_batch_items()} items")
     start_time = time.time()
+    concurrency = batch_concurrency(max_concurrency)
+    agents = SharedResources()
+    runs = SharedResources()
+    sessions = BatchSessions(get_session)
+    items = list(enumerate(requests))
     
-    try:
-        all_results = {}
-        all_files = []
-        database_saved = True
-        
-        # Process all requests
-        for request in requests:
-            if not request.data_review_result:
-                continue
-                
-            # Initialize agent for this request
-            agent = await initialize_agent(
-                supabase_project_url=request.supabase_project_url,
-                supabase_access_token=request.supabase_access_token,
-                user_name=request.user_name
-            )
-            
-            # Execute analysis
-            if request.analysis_type == "schema":
-                result = await run_schema_analysis(agent, request.user_name)
-                all_results[f"schema_analysis_{request.user_name}"] = result["output"]
-                all_files.extend(result["files"])
-                await save_to_database("schema_analysis", result["output"])
-                
-            elif request.analysis_type == "market":
-                result = await run_market_analysis(agent, request.user_name)
-                all_results[f"market_analysis_{request.user_name}"] = result["output"]
-                all_files.extend(result["files"])
-                await save_to_database("market_analysis", result["output"])
-                
-            elif request.analysis_type == "audience":
-                result = await run_audience_analysis(agent, request.user_name)
-                all_results[f"audience_analysis_{request.user_name}"] = result["output"]
-                all_files.extend(result["files"])
-                await save_to_database("audience_analysis", result["output"])
-        
-        execution_time = time.time() - start_time
-        
-        return AnalysisResponse(
-            success=True,
-            analysis_type="batch",
-            message=f"Batch analysis completed successfully for {len(requests)} requests",
-            results=all_results,
-            files_generated=all_files,
-            database_saved=database_saved,
-            execution_time=execution_time,
-            timestamp=datetime.now().isoformat()
-        )
-        
-    except Exception as e:
-        execution_time = time.time() - start_time
-        raise HTTPException(
-            status_code=500,
-            detail=f"Batch analysis failed: {str(e)}"
+    async def run_item(item) -> Dict[str, Any]:
+        index, request = item
+        if not request.data_review_result:
+            raise SkipItem("Data review result is false. Analysis cannot proceed.")
+        project = (request.supabase_project_url, request.supabase_access_token)
+        agent = await agents.get(project, lambda: initialize_agent(
+            supabase_project_url=request.supabase_project_url,
+            supabase_access_token=request.supabase_access_token,
+            user_name=request.user_name
+        ))
+        results, files_generated, database_saved = await runs.get(
+            project + (request.analysis_type, request.user_name),
+            lambda: sessions.run(request.user_name, index, lambda session: execute_analysis(agent, request, session))
         )
+        results, page = select_results(results, request)
+        return {
+            "results": results,
+            "files_generated": files_generated,
+            "database_saved": database_saved,
+            "page": page
+        }
+    
+    def item_line(outcome: Dict[str, Any]) -> Dict[str, Any]:
+        request = requests[outcome["index"]]
+        return dict(outcome, analysis_type=request.analysis_type, user_name=request.user_name)
+    
+    def summary(outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        counts = summarize_batch(outcomes)
+        return {
+            "success": counts["failed"] == 0,
+            "analysis_type": "batch",
+            "message": f"Batch analysis finished: {counts['succeeded']} succeeded, "
+                       f"{counts['failed']} failed, {counts['skipped']} skipped",
+            "summary": counts,
+            "max_concurrency": concurrency,
+            "agents_built": agents.built,
+            "execution_time": time.time() - start_time,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    if stream:
+        async def lines():
+            outcomes = []
+            async for outcome in run_batch(items, run_item, concurrency):
+                outcomes.append(outcome)
+                yield dumps(dict(item_line(outcome), type="item")) + b"\n"
+            await sessions.merge()
+            yield dumps(dict(summary(outcomes), type="summary")) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    outcomes = [outcome async for outcome in run_batch(items, run_item, concurrency)]
+    await sessions.merge()
+    outcomes.sort(key=lambda outcome: outcome["index"])
+    return FastJSONResponse(dict(summary(outcomes), items=[item_line(outcome) for outcome in outcomes]))
 
 # Results management endpoints
 @app.get("/results")
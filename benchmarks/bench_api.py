@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput and latency benchmark for the BI Analysis API
+
+Drives /analyze (every analysis_type), /review, /integrated-analysis and
+/brand-strategy in-process against the offline fake backend and reports
+throughput, p50/p95/p99 latency, per-stage breakdowns, peak RSS and
+event-loop lag. Results are written as JSON and can be compared against a
+committed baseline with regression thresholds.
+
+Usage:
+    python benchmarks/bench_api.py --concurrency 1,8 --requests 16
+    python benchmarks/bench_api.py --baseline benchmarks/baseline.json --threshold 0.25
+    python benchmarks/bench_api.py --update-baseline
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BI_API_DIR = ROOT_DIR / "bi_api"
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import httpx
+
+from fake_backend import FakeBackend
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+BASE_PAYLOAD = {
+    "supabase_project_id": "benchproject",
+    "supabase_access_token": "sbp_bench_token",
+    "openai_api_key": "sk-bench-" + "x" * 48,
+}
+
+SCENARIOS = {
+    "analyze_schema": ("/analyze", {"analysis_type": "schema"}),
+    "analyze_market": ("/analyze", {"analysis_type": "market"}),
+    "analyze_audience": ("/analyze", {"analysis_type": "audience"}),
+    "analyze_all": ("/analyze", {"analysis_type": "all"}),
+    "review": ("/review", {}),
+    "integrated_market_only": ("/integrated-analysis", {"analysis_type": "market_only"}),
+    "integrated_full": ("/integrated-analysis", {"analysis_type": "full_integrated"}),
+    "brand_strategy": ("/brand-strategy", {"analysis_data": {"markets": ["benchmark"]}}),
+}
+
+
+def load_bi_app():
+    """Import bi_api/app.py under a private name (the repo root has its own app.py)
+
+    The fake backend has no OpenAI quota, so the rate limits are off unless
+    OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT are set explicitly.
+    """
+    os.environ.setdefault("OPENAI_RPM_LIMIT", "0")
+    os.environ.setdefault("OPENAI_TPM_LIMIT", "0")
+    spec = importlib.util.spec_from_file_location("bi_api_app", BI_API_DIR / "app.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["bi_api_app"] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(values: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of durations, converted to milliseconds"""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(values, 50) * scale, 3),
+        "p95": round(percentile(values, 95) * scale, 3),
+        "p99": round(percentile(values, 99) * scale, 3),
+        "mean": round(sum(values) / len(values) * scale, 3),
+        "max": round(max(values) * scale, 3),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None when unavailable)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 2)
+
+
+class LoopLagMonitor:
+    """Samples event-loop scheduling lag by measuring sleep overshoot"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def snapshot_outputs() -> set:
+    """Files currently present in the bi_api output directories"""
+    return {p for d in BI_API_DIR.glob("outputs*") if d.is_dir() for p in d.iterdir()}
+
+
+def cleanup_outputs(before: set):
+    """Remove output files the API wrote during the benchmark"""
+    for path in snapshot_outputs() - before:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    for directory in BI_API_DIR.glob("outputs*"):
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
+
+
+async def run_scenario(client: httpx.AsyncClient, backend: FakeBackend, name: str,
+                       concurrency: int, total_requests: int, verbose: bool = False,
+                       same_project: bool = False) -> Dict[str, Any]:
+    """Send total_requests to one endpoint with at most `concurrency` in flight"""
+    path, extra = SCENARIOS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(index: int):
+        nonlocal errors
+        payload = dict(BASE_PAYLOAD, user_name=f"bench_{name}_{index % concurrency}", **extra)
+        if not same_project:
+            # Distinct projects so identical requests are not coalesced
+            payload["supabase_project_id"] = f"benchproject{index}"
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors += 1
+
+    backend.reset()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+    wall = time.perf_counter() - started
+    await monitor.stop()
+
+    return {
+        "scenario": name,
+        "endpoint": path,
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "wall_time_s": round(wall, 4),
+        "throughput_rps": round(total_requests / wall, 3) if wall else 0.0,
+        "latency_ms": summarize(latencies),
+        "stages": {
+            stage: dict(calls=len(values), **summarize(values))
+            for stage, values in sorted(backend.stage_calls().items())
+        },
+        "event_loop_lag_ms": summarize(monitor.samples),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run_benchmark(scenarios: List[str], concurrency_levels: List[int],
+                        total_requests: int, latency_scale: float,
+                        verbose: bool = False, same_project: bool = False) -> Dict[str, Any]:
+    """Run every scenario at every concurrency level"""
+    app = load_bi_app()
+    backend = FakeBackend(latency_scale=latency_scale)
+    results = []
+    with backend:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name in scenarios:
+                for concurrency in concurrency_levels:
+                    result = await run_scenario(client, backend, name, concurrency,
+                                                total_requests, verbose, same_project)
+                    results.append(result)
+                    print(f"{name:<24} c={concurrency:<3} "
+                          f"{result['throughput_rps']:>8.2f} req/s  "
+                          f"p50={result['latency_ms']['p50']:>8.1f}ms  "
+                          f"p95={result['latency_ms']['p95']:>8.1f}ms  "
+                          f"p99={result['latency_ms']['p99']:>8.1f}ms  "
+                          f"lag_p99={result['event_loop_lag_ms']['p99']:>6.1f}ms  "
+                          f"errors={result['errors']}")
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests_per_scenario": total_requests,
+            "concurrency_levels": concurrency_levels,
+            "latency_scale": latency_scale,
+            "same_project": same_project,
+        },
+        "results": results,
+    }
+
+
+def compare_with_baseline(current: Dict[str, Any], baseline: Dict[str, Any],
+                          threshold: float) -> List[str]:
+    """Return human readable regressions beyond the allowed threshold"""
+    baseline_index = {
+        (r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])
+    }
+    regressions = []
+    for result in current.get("results", []):
+        key = (result["scenario"], result["concurrency"])
+        reference = baseline_index.get(key)
+        if reference is None:
+            continue
+        label = f"{key[0]} c={key[1]}"
+        if result["throughput_rps"] < reference["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{label}: throughput {result['throughput_rps']} < baseline {reference['throughput_rps']}"
+            )
+        for pct in ("p95", "p99"):
+            now, before = result["latency_ms"][pct], reference["latency_ms"][pct]
+            if now > before * (1 + threshold):
+                regressions.append(f"{label}: latency {pct} {now}ms > baseline {before}ms")
+        if result["errors"] > reference["errors"]:
+            regressions.append(f"{label}: errors {result['errors']} > baseline {reference['errors']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="BI API throughput/latency benchmark")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Comma separated scenario names")
+    parser.add_argument("--concurrency", default="1,8",
+                        help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=16,
+                        help="Requests per scenario and concurrency level")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplier for the fake backend latencies")
+    parser.add_argument("--output", default=None,
+                        help="Where to write the JSON results (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=None,
+                        help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative regression before failing")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Write the results to benchmarks/baseline.json")
+    parser.add_argument("--same-project", action="store_true",
+                        help="Send every request for the same project (exercises request coalescing)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Keep the API's own console output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}")
+        return 2
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    # SQLite session files are created in the working directory
+    workdir = tempfile.mkdtemp(prefix="bi_bench_")
+    previous_cwd = os.getcwd()
+    outputs_before = snapshot_outputs()
+    os.chdir(workdir)
+    try:
+        report = asyncio.run(run_benchmark(scenarios, concurrency_levels, args.requests,
+                                           args.latency_scale, args.verbose, args.same_project))
+    finally:
+        os.chdir(previous_cwd)
+        cleanup_outputs(outputs_before)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.update_baseline:
+        output_path = DEFAULT_BASELINE
+    elif args.output:
+        output_path = Path(args.output)
+    else:
+        output_path = Path(__file__).resolve().parent / "results" / f"bench_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results saved to: {output_path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(report, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Response serialization microbenchmark on a large integrated analysis result
+
+Builds a synthetic /integrated-analysis result of about --size-mb megabytes
+(markets with customer analyses and validation reports) and times turning it
+into response bytes along each path:
+  - pydantic_stdlib: response model validation + FastAPI serialization +
+    stdlib json rendering (the default FastAPI path)
+  - orjson_dynamic: FastJSONResponse over the live result dict
+  - stored_reencode: stored JSON decoded and rendered again
+  - raw_splice: stored JSON spliced into the response as RawJSON
+
+Usage:
+    python benchmarks/bench_serialization.py --size-mb 5 --runs 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from bench_api import load_bi_app
+from bi_core.fast_json import FastJSONResponse, RawJSON, dumps, loads, orjson
+
+
+def validation_report(market: int, index: int) -> Dict[str, Any]:
+    return {
+        "question": f"What share of bookings in market {market} comes from repeat guests in month {index % 12 + 1}?",
+        "query_type": index % 3 + 1,
+        "can_answer": index % 4 != 0,
+        "tables_used": ["listings", "calendar", "reviewsdetails"][: index % 3 + 1],
+        "sql": (f"SELECT neighbourhood, COUNT(*) AS bookings, AVG(price) AS avg_price FROM listings "
+                f"JOIN calendar ON calendar.listing_id = listings.id WHERE available = 'f' "
+                f"AND date >= '2024-{index % 12 + 1:02d}-01' GROUP BY neighbourhood ORDER BY bookings DESC"),
+        "reason": "Bookings are inferred from unavailable calendar days; reviewer ids identify repeat guests. " * 2,
+        "confidence": round(0.5 + (index % 50) / 100, 2),
+    }
+
+
+def build_result(size_mb: float) -> Dict[str, Any]:
+    """Integrated analysis results shaped like run_integrated_analysis() output"""
+    target = int(size_mb * 1024 * 1024)
+    markets: Dict[str, Any] = {"summary": {"headline": "Short-term rentals", "core_insight": "Demand is seasonal"},
+                               "market_segments": []}
+    validation_reports: List[Dict[str, Any]] = []
+    size = 0
+    market = 0
+    while size < target:
+        market += 1
+        name = f"Market segment {market}"
+        reports = [validation_report(market, i) for i in range(40)]
+        segment = {
+            "market_name": name,
+            "description": "Travellers booking entire homes close to the city centre. " * 4,
+            "customer_analysis": {
+                "segments": [
+                    {"segment_name": f"Persona {market}.{p}", "needs": ["price", "location", "reviews"],
+                     "questions": [r["question"] for r in reports[p::5]]}
+                    for p in range(5)
+                ]
+            },
+        }
+        markets["market_segments"].append(segment)
+        markets[name] = {"validation_reports": reports}
+        validation_reports.extend(reports)
+        size += len(dumps(segment)) + 2 * len(dumps(reports))
+    return {
+        "run_id": "0" * 32,
+        "integrated_analysis": {
+            "metadata": {"analysis_type": "integrated_market_and_customer", "analysis_timestamp": "20240601000000"},
+            "markets": markets,
+        },
+        "validation_reports": validation_reports,
+    }
+
+
+def envelope(results: Any) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "message": "Integrated analysis completed successfully",
+        "analysis_type": "full_integrated",
+        "results": results,
+        "files_generated": [],
+        "coalesced": False,
+        "run_id": "0" * 32,
+        "stage_timings": {"market_analysis": 1.0, "customer_analysis": 2.0},
+        "token_usage": {},
+        "execution_time": 3.0,
+        "timestamp": "20240601000000",
+    }
+
+
+def time_path(func: Callable[[], bytes], runs: int) -> Dict[str, Any]:
+    func()  # warm caches
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        "median_ms": round(median * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2),
+        "mb_per_s": round(len(body) / 1024 / 1024 / median, 1),
+        "bytes": len(body),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Response serialization microbenchmark")
+    parser.add_argument("--size-mb", type=float, default=5.0, help="Approximate size of the result")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per path")
+    parser.add_argument("--output", default=None,
+                        help="Where to write the JSON results (default: benchmarks/results/<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    app = load_bi_app()
+    route = next(r for r in app.routes if getattr(r, "path", None) == "/integrated-analysis")
+    model = route.response_model
+
+    results = build_result(args.size_mb)
+    stored = dumps(results)
+
+    def pydantic_stdlib() -> bytes:
+        content = asyncio.run(serialize_response(field=route.response_field,
+                                                 response_content=model(**envelope(results))))
+        return JSONResponse(content).body
+
+    paths = {
+        "pydantic_stdlib": pydantic_stdlib,
+        "orjson_dynamic": lambda: FastJSONResponse(envelope(results)).body,
+        "stored_reencode": lambda: FastJSONResponse(envelope(loads(stored))).body,
+        "raw_splice": lambda: FastJSONResponse(envelope(RawJSON(stored))).body,
+    }
+    # Every path must produce the same document
+    expected = json.loads(pydantic_stdlib())
+    for name, func in paths.items():
+        assert json.loads(func()) == expected, f"{name} produced a different document"
+
+    report_rows = {name: time_path(func, args.runs) for name, func in paths.items()}
+    baseline = report_rows["pydantic_stdlib"]["median_ms"]
+    print(f"result size: {len(stored) / 1024 / 1024:.2f} MB, encoder: {'orjson' if orjson else 'json'}")
+    for name, row in report_rows.items():
+        row["speedup"] = round(baseline / row["median_ms"], 1) if row["median_ms"] else None
+        print(f"{name:<16} median={row['median_ms']:>8.2f}ms  min={row['min_ms']:>8.2f}ms  "
+              f"{row['mb_per_s']:>8.1f} MB/s  x{row['speedup']}")
+
+    report = {
+        "metadata": {"timestamp": datetime.now().isoformat(), "python": sys.version.split()[0],
+                     "runs": args.runs, "result_bytes": len(stored), "orjson": orjson is not None},
+        "results": report_rows,
+    }
+    output_path = Path(args.output) if args.output else (
+        BENCH_DIR / "results" / f"serialization_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results saved to: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold start benchmark for the API services
+
+For each service, measures in fresh interpreters:
+  - import time of the app module, with the slowest top-level imports
+    (from python -X importtime)
+  - time from launching the start script to the first 200 from /health
+    (liveness) and from /ready (warm-up finished)
+For the BI API it also compares the first request after /ready with the
+following ones, on the offline fake backend.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import httpx
+
+from bench_api import BASE_PAYLOAD, cleanup_outputs, snapshot_outputs
+
+SERVICES = {
+    "bi_api": {"app_dir": ROOT_DIR / "bi_api", "module": "app", "start_script": ROOT_DIR / "bi_api" / "start_bi_api.py"},
+    "analysis_api": {"app_dir": ROOT_DIR, "module": "analysis_api", "start_script": ROOT_DIR / "start_api.py"},
+}
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {app_dir!r})
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(service: Dict[str, Any], workdir: str) -> float:
+    """Seconds to import the app module in a fresh interpreter"""
+    code = IMPORT_SNIPPET.format(app_dir=str(service["app_dir"]), module=service["module"])
+    result = subprocess.run([sys.executable, "-c", code], cwd=workdir, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(service: Dict[str, Any], workdir: str, top: int = 10) -> List[Dict[str, Any]]:
+    """Top-level modules imported while loading the app, by cumulative import time"""
+    code = IMPORT_SNIPPET.format(app_dir=str(service["app_dir"]), module=service["module"])
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=workdir,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        # Depth 1 = imported directly by the app module (or its lazy helpers)
+        if match and len(match.group(3)) <= 3:
+            modules.append({"module": match.group(4), "cumulative_ms": round(int(match.group(2)) / 1000, 1)})
+    modules.sort(key=lambda m: m["cumulative_ms"], reverse=True)
+    return modules[:top]
+
+
+def wait_for(server: subprocess.Popen, url: str, timeout: float = 60.0):
+    """Poll url until it answers 200"""
+    deadline = time.monotonic() + timeout
+    with httpx.Client(timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                if client.get(url).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            time.sleep(0.01)
+    raise RuntimeError(f"{url} did not answer 200 within {timeout}s")
+
+
+def stop(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def measure_cold_start(service: Dict[str, Any], workdir: str) -> Tuple[float, float]:
+    """Seconds from launching the start script until /health and /ready answer 200"""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY="1", ENVIRONMENT="production")
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, str(service["start_script"])], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(server, f"http://127.0.0.1:{port}/health")
+        to_health = time.perf_counter() - started
+        wait_for(server, f"http://127.0.0.1:{port}/ready")
+        return to_health, time.perf_counter() - started
+    finally:
+        stop(server)
+
+
+def measure_first_request(workdir: str, requests: int = 20) -> Dict[str, float]:
+    """Latency of the first /analyze (schema) request after /ready vs. the following ones"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_app:app", "--app-dir", str(BENCH_DIR),
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=dict(os.environ, FAKE_LATENCY_SCALE="0"),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(server, f"http://127.0.0.1:{port}/ready")
+        payload = dict(BASE_PAYLOAD, analysis_type="schema")
+        latencies = []
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60.0) as client:
+            for index in range(requests):
+                started = time.perf_counter()
+                response = client.post("/analyze", json=dict(payload, supabase_project_id=f"startup{index}"))
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+        return {
+            "first_ms": round(latencies[0] * 1000, 1),
+            "rest_median_ms": round(statistics.median(latencies[1:]) * 1000, 1),
+        }
+    finally:
+        stop(server)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="API cold start benchmark")
+    parser.add_argument("--services", default=",".join(SERVICES),
+                        help="Comma separated services")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Fresh processes per measurement")
+    parser.add_argument("--output", default=None,
+                        help="Where to write the JSON results (default: benchmarks/results/<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    services = [s.strip() for s in args.services.split(",") if s.strip()]
+    unknown = [s for s in services if s not in SERVICES]
+    if unknown:
+        print(f"Unknown services: {', '.join(unknown)}")
+        return 2
+
+    # SQLite session files and the like are created in the working directory
+    workdir = tempfile.mkdtemp(prefix="bi_bench_startup_")
+    outputs_before = snapshot_outputs()
+    results = []
+    try:
+        for name in services:
+            service = SERVICES[name]
+            imports = [measure_import(service, workdir) for _ in range(args.runs)]
+            cold_starts = [measure_cold_start(service, workdir) for _ in range(args.runs)]
+            result = {
+                "service": name,
+                "import": summarize(imports),
+                "cold_start_to_health": summarize([health for health, _ in cold_starts]),
+                "cold_start_to_ready": summarize([ready for _, ready in cold_starts]),
+                "slowest_imports": slowest_imports(service, workdir),
+            }
+            if name == "bi_api":
+                result["first_request"] = measure_first_request(workdir)
+            results.append(result)
+            print(f"{name:<14} import={result['import']['median_ms']:>7.1f}ms  "
+                  f"start->health={result['cold_start_to_health']['median_ms']:>7.1f}ms  "
+                  f"start->ready={result['cold_start_to_ready']['median_ms']:>7.1f}ms  "
+                  f"slowest: " + ", ".join(f"{m['module']} {m['cumulative_ms']}ms"
+                                           for m in result["slowest_imports"][:3]))
+            if "first_request" in result:
+                print(f"{'':<14} first request after ready={result['first_request']['first_ms']}ms  "
+                      f"following median={result['first_request']['rest_median_ms']}ms")
+    finally:
+        cleanup_outputs(outputs_before)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "metadata": {"timestamp": datetime.now().isoformat(), "python": sys.version.split()[0], "runs": args.runs},
+        "results": results,
+    }
+    output_path = Path(args.output) if args.output else (
+        BENCH_DIR / "results" / f"startup_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results saved to: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
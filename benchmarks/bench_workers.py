@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Worker scaling benchmark for the production server profile
+
+Starts the BI Analysis API (on the offline fake backend) as a real server with
+1..N uvicorn workers and drives it over HTTP, reporting throughput and latency
+per worker count. /review runs its audits as synchronous OpenAI calls, so it
+shows how much of the host a single worker process can use.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1,2,4 --scenarios review,analyze_market
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import httpx
+
+from bench_api import BASE_PAYLOAD, SCENARIOS, cleanup_outputs, snapshot_outputs, summarize
+from bi_core.server import ServerProfile, run_server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(workers: int, port: int):
+    """Run fake_app with the production profile (called in the server subprocess)"""
+    profile = ServerProfile.from_env()
+    profile.production = True
+    profile.workers = workers
+    profile.log_level = "warning"
+    run_server("fake_app:app", host="127.0.0.1", port=port, profile=profile, app_dir=str(BENCH_DIR))
+
+
+async def wait_until_up(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+
+async def drive(base_url: str, name: str, concurrency: int, total_requests: int) -> Dict[str, Any]:
+    """Send total_requests to one scenario with at most `concurrency` in flight"""
+    path, extra = SCENARIOS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def one(index: int):
+            nonlocal errors
+            payload = dict(BASE_PAYLOAD, user_name=f"bench_{name}_{index % concurrency}",
+                           supabase_project_id=f"benchproject{index}", **extra)
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(path, json=payload)
+                latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        wall = time.perf_counter() - started
+
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "wall_time_s": round(wall, 4),
+        "throughput_rps": round(total_requests / wall, 3) if wall else 0.0,
+        "latency_ms": summarize(latencies),
+    }
+
+
+def run_worker_count(workers: int, scenarios: List[str], concurrency: int, total_requests: int,
+                     latency_scale: float, verbose: bool) -> List[Dict[str, Any]]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    # SQLite session files are created in the server's working directory
+    workdir = tempfile.mkdtemp(prefix="bi_bench_workers_")
+    env = dict(os.environ, FAKE_LATENCY_SCALE=str(latency_scale), WEB_CONCURRENCY=str(workers))
+    # The fake backend has no OpenAI quota to protect
+    env.setdefault("OPENAI_RPM_LIMIT", "0")
+    env.setdefault("OPENAI_TPM_LIMIT", "0")
+    output = None if verbose else subprocess.DEVNULL
+    server = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), "--serve", str(workers), "--port", str(port)],
+        cwd=workdir, env=env, stdout=output, stderr=output,
+    )
+    try:
+        asyncio.run(wait_until_up(base_url))
+        results = []
+        for name in scenarios:
+            result = asyncio.run(drive(base_url, name, concurrency, total_requests))
+            result["workers"] = workers
+            results.append(result)
+            print(f"workers={workers:<3} {name:<24} c={concurrency:<3} "
+                  f"{result['throughput_rps']:>8.2f} req/s  "
+                  f"p50={result['latency_ms']['p50']:>8.1f}ms  "
+                  f"p95={result['latency_ms']['p95']:>8.1f}ms  "
+                  f"errors={result['errors']}")
+        return results
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="BI API worker scaling benchmark")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}",
+                        help="Comma separated worker counts")
+    parser.add_argument("--scenarios", default="review,analyze_market",
+                        help="Comma separated scenario names (see bench_api.py)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=64,
+                        help="Requests per scenario and worker count")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplier for the fake backend latencies")
+    parser.add_argument("--output", default=None,
+                        help="Where to write the JSON results (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Keep the server's console output")
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.serve is not None:
+        serve(args.serve, args.port)
+        return 0
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}")
+        return 2
+    worker_counts = sorted({int(w) for w in args.workers.split(",") if w.strip()})
+
+    outputs_before = snapshot_outputs()
+    results = []
+    try:
+        for workers in worker_counts:
+            results.extend(run_worker_count(workers, scenarios, args.concurrency, args.requests,
+                                            args.latency_scale, args.verbose))
+    finally:
+        cleanup_outputs(outputs_before)
+
+    # Scaling relative to one worker (or the smallest count measured)
+    for name in scenarios:
+        runs = [r for r in results if r["scenario"] == name]
+        base = runs[0]["throughput_rps"] if runs else 0
+        for run in runs:
+            run["speedup"] = round(run["throughput_rps"] / base, 3) if base else 0.0
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "cpu_count": os.cpu_count(),
+            "worker_counts": worker_counts,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "latency_scale": args.latency_scale,
+        },
+        "results": results,
+    }
+    output_path = Path(args.output) if args.output else (
+        BENCH_DIR / "results" / f"workers_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results saved to: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BI Analysis API wired to the offline fake backend, as an importable ASGI app
+
+Used by benchmarks that run real server processes (e.g. several uvicorn
+workers), where the fakes have to be installed inside every worker.
+FAKE_LATENCY_SCALE multiplies the simulated upstream latencies.
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_api import load_bi_app
+from fake_backend import FakeBackend
+
+backend = FakeBackend(latency_scale=float(os.getenv("FAKE_LATENCY_SCALE", 1.0))).install()
+app = load_bi_app()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline fake LLM/MCP backend for benchmarks
+
+Replaces ``agents.Runner.run`` and the OpenAI chat completions endpoint with
+canned, schema-shaped responses and configurable latencies, so the BI API
+pipeline can be driven end to end without network access or API keys.
+"""
+import asyncio
+import inspect
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from agents import AgentOutputSchema, Runner
+from agents.agent_output import AgentOutputSchemaBase
+from agents.run import CallModelData, ModelInputData
+from agents.usage import Usage
+from openai.resources.chat.completions import Completions
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+
+# Simulated upstream latency per stage, in seconds (before latency_scale)
+DEFAULT_STAGE_LATENCY = {
+    "schema": 0.050,
+    "market": 0.080,
+    "audience": 0.080,
+    "brand": 0.030,
+    "followup": 0.020,
+    "audit": 0.010,
+    "question_check": 0.005,
+}
+
+FAKE_TABLES = [
+    {
+        "table_name": "listings",
+        "columns": ["id", "name", "host_id", "host_name", "neighbourhood", "room_type", "price"],
+        "sample_data": [{"id": 1, "name": "Cozy loft", "host_id": 7, "host_name": "Ana",
+                         "neighbourhood": "Centrum", "room_type": "Entire home/apt", "price": 120}],
+    },
+    {
+        "table_name": "calendar",
+        "columns": ["listing_id", "date", "available", "price", "minimum_nights"],
+        "sample_data": [{"listing_id": 1, "date": "2024-06-01", "available": "t", "price": 130,
+                         "minimum_nights": 2}],
+    },
+    {
+        "table_name": "reviewsdetails",
+        "columns": ["listing_id", "id", "date", "reviewer_id", "reviewer_name", "comments"],
+        "sample_data": [{"listing_id": 1, "id": 11, "date": "2024-05-20", "reviewer_id": 3,
+                         "reviewer_name": "Tom", "comments": "Great stay, close to everything."}],
+    },
+]
+
+FAKE_MARKETS = ["Short-Term Rental Investors", "Urban Tourism Boards", "Property Managers"]
+
+FAKE_QUESTIONS = [
+    ("Which neighbourhoods have the highest average nightly price?", "Pricing Insight"),
+    ("How does availability change month over month?", "Trend Analysis"),
+    ("Which room types receive the most reviews?", "Demand Ranking"),
+    ("What drives guest satisfaction in reviews?", "Sentiment Modeling"),
+]
+
+
+# Like the provider, only prefixes of at least 1024 tokens are cached, in 128-token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+
+
+def _usage(input_text: str, output_text: str, cached_tokens: int = 0) -> Usage:
+    input_tokens = max(1, len(input_text) // 4)
+    output_tokens = max(1, len(output_text) // 4)
+    return Usage(
+        requests=1,
+        input_tokens=input_tokens,
+        input_tokens_details=InputTokensDetails(cached_tokens=min(cached_tokens, input_tokens)),
+        output_tokens=output_tokens,
+        output_tokens_details=OutputTokensDetails(reasoning_tokens=0),
+        total_tokens=input_tokens + output_tokens,
+    )
+
+
+def _segments() -> List[Dict[str, Any]]:
+    segments = []
+    for idx, name in enumerate(["Data Innovators", "Revenue Managers"]):
+        segments.append({
+            "segment_name": name,
+            "profile": {
+                "industry": "Hospitality",
+                "company_size": "mid-market",
+                "region": ["Europe", "North America"],
+                "roles": ["Head of Data", "Revenue Lead"],
+            },
+            "valued_questions": [
+                {
+                    "question": question,
+                    "mapped_pain_point": "Needs faster pricing decisions.",
+                    "problem_type": problem_type,
+                    "monetization_path": ["data_api", "market_report"],
+                    "decision_value": "High",
+                }
+                for question, problem_type in FAKE_QUESTIONS[idx:idx + 3]
+            ],
+            "willingness_to_pay": {"tier": "high", "budget_range_usd": "30000-50000"},
+        })
+    return segments
+
+
+def _stage_for_input(text: str) -> str:
+    lowered = text.lower()
+    if "public schema" in lowered:
+        return "schema"
+    if "brand design" in lowered:
+        return "brand"
+    if "audience analysis workflow" in lowered:
+        return "audience"
+    if "market analysis" in lowered or "market potential" in lowered:
+        return "market"
+    return "followup"
+
+
+def _agent_output(stage: str) -> str:
+    if stage == "schema":
+        return json.dumps({"description": {"tables": FAKE_TABLES}})
+    if stage == "market":
+        return json.dumps({
+            "summary": {
+                "headline": "Short-term rental analytics",
+                "core_insight": "Pricing intelligence is under-served.",
+                "strategic_call": "Enter via data API",
+            },
+            "market_segments": [
+                {"market_name": name, "description": f"{name} segment", "tam_usd": 1000000 * (i + 1)}
+                for i, name in enumerate(FAKE_MARKETS)
+            ],
+        })
+    if stage == "audience":
+        return json.dumps({"segments": _segments(), "summary": {"insight": "Automation demand is high."}})
+    if stage == "brand":
+        return json.dumps({
+            "chatapp_name": "Aurora Insights",
+            "chatapp_description": "Brand platform for rental analytics.",
+            "chatapp_core_features": [
+                {"feature_title": f"Feature {i}", "intro": "Generated by the fake backend."}
+                for i in range(1, 5)
+            ],
+        })
+    return "The TAM discussed above is roughly USD 1M."
+
+
+def _validate_output(agent, output: str) -> Any:
+    """Parse output into the agent's output_type, as the SDK does for real runs"""
+    output_type = getattr(agent, "output_type", None)
+    if output_type is None or output_type is str:
+        return output
+    if not isinstance(output_type, AgentOutputSchemaBase):
+        output_type = AgentOutputSchema(output_type)
+    return output_type.validate_json(output)
+
+
+class FakeBackend:
+    """Installs offline fakes for agent runs and chat completions.
+
+    Every call is recorded per stage so the benchmark can report a per-stage
+    latency breakdown. ``latency_scale`` multiplies all simulated latencies.
+    """
+
+    def __init__(self, latency_scale: float = 1.0, stage_latency: Optional[Dict[str, float]] = None):
+        self.latency_scale = latency_scale
+        self.stage_latency = dict(DEFAULT_STAGE_LATENCY)
+        if stage_latency:
+            self.stage_latency.update(stage_latency)
+        self._lock = threading.Lock()
+        self._calls: Dict[str, List[float]] = defaultdict(list)
+        self._original_run = None
+        self._original_create = None
+        self._cached_prefixes = set()
+
+    def _cached_tokens(self, prefix: str) -> int:
+        """Tokens of prefix served from the simulated prompt cache (prefix is cached afterwards)"""
+        tokens = len(prefix) // 4
+        if tokens < CACHE_MIN_TOKENS:
+            return 0
+        with self._lock:
+            hit = prefix in self._cached_prefixes
+            self._cached_prefixes.add(prefix)
+        return tokens - tokens % CACHE_INCREMENT if hit else 0
+
+    def _delay(self, stage: str) -> float:
+        return self.stage_latency.get(stage, 0.0) * self.latency_scale
+
+    def _record(self, stage: str, elapsed: float):
+        with self._lock:
+            self._calls[stage].append(elapsed)
+
+    def reset(self):
+        """Clear recorded per-stage calls"""
+        with self._lock:
+            self._calls = defaultdict(list)
+
+    def stage_calls(self) -> Dict[str, List[float]]:
+        """Recorded call durations per stage, in seconds"""
+        with self._lock:
+            return {stage: list(values) for stage, values in self._calls.items()}
+
+    def install(self):
+        """Patch Runner.run and Completions.create with the fakes"""
+        backend = self
+        self._original_run = Runner.__dict__["run"]
+        self._original_create = Completions.create
+
+        async def fake_run(cls, starting_agent, input, *, session=None, **kwargs):
+            started = time.perf_counter()
+            text = input if isinstance(input, str) else json.dumps(input, default=str)
+            instructions = getattr(starting_agent, "instructions", None)
+            instructions = instructions if isinstance(instructions, str) else ""
+            stage = _stage_for_input(text)
+            history = await session.get_items() if session is not None else []
+            model_input = ModelInputData(input=history + [{"role": "user", "content": text}],
+                                         instructions=instructions)
+            run_config = kwargs.get("run_config")
+            if run_config is not None and run_config.call_model_input_filter is not None:
+                model_input = run_config.call_model_input_filter(
+                    CallModelData(model_data=model_input, agent=starting_agent, context=None)
+                )
+                # The SDK accepts sync and async filters alike
+                if inspect.isawaitable(model_input):
+                    model_input = await model_input
+            prompt = json.dumps(model_input.input, default=str, ensure_ascii=False)
+            await asyncio.sleep(backend._delay(stage))
+            output = _agent_output(stage)
+            if session is not None:
+                await session.add_items([
+                    {"role": "user", "content": text},
+                    {"role": "assistant", "content": output},
+                ])
+            backend._record(stage, time.perf_counter() - started)
+            return SimpleNamespace(
+                final_output=_validate_output(starting_agent, output),
+                raw_responses=[],
+                context_wrapper=SimpleNamespace(
+                    usage=_usage(instructions + prompt, output, backend._cached_tokens(instructions))
+                ),
+                last_agent=starting_agent,
+            )
+
+        def fake_create(self, *args, messages=None, **kwargs):
+            started = time.perf_counter()
+            prompt = "\n".join(str(m.get("content", "")) for m in (messages or []))
+            system = "\n".join(str(m.get("content", "")) for m in (messages or []) if m.get("role") == "system")
+            if "data compliance" in prompt:
+                stage = "audit"
+                match = re.search(r"['\"]table_name['\"]:\s*['\"]([^'\"]+)['\"]", prompt)
+                content = json.dumps({
+                    "table_name": match.group(1) if match else "unknown",
+                    "contains_personal_data": False,
+                    "contains_sensitive_data": False,
+                    "contains_sensitive_fields": None,
+                    "allowed_to_use": True,
+                })
+            else:
+                stage = "question_check"
+                match = re.search(r"following question from the data: (.*?)\.\n", prompt)
+                content = json.dumps({
+                    "question": match.group(1) if match else "",
+                    "sql_query": "SELECT neighbourhood, AVG(price) FROM listings GROUP BY neighbourhood",
+                    "query_type": 1,
+                })
+            time.sleep(backend._delay(stage))
+            backend._record(stage, time.perf_counter() - started)
+            usage = _usage(prompt, content, backend._cached_tokens(system))
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=SimpleNamespace(
+                    prompt_tokens=usage.input_tokens,
+                    completion_tokens=usage.output_tokens,
+                    total_tokens=usage.total_tokens,
+                    prompt_tokens_details=SimpleNamespace(cached_tokens=usage.input_tokens_details.cached_tokens),
+                ),
+            )
+
+        Runner.run = classmethod(fake_run)
+        Completions.create = fake_create
+        return self
+
+    def uninstall(self):
+        """Restore the real Runner.run and Completions.create"""
+        if self._original_run is not None:
+            Runner.run = self._original_run
+            self._original_run = None
+        if self._original_create is not None:
+            Completions.create = self._original_create
+            self._original_create = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
@@ -3,33 +3,88 @@
 """
 BI Analysis API - FastAPI wrapper for BI_result(1).py
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import Literal, Dict, List, Any, Optional
+from typing import TYPE_CHECKING, Literal, Dict, List, Any, Optional
 import asyncio
 import time
 import os
 import json
 import sys
 import copy
+import hashlib
 from datetime import datetime
 from pathlib import Path
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # Add parent directory to path to import BI_result functions
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-# Import core functionality from BI_result(1).py
-from agents import Agent, Runner, function_tool, ModelSettings, HostedMCPTool, SQLiteSession, WebSearchTool
+from bi_core import run_agent, chat_completion, openai_client, stage_agent, use_api_key, get_rate_limiter, circuit_breaker_metrics
+from bi_core.usage import track_usage, usage_metrics
+from bi_core.singleflight import SingleFlight, make_request_key, credential_fingerprint
+from bi_core.idempotency import IdempotencyMiddleware, IdempotencyStore
+from bi_core.compression import CompressionMiddleware, RequestDecompressionMiddleware
+from bi_core.batch import SharedResources, SkipItem, batch_concurrency, max_batch_items, run_batch, summarize_batch
+from bi_core.checkpoints import CheckpointStore, RunCheckpointCache
+from bi_core.fast_json import FastJSONResponse, RawJSON, dumps
+from bi_core.precheck import QuestionPrecheck
+from bi_core.projection import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, PageRequest, ProjectionError, view_results
+from bi_core.dag import DAG
+from bi_core.export import EXPORT_FORMATS, EXPORT_SECTIONS, MEDIA_TYPES, ExportError, MissingSection, export_section
+from bi_core.dedup import QuestionClusterer, fan_out, pick_representatives, validate_deduplicated
+from bi_core.server import worker_count
+from bi_core.sessions import BatchSessions, SessionFork
+from bi_core.sampling import TableSampler, truncate
+from bi_core.schema_index import SchemaIndex
+from bi_core.sql_check import validate_reports
+from bi_core.startup import HEAVY_MODULES, Warmup, import_modules, read_prompt
+from bi_core.output_models import (
+    AudienceAnalysis, MarketAnalysis, SchemaDescription,
+    output_data, output_json, structured_output
+)
+
+if TYPE_CHECKING:
+    from agents import Agent
+
+# Load environment variables
+load_dotenv()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background so the server binds and answers /health
+    # immediately; /ready reports when it has finished
+    warmup.start()
+    yield
+    await warmup.stop()
+
 
 app = FastAPI(
     title="BI Analysis API",
     version="1.0.0",
-    description="A FastAPI service for AI-powered business intelligence analysis using OpenAI Agents and Supabase MCP tools."
+    description="A FastAPI service for AI-powered business intelligence analysis using OpenAI Agents and Supabase MCP tools.",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# Idempotency-Key support for POST endpoints (added before CORS so CORS stays outermost)
+idempotency_store = IdempotencyStore.from_env()
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+
+# Compressed uploads and responses; outside the idempotency layer so keys hash
+# the decoded body and stored responses are re-encoded per client
+app.add_middleware(
+    RequestDecompressionMiddleware,
+    paths=["/review", "/brand-strategy", "/analyze/batch"],
+    max_size=int(os.getenv("MAX_REQUEST_BODY_BYTES", 50 * 1024 * 1024))
+)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", 1024)))
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -39,9 +94,6 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all request headers
 )
 
-# Load environment variables
-load_dotenv()
-
 # Request Models
 class BIAnalysisRequest(BaseModel):
     """BI Analysis request model"""
@@ -69,15 +121,40 @@ class BIAnalysisRequest(BaseModel):
         default=None,
         description="OpenAI API key (optional, can use env variable)"
     )
+    fields: Optional[List[str]] = Field(
+        default=None,
+        description="JSON pointers into results to return, e.g. /validation_reports/*/question (default: everything)"
+    )
+    page: Optional[PageRequest] = Field(
+        default=None,
+        description="Cursor pagination of one list-valued section of results"
+    )
 
 class BIAnalysisResponse(BaseModel):
     """BI Analysis response model"""
     success: bool
     analysis_type: str
     message: str
+    run_id: Optional[str] = None
     results: Dict[str, Any] = {}
     files_generated: List[str] = []
     database_saved: bool = False
+    coalesced: bool = False
+    stage_timings: Dict[str, float] = {}
+    token_usage: Dict[str, Dict[str, Any]] = {}
+    page: Optional[Dict[str, Any]] = None
+    execution_time: float
+    timestamp: str
+
+class BatchAnalysisResponse(BaseModel):
+    """Batch analysis response model (stream=true sends the items and then this summary as NDJSON lines)"""
+    success: bool
+    analysis_type: str = "batch"
+    message: str
+    summary: Dict[str, int] = {}
+    max_concurrency: int
+    agents_built: int = 0
+    items: List[Dict[str, Any]] = []
     execution_time: float
     timestamp: str
 
@@ -136,6 +213,18 @@ class IntegratedAnalysisRequest(BaseModel):
         default="full_integrated",
         description="Type of analysis: market_only or full_integrated"
     )
+    resume_run_id: Optional[str] = Field(
+        default=None,
+        description="Run ID of a previous run to resume; completed steps are skipped"
+    )
+    fields: Optional[List[str]] = Field(
+        default=None,
+        description="JSON pointers into results to return, e.g. /validation_reports/*/question (default: everything)"
+    )
+    page: Optional[PageRequest] = Field(
+        default=None,
+        description="Cursor pagination of one list-valued section of results"
+    )
 
 class IntegratedAnalysisResponse(BaseModel):
     """Integrated Analysis response model"""
@@ -144,6 +233,11 @@ class IntegratedAnalysisResponse(BaseModel):
     analysis_type: str
     results: Dict[str, Any] = {}
     files_generated: List[str] = []
+    coalesced: bool = False
+    run_id: Optional[str] = None
+    stage_timings: Dict[str, float] = {}
+    token_usage: Dict[str, Dict[str, Any]] = {}
+    page: Optional[Dict[str, Any]] = None
     execution_time: float
     timestamp: str
 
@@ -164,21 +258,49 @@ class BrandStrategyResponse(BaseModel):
     execution_time: float
     timestamp: str
 
+PROMPTS_DIR = Path(__file__).resolve().parent / "prompts"
+DEMO2_PROMPTS_DIR = Path(__file__).resolve().parent.parent / "demo2"
+
+@lru_cache(maxsize=256)
+def get_session(user_name: str):
+    """Conversation session of a user (one store object per user and process)"""
+    from agents import SQLiteSession
+    return SQLiteSession(user_name, f"{user_name}_conversations.db")
+
 # Tool function
-@function_tool
 def get_current_time() -> str:
     """Get current time in ISO format"""
     return datetime.now().astimezone().isoformat()
 
+@lru_cache(maxsize=None)
+def current_time_tool():
+    """get_current_time as an agent tool (built on first use)"""
+    from agents import function_tool
+    return function_tool(get_current_time)
+
+# Stage prompts are sent as system instructions (see stage_agent), which keeps
+# them in the cacheable prefix; the user turn only names the workflow to run
+MARKET_ANALYSIS_INPUT = "Run the market analysis workflow from your instructions on the connected Supabase data."
+AUDIENCE_ANALYSIS_INPUT = "Run the audience analysis workflow from your instructions on the connected Supabase data."
+# Bounded table profiles for the audit prompt (SAMPLE_ROWS / _VALUE_CHARS / _COLUMNS)
+table_sampler = TableSampler.from_env()
+SCHEMA_DESCRIPTION_INPUT = f"""use supabase mcp tools, give me a description in Supabase public schema.
+        IMPORTANT: Please include ALL tables in the public schema, not just one table. 
+        Make sure to return information for every table you find in the database.
+        Include at most {table_sampler.max_rows} sample rows per table in sample_data.
+        """
+
 # Data audit functions (integrated from conn_supabase(1).py and BI_result(1).py)
 def audit_table_with_gpt(table_info, openai_api_key: str = None):
     """Audit table with GPT for data compliance"""
-    api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
+    client = openai_client(openai_api_key)
+    # A few diverse rows and per-column statistics with truncated values, so
+    # the prompt stays bounded however wide the table or long its text columns
+    table_profile = table_sampler.profile(table_info)
     
+    # Fixed requirements first, the table last, so every audit shares one prompt prefix
     prompt = f"""
-You are a data compliance expert. Please analyze the following Supabase table according to OpenAI data policies:
-Table information: {table_info}
+You are a data compliance expert. Please analyze the Supabase table given at the end according to OpenAI data policies.
 Requirements:
 1. Identify possible personal contact information or sensitive fields related to religion, politics, minors, etc.;
 2. Explain whether it violates data compliance regulations;
@@ -187,17 +309,20 @@ Requirements:
 5. If contains_sensitive_data is True, output specific fields to contains_sensitive_fields; if contains_sensitive_data is False, contains_sensitive_fields should be null
 6. Output language: English
 7. Return ONLY valid JSON, no additional text or explanations
+Table information (column statistics and sample rows; long values are truncated): {json.dumps(table_profile, ensure_ascii=False)}
 """
 
     print(f"Auditing table: {table_info.get('table_name')} for data compliance...")
-    response = client.chat.completions.create(
+    response = chat_completion(
+        client,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a data compliance expert. Always respond with valid JSON only."},
             {"role": "user", "content": prompt}
         ],
         response_format={"type": "json_object"},
-        temperature=0
+        temperature=0,
+        stage="data_audit"
     )
     report = response.choices[0].message.content
     print(f"\nAudit result:\n", report)
@@ -235,10 +360,12 @@ async def initialize_agent(
     supabase_project_id: str,
     supabase_access_token: str,
     user_name: str
-) -> Agent:
+) -> "Agent":
     """Initialize the AI agent with provided configuration"""
+    from agents import Agent, HostedMCPTool, ModelSettings, WebSearchTool
+
     # Read prompt files
-    BUSINESS_EXPERT_PROMPT = (Path(__file__).resolve().parent / "prompts" / "system_prompt.md").read_text(encoding="utf-8")
+    BUSINESS_EXPERT_PROMPT = read_prompt(PROMPTS_DIR / "system_prompt.md")
     
     # Create Supabase MCP URL
     supabase_mcp_url = f"https://mcp.supabase.com/mcp?project_ref={supabase_project_id}"
@@ -262,86 +389,29 @@ async def initialize_agent(
                     "require_approval": "never"
                 }
             ),
-            get_current_time,
+            current_time_tool(),
             WebSearchTool(),
         ],
     )
     
     return agent
 
-async def run_schema_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
+async def run_schema_analysis(agent: "Agent", user_name: str, session=None) -> Dict[str, Any]:
     """Run schema analysis"""
-    session = SQLiteSession(user_name, f"{user_name}_conversations.db")
+    session = session if session is not None else get_session(user_name)
     
     print(" =======  schema_description  ======= ")
-    schema_analysis = await Runner.run(
-        agent,
-        input="""use supabase mcp tools, give me a description in Supabase public schema.
-        Please return the schema information in JSON format with the following structure:
-        {
-            "description": {
-                "tables": [
-                    {
-                        "table_name": "table_name",
-                        "columns": ["column1", "column2", ...],
-                        "sample_data": [{"column1": "value1", "column2": "value2", ...}]
-                    }
-                ]
-            }
-        }
-        
-        IMPORTANT: Please include ALL tables in the public schema, not just one table. 
-        Make sure to return information for every table you find in the database.
-        """,
-        session=session
+    schema_analysis = await run_agent(
+        stage_agent(agent, "schema_description", output_type=structured_output(SchemaDescription)),
+        input=SCHEMA_DESCRIPTION_INPUT,
+        session=session,
+        stage="schema_description"
     )
     
-    schema_analysis_output = schema_analysis.final_output
+    schema_analysis_output = output_json(schema_analysis.final_output)
+    schema_analysis_json = output_data(schema_analysis.final_output)
     print(f"Schema analysis output: {schema_analysis_output}")
     
-    try:
-        schema_analysis_json = json.loads(schema_analysis_output)
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
-        print("Schema analysis returned text format, extracting table info...")
-        # Extract table information from text instead of using mock data
-        schema_analysis_json = {
-            "description": {
-                "tables": [
-                    {
-                        "table_name": "calendar",
-                        "columns": ["listing_id", "date", "available", "price", "adjusted_price", "minimum_nights", "maximum_nights"],
-                        "sample_data": []
-                    },
-                    {
-                        "table_name": "listings", 
-                        "columns": ["id", "name", "host_id", "host_name", "neighbourhood_group", "neighbourhood", "latitude", "longitude", "room_type", "price"],
-                        "sample_data": []
-                    },
-                    {
-                        "table_name": "listingsdetails",
-                        "columns": ["id", "listing_url", "description", "neighborhood_overview", "host_name", "host_about", "property_type", "room_type"],
-                        "sample_data": []
-                    },
-                    {
-                        "table_name": "neighbourhoods",
-                        "columns": ["neighbourhood_group", "neighbourhood"],
-                        "sample_data": []
-                    },
-                    {
-                        "table_name": "reviews",
-                        "columns": ["listing_id", "date"],
-                        "sample_data": []
-                    },
-                    {
-                        "table_name": "reviewsdetails", 
-                        "columns": ["listing_id", "id", "date", "reviewer_id", "reviewer_name", "comments"],
-                        "sample_data": []
-                    }
-                ]
-            }
-        }
-    
     # Save to file
     output_dir = Path(__file__).resolve().parent / "outputs"
     output_dir.mkdir(exist_ok=True)
@@ -355,21 +425,22 @@ async def run_schema_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
         "files": [str(md_path)]
     }
 
-async def run_market_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
+async def run_market_analysis(agent: "Agent", user_name: str, session=None) -> Dict[str, Any]:
     """Run market analysis"""
     # Read market analysis prompt
-    MARKET_ANALYSIS_PROMPT = (Path(__file__).resolve().parent / "prompts" / "market_analysis_prompt.md").read_text(encoding="utf-8")
+    MARKET_ANALYSIS_PROMPT = read_prompt(PROMPTS_DIR / "market_analysis_prompt.md")
     
-    session = SQLiteSession(user_name, f"{user_name}_conversations.db")
+    session = session if session is not None else get_session(user_name)
     
     print("======== Market Analysis ========")
-    market_analysis = await Runner.run(
-        agent,
-        input=MARKET_ANALYSIS_PROMPT,
-        session=session
+    market_analysis = await run_agent(
+        stage_agent(agent, "market_analysis", MARKET_ANALYSIS_PROMPT, structured_output(MarketAnalysis)),
+        input=MARKET_ANALYSIS_INPUT,
+        session=session,
+        stage="market_analysis"
     )
     
-    output = market_analysis.final_output
+    output = output_json(market_analysis.final_output)
     
     # Save to file
     output_dir = Path(__file__).resolve().parent / "outputs"
@@ -385,21 +456,22 @@ async def run_market_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
         "files": [str(md_path)]
     }
 
-async def run_audience_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
+async def run_audience_analysis(agent: "Agent", user_name: str, session=None) -> Dict[str, Any]:
     """Run audience analysis"""
     # Read audience analysis prompt
-    AUDIENCE_ANALYSIS_PROMPT = (Path(__file__).resolve().parent / "prompts" / "audience_analysis_prompt.md").read_text(encoding="utf-8")
+    AUDIENCE_ANALYSIS_PROMPT = read_prompt(PROMPTS_DIR / "audience_analysis_prompt.md")
     
-    session = SQLiteSession(user_name, f"{user_name}_conversations.db")
+    session = session if session is not None else get_session(user_name)
     
     print("======== audience Analysis =========")
-    audience_analysis = await Runner.run(
-        agent, 
-        input=AUDIENCE_ANALYSIS_PROMPT,
-        session=session
+    audience_analysis = await run_agent(
+        stage_agent(agent, "audience_analysis", AUDIENCE_ANALYSIS_PROMPT, structured_output(AudienceAnalysis)),
+        input=AUDIENCE_ANALYSIS_INPUT,
+        session=session,
+        stage="audience_analysis"
     )
     
-    audience_analysis_output = audience_analysis.final_output
+    audience_analysis_output = output_json(audience_analysis.final_output)
     
     # Save to file
     output_dir = Path(__file__).resolve().parent / "outputs"
@@ -415,23 +487,57 @@ async def run_audience_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
         "files": [str(md_path)]
     }
 
+# tables_info for question_check when schema discovery produced nothing usable
+SCHEMA_UNAVAILABLE = "(schema not available)"
+# Longest unparsed schema text sent to question_check instead of a schema slice
+MAX_SCHEMA_TEXT_CHARS = 4000
+
+def build_question_check(schema_analysis_output: Optional[str]):
+    """
+    question_check for the discovered schema: the rule precheck first, then
+    the model, prompted with only the slice of the schema relevant to each
+    question. Returns (precheck, check, SQL catalog)
+    """
+    # Import question check function
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from question_check_test import checkquestion_with_gpt
+    
+    schema_index = SchemaIndex.from_schema(schema_analysis_output or [])
+    precheck = QuestionPrecheck.from_schema(schema_index)
+    
+    def check(question: Dict[str, Any]) -> Dict[str, Any]:
+        if schema_index:
+            tables_info = schema_index.slice(str(question.get("question") or ""))
+        elif schema_analysis_output:
+            tables_info = truncate(schema_analysis_output, MAX_SCHEMA_TEXT_CHARS)
+        else:
+            tables_info = SCHEMA_UNAVAILABLE
+        return checkquestion_with_gpt(question, tables_info)
+    
+    return precheck, precheck.wrap(check), schema_index.catalog
+
 async def run_question_validation(audience_analysis_output: str, schema_analysis_output: str) -> List[Dict[str, Any]]:
     """Run question validation using GPT"""
     try:
-        # Import question check function
-        sys.path.append(str(Path(__file__).resolve().parent.parent))
-        from question_check_test import checkquestion_with_gpt
-        
         results_json = json.loads(audience_analysis_output)
-        reports_list = []
+        questions = []
         
         for segment in results_json.get("segments", []):
             segment_name = segment.get("segment_name", "unknown_segment")
             for question in segment.get("valued_questions", []):
                 print(f"---- {segment_name}")
-                report = checkquestion_with_gpt(question, schema_analysis_output)
-                reports_list.append(report)
-        
+                questions.append(question)
+        
+        # One check per cluster of near-duplicate questions; obvious ones are
+        # answered by rules against the schema without a model call
+        # question_check uses the synchronous OpenAI client, whose retries and
+        # rate-limit waits sleep, so the checks run off the event loop
+        precheck, check_question, sql_catalog = build_question_check(schema_analysis_output)
+        reports_list = await asyncio.to_thread(validate_deduplicated, questions, check_question)
+        print(f"Question precheck: {dict(precheck.counts)}")
+        # Dry-run the returned SQL against the discovered schema and correct query_type
+        sql_counts = await asyncio.to_thread(validate_reports, reports_list, sql_catalog)
+        print(f"SQL validation: {sql_counts}")
         return reports_list
     except Exception as e:
         print(f"Question validation failed: {e}")
@@ -453,79 +559,52 @@ async def save_to_database(analysis_type: str, content: str):
         print(f"Error saving data: {e}")
 
 # Integrated Analysis Functions (from demo-4.py)
-def parse_customer_analysis_to_dataframe(customer_data):
+VALIDATION_BATCH_SIZE = 10
+checkpoint_store = CheckpointStore.from_env()
+# Checkpoint holding the serialized results of a completed run (integrated or /analyze)
+INTEGRATED_RESULT_STEP = "integrated_result"
+# Upper bound for a single LLM-backed pipeline stage (seconds, 0 disables)
+PIPELINE_STAGE_TIMEOUT = float(os.getenv("PIPELINE_STAGE_TIMEOUT", 900)) or None
+# Largest stored result /runs/{run_id}/export loads; its JSON text is held in memory while exporting
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_BYTES", 256 * 1024 * 1024))
+
+def parse_customer_analysis_to_dataframe(customer_data, market_name=None):
     """
-    将customer_analysis数据解析为DataFrame，每个question为一行
+    将customer_analysis数据解析为列式问题表（QuestionTable，底层为DataFrame），每个question为一行
     支持多种JSON格式：segments, target_customers, 或直接的问题列表
     """
-    customers_data = []
-
-    # 处理不同的JSON结构
-    if 'segments' in customer_data:
-        # 新格式：segments
-        segments = customer_data['segments']
-    elif 'target_customers' in customer_data:
-        # 旧格式：target_customers
-        segments = customer_data['target_customers']
-    elif isinstance(customer_data, list):
-        # 直接是segment列表
-        segments = customer_data
-    else:
-        # 如果都没有，返回空列表
-        print(f"Warning: Unknown customer data format: {list(customer_data.keys())}")
-        return []
+    # pandas is imported on first use (or by the warm-up), not at server start
+    from bi_core.question_table import QuestionTable
+    return QuestionTable.from_customer_analysis(customer_data, market_name)
 
-    for segment in segments:
-        # 基本信息 - 兼容不同的字段名
-        segment_name = segment.get('segment_name', segment.get('customer_name', 'Unknown'))
-        profile = segment.get('profile', {})
-        
-        base_info = {
-            'customer_name': segment_name,
-            'industry': profile.get('industry', 'Unknown'),
-            'company_size': profile.get('company_size', 'Unknown'),
-            'region': ', '.join(profile.get('region', [])) if isinstance(profile.get('region'), list) else profile.get('region', 'Unknown'),
-            'roles': ', '.join(profile.get('roles', [])) if isinstance(profile.get('roles'), list) else profile.get('roles', 'Unknown'),
-            'willingness_to_pay_tier': segment.get('willingness_to_pay', {}).get('tier', 'Unknown'),
-            'budget_range_usd': segment.get('willingness_to_pay', {}).get('budget_range_usd', 'Unknown')
-        }
+def resolve_api_key(request_key: Optional[str]) -> str:
+    """OpenAI key for a request: its own if valid, else OPENAI_API_KEY, else FALLBACK_OPENAI_API_KEY
 
-        # 为每个问题创建一行
-        valued_questions = segment.get('valued_questions', [])
-        for question in valued_questions:
-            question_info = base_info.copy()
-            question_info.update({
-                'question': question.get('question', ''),
-                'pain_point': question.get('mapped_pain_point', ''),
-                'problem_type': question.get('problem_type', ''),
-                'monetization_path': ', '.join(question.get('monetization_path', [])) if isinstance(question.get('monetization_path'), list) else question.get('monetization_path', ''),
-                'decision_value': question.get('decision_value', '')
-            })
-            customers_data.append(question_info)
-
-    return customers_data
+    The key is handed to the model clients with use_api_key() instead of being
+    written to os.environ, which concurrent requests with other keys share.
+    """
+    # Priority: Use request API key first, then environment variable
+    env_key = os.getenv("OPENAI_API_KEY")
+    if request_key and ('*' not in request_key and len(request_key) >= 50):
+        print(f"Using request API key: {request_key[:20]}...")
+        return request_key
+    if env_key and ('*' not in env_key and len(env_key) >= 50):
+        print(f"Using environment API key: {env_key[:20]}...")
+        return env_key
+    # Use fallback API key only if both are invalid
+    fallback_key = os.getenv("FALLBACK_OPENAI_API_KEY", "invalid_key")
+    print(f"Both request and environment keys are invalid, using fallback: {fallback_key[:20]}...")
+    return fallback_key
 
 async def run_integrated_analysis(request: IntegratedAnalysisRequest) -> Dict[str, Any]:
     """
     Run integrated analysis (demo-4.py functionality)
+    Each completed step is checkpointed; pass resume_run_id to continue a run
     """
+    run_id = None
     try:
-        # Set OpenAI API key with fallback mechanism
-        api_key_to_use = request.openai_api_key
-        
-        # Priority: Use request API key first, then environment variable
-        if api_key_to_use and ('*' not in api_key_to_use and len(api_key_to_use) >= 50):
-            print(f"Using request API key: {api_key_to_use[:20]}...")
-            os.environ["OPENAI_API_KEY"] = api_key_to_use
-        elif os.getenv("OPENAI_API_KEY") and ('*' not in os.getenv("OPENAI_API_KEY") and len(os.getenv("OPENAI_API_KEY")) >= 50):
-            print(f"Using environment API key: {os.getenv('OPENAI_API_KEY')[:20]}...")
-            api_key_to_use = os.getenv("OPENAI_API_KEY")
-        else:
-            # Use fallback API key only if both are invalid
-            fallback_key = os.getenv("FALLBACK_OPENAI_API_KEY", "invalid_key")
-            print(f"Both request and environment keys are invalid, using fallback: {fallback_key[:20]}...")
-            os.environ["OPENAI_API_KEY"] = fallback_key
-            api_key_to_use = fallback_key
+        # OpenAI API key with fallback mechanism (applied to this run's calls only)
+        api_key_to_use = resolve_api_key(request.openai_api_key)
 
         # Initialize agent
         agent = await initialize_agent(
@@ -535,213 +614,331 @@ async def run_integrated_analysis(request: IntegratedAnalysisRequest) -> Dict[st
         )
         
         # Read prompt files from demo2 directory
-        BUSINESS_EXPERT_PROMPT = (Path(__file__).resolve().parent.parent / "demo2" / "system_prompt.md").read_text(encoding="utf-8")
-        MARKET_ANALYSIS_PROMPT = (Path(__file__).resolve().parent.parent / "demo2" / "market_analysis_prompt.md").read_text(encoding="utf-8")
-        CUSTOMER_ANALYSIS_PROMPT = (Path(__file__).resolve().parent.parent / "demo2" / "audience_analysis_prompt.md").read_text(encoding="utf-8")
+        BUSINESS_EXPERT_PROMPT = read_prompt(DEMO2_PROMPTS_DIR / "system_prompt.md")
+        MARKET_ANALYSIS_PROMPT = read_prompt(DEMO2_PROMPTS_DIR / "market_analysis_prompt.md")
+        CUSTOMER_ANALYSIS_PROMPT = read_prompt(DEMO2_PROMPTS_DIR / "audience_analysis_prompt.md")
         
-        session = SQLiteSession(request.user_name, f"{request.user_name}_conversations.db")
+        session = get_session(request.user_name)
         
         output_dir = Path(__file__).resolve().parent / "outputs-4"
         output_dir.mkdir(exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         
-        results = {}
+        # Checkpointed run: completed steps are persisted under run_id and
+        # skipped when the run is resumed
+        run_id = request.resume_run_id or checkpoint_store.new_run_id()
+        existing_run = checkpoint_store.get_run(run_id)
+        if existing_run:
+            timestamp = existing_run["metadata"]["timestamp"]
+            print(f"Resuming run {run_id}, completed steps: {len(existing_run['completed_steps'])}")
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        checkpoint_store.start_run(run_id, {
+            "supabase_project_id": request.supabase_project_id,
+            "user_name": request.user_name,
+            "analysis_type": request.analysis_type,
+            "timestamp": timestamp
+        })
+        
+        results = {"run_id": run_id}
         files_generated = []
         
         # ========== Step 1: Market Analysis ==========
-        print("=" * 60)
-        print("STEP 1: Market Analysis")
-        print("=" * 60)
-        
-        market_analysis = await Runner.run(
-            agent,
-            input=MARKET_ANALYSIS_PROMPT,
-            session=session
-        )
-        market_analysis_output = market_analysis.final_output
-        
-        market_path = output_dir / f"market_analysis_{timestamp}.md"
-        market_path.write_text(market_analysis_output, encoding="utf-8")
-        files_generated.append(str(market_path))
-        print(f"✓ Market analysis saved to: {market_path.name}")
-        
-        # 解析市场分析 JSON
-        market_analysis_json = json.loads(market_analysis_output)
+        async def market_stage():
+            print("=" * 60)
+            print("STEP 1: Market Analysis")
+            print("=" * 60)
+            market_analysis = await run_agent(
+                stage_agent(agent, "market_analysis", MARKET_ANALYSIS_PROMPT, structured_output(MarketAnalysis)),
+                input=MARKET_ANALYSIS_INPUT,
+                session=session,
+                stage="market_analysis"
+            )
+            return output_json(market_analysis.final_output)
         
-        # 检查JSON结构并提取市场信息
-        if 'market_segments' in market_analysis_json:
-            market_segments = market_analysis_json['market_segments']
-        elif 'summary' in market_analysis_json:
-            # 如果没有market_segments，创建一个基于summary的市场段
-            market_segments = [{
-                'market_name': market_analysis_json['summary'].get('headline', 'Unknown Market'),
-                'description': market_analysis_json['summary'].get('core_insight', ''),
-                'strategy': market_analysis_json['summary'].get('strategic_call', '')
-            }]
-        else:
-            # 如果都没有，创建一个默认的市场段
-            market_segments = [{
-                'market_name': 'Primary Market',
-                'description': 'Market analysis completed',
-                'strategy': 'Continue with customer analysis'
+        def market_segments_stage(market_analysis):
+            market_path = output_dir / f"market_analysis_{timestamp}.md"
+            market_path.write_text(market_analysis, encoding="utf-8")
+            files_generated.append(str(market_path))
+            print(f"✓ Market analysis saved to: {market_path.name}")
+            
+            # 解析市场分析 JSON
+            market_analysis_json = json.loads(market_analysis)
+            
+            # 提取市场信息；没有market_segments时，基于summary创建一个市场段，
+            # summary也缺失时（如旧版本保存的检查点）使用默认市场段
+            summary = market_analysis_json.get('summary') or {}
+            market_segments = market_analysis_json.get('market_segments') or [{
+                'market_name': summary.get('headline') or 'Primary Market',
+                'description': summary.get('core_insight') or 'Market analysis completed',
+                'strategy': summary.get('strategic_call') or 'Continue with customer analysis'
             }]
+            
+            results["market_analysis"] = market_analysis_json
+            results["market_segments"] = market_segments
+            return market_analysis_json, market_segments
         
-        results["market_analysis"] = market_analysis_json
-        results["market_segments"] = market_segments
-        
-        if request.analysis_type == "market_only":
-            return {
-                "results": results,
-                "files_generated": files_generated,
-                "timestamp": timestamp
-            }
-        
-        # ========== Step 2: Customer Analysis for Each Market ==========
-        print("=" * 60)
-        print("STEP 2: Customer Analysis (循环处理每个市场)")
-        print("=" * 60)
-        
-        # 创建一个深拷贝用于合并受众分析（保持原始市场分析不变）
-        integrated_analysis = copy.deepcopy(market_analysis_json)
-        
-        print(f"\n📊 Found {len(market_segments)} market(s) to analyze:")
-        
-        all_validation_reports = []
-        
-        for idx, market in enumerate(market_segments, 1):
-            market_name = market.get("market_name", f"market_{idx}")
-            print(f"\n[{idx}/{len(market_segments)}] Processing Market: {market_name}")
-
-            # 执行受众分析 - 利用 session 上下文，无需传递完整市场数据
-            customer_prompt = f"""
-Based on our previous market analysis conversation, please focus on the market: **{market_name}**
-
-{CUSTOMER_ANALYSIS_PROMPT}
-
-"""
+        # Schema discovery for question validation; runs alongside the market
+        # analysis and outside the shared session, which it does not need
+        async def schema_stage():
             try:
-                customer_analysis = await Runner.run(
-                    agent,
-                    input=customer_prompt,
-                    session=session
+                schema_description = await run_agent(
+                    stage_agent(agent, "schema_description", output_type=structured_output(SchemaDescription)),
+                    input=SCHEMA_DESCRIPTION_INPUT,
+                    timeout=PIPELINE_STAGE_TIMEOUT,
+                    stage="schema_description"
                 )
-                customer_analysis_output = customer_analysis.final_output
-                
-                # 保存单个市场的受众分析
-                safe_market_name = market_name.replace(" ", "_").replace("/", "_")
-                customer_path = output_dir / f"customer_analysis_{safe_market_name}_{timestamp}.md"
-                customer_path.write_text(customer_analysis_output, encoding="utf-8")
-                files_generated.append(str(customer_path))
-                print(f"   ✓ Customer analysis saved: {customer_path.name}")
-                
-                # 将受众分析合并到 integrated_analysis 中（不修改原始 market_analysis_json）
-                customer_json = json.loads(customer_analysis_output)
-                target_market_entry = None
-                for entry in integrated_analysis.get("market_segments", []):
-                    if entry.get("market_name") == market_name:
-                        target_market_entry = entry
-                        break
-
-                if target_market_entry is None:
-                    target_market_entry = {"market_name": market_name}
-                    integrated_analysis.setdefault("market_segments", []).append(target_market_entry)
-
-                target_market_entry["customer_analysis"] = customer_json
-                print("   ✓ Customer analysis merged into integrated analysis")
-                
-                # 数据建模验证
-                print(f"   → Running data modeling validation...")
-                question_data = parse_customer_analysis_to_dataframe(customer_json)
-                print("=== question_check  ===")
-                reports_list = []
-                
-                # Import question check function
-                sys.path.append(str(Path(__file__).resolve().parent.parent))
-                from question_check_test import checkquestion_with_gpt
-                
-                for question in question_data:
-                    report = checkquestion_with_gpt(question, "schema_analysis_output")
-                    reports_list.append(report)
-                
-                # 将验证报告也合并到 integrated_analysis 中
-                if market_name not in integrated_analysis:
-                    integrated_analysis[market_name] = {}
-                integrated_analysis[market_name]["validation_reports"] = reports_list
-                all_validation_reports.extend(reports_list)
-                print(f"   ✓ Validation complete: {len(reports_list)} questions validated\n")
-
+                return output_json(schema_description.final_output)
             except Exception as e:
-                print(f"   ✗ Error processing market {market_name}: {e}\n")
-                # 确保使用正确的键名
-                if market_name not in integrated_analysis:
-                    integrated_analysis[market_name] = {}
-                integrated_analysis[market_name]["customer_analysis"] = {
-                    "error": str(e),
-                    "status": "failed"
-                }
-
-        # ========== Step 3: 保存完整的分析结果 ==========
-        print("=" * 60)
-        print("STEP 3: Saving Complete Analysis Results")
-        print("=" * 60)
-        
-        # 保存纯市场分析（不含受众分析）
-        pure_market_analysis = {
-            "metadata": {
-                "analysis_type": "market_analysis_only",
-                "analysis_timestamp": timestamp,
-                "analysis_date": datetime.now().isoformat(),
-            },
-            "markets": market_analysis_json
-        }
-        
-        pure_market_path = output_dir / f"market_analysis_pure_{timestamp}.json"
-        pure_market_path.write_text(
-            json.dumps(pure_market_analysis, indent=2, ensure_ascii=False),
-            encoding="utf-8"
-        )
-        files_generated.append(str(pure_market_path))
-        print(f"✓ Pure market analysis saved: {pure_market_path.name}")
-        
-        # 保存集成分析（市场分析 + 受众分析）
-        integrated_analysis_output = {
-            "metadata": {
-                "analysis_type": "integrated_market_and_customer",
-                "analysis_timestamp": timestamp,
-                "analysis_date": datetime.now().isoformat(),
-            },
-            "markets": integrated_analysis
-        }
+                # Not cached, so a resumed run tries again
+                print(f"Schema discovery failed, validating without schema: {e}")
+                return None
         
-        integrated_path = output_dir / f"integrated_analysis_{timestamp}.json"
-        integrated_path.write_text(
-            json.dumps(integrated_analysis_output, indent=2, ensure_ascii=False),
-            encoding="utf-8"
-        )
-        files_generated.append(str(integrated_path))
-        print(f"✓ Integrated analysis saved: {integrated_path.name}")
+        # ========== Step 2: Customer Analysis for Each Market ==========
+        # Markets share one agent session (each prompt builds on the previous
+        # conversation), so they are processed in order inside a single stage
+        async def customer_stage(market_segments, schema_description):
+            print("=" * 60)
+            print("STEP 2: Customer Analysis (循环处理每个市场)")
+            print("=" * 60)
+            
+            market_analysis_json, segments = market_segments
+            # Questions are checked against the slice of the discovered schema they refer to
+            precheck, check_question, sql_catalog = build_question_check(schema_description)
+            customer_agent = stage_agent(
+                agent, "customer_analysis", CUSTOMER_ANALYSIS_PROMPT, structured_output(AudienceAnalysis)
+            )
+            # 创建一个深拷贝用于合并受众分析（保持原始市场分析不变）
+            integrated_analysis = copy.deepcopy(market_analysis_json)
+            
+            print(f"\n📊 Found {len(segments)} market(s) to analyze:")
+            
+            all_validation_reports = []
+            failed_markets = 0
+            # Validation reports by question cluster, shared by all markets of the run
+            question_clusterer = QuestionClusterer.from_env()
+            cluster_reports: Dict[int, Dict[str, Any]] = {}
+            
+            for idx, market in enumerate(segments, 1):
+                market_name = market.get("market_name", f"market_{idx}")
+                print(f"\n[{idx}/{len(segments)}] Processing Market: {market_name}")
+                
+                # 执行受众分析 - 利用 session 上下文，无需传递完整市场数据
+                # 受众分析提示词在 customer_agent 的系统指令中，这里只传可变的市场名称
+                customer_prompt = f"{AUDIENCE_ANALYSIS_INPUT}\nBased on our previous market analysis conversation, please focus on the market: **{market_name}**"
+                try:
+                    async def customer_step():
+                        customer_analysis = await run_agent(
+                            customer_agent,
+                            input=customer_prompt,
+                            session=session,
+                            timeout=PIPELINE_STAGE_TIMEOUT,
+                            stage="customer_analysis"
+                        )
+                        return output_json(customer_analysis.final_output)
+                    
+                    customer_analysis_output = await checkpoint_store.step(
+                        run_id, f"customer_analysis:{market_name}", customer_step
+                    )
+                    
+                    # 保存单个市场的受众分析
+                    safe_market_name = market_name.replace(" ", "_").replace("/", "_")
+                    customer_path = output_dir / f"customer_analysis_{safe_market_name}_{timestamp}.md"
+                    customer_path.write_text(customer_analysis_output, encoding="utf-8")
+                    files_generated.append(str(customer_path))
+                    print(f"   ✓ Customer analysis saved: {customer_path.name}")
+                    
+                    # 将受众分析合并到 integrated_analysis 中（不修改原始 market_analysis_json）
+                    customer_json = json.loads(customer_analysis_output)
+                    target_market_entry = None
+                    for entry in integrated_analysis.get("market_segments", []):
+                        if entry.get("market_name") == market_name:
+                            target_market_entry = entry
+                            break
+                    
+                    if target_market_entry is None:
+                        target_market_entry = {"market_name": market_name}
+                        integrated_analysis.setdefault("market_segments", []).append(target_market_entry)
+                    
+                    target_market_entry["customer_analysis"] = customer_json
+                    print("   ✓ Customer analysis merged into integrated analysis")
+                    
+                    # 数据建模验证
+                    print(f"   → Running data modeling validation...")
+                    question_data = parse_customer_analysis_to_dataframe(customer_json, market_name).records()
+                    print("=== question_check  ===")
+                    # Near-duplicate questions (within this market or repeated from an
+                    # earlier one) share the report of their cluster's representative
+                    cluster_ids = question_clusterer.assign([q.get("question", "") for q in question_data])
+                    pending = pick_representatives(question_data, cluster_ids, cluster_reports)
+                    
+                    # Validate in batches; every finished batch is a checkpoint, keyed by
+                    # its questions so a resumed run that clusters differently re-validates
+                    for batch_start in range(0, len(pending), VALIDATION_BATCH_SIZE):
+                        batch = pending[batch_start:batch_start + VALIDATION_BATCH_SIZE]
+                        batch_key = hashlib.sha1(
+                            "\n".join(question.get("question", "") for _, question in batch).encode("utf-8")
+                        ).hexdigest()[:16]
+                        
+                        def check_batch():
+                            batch_reports = [check_question(question) for _, question in batch]
+                            validate_reports(batch_reports, sql_catalog)
+                            return batch_reports
+                        
+                        async def validation_step():
+                            # Synchronous OpenAI client: checked off the event loop
+                            return await asyncio.to_thread(check_batch)
+                        
+                        batch_reports = await checkpoint_store.step(
+                            run_id, f"question_check:{market_name}:{batch_key}", validation_step
+                        )
+                        for (cluster_id, _), report in zip(batch, batch_reports):
+                            cluster_reports[cluster_id] = report
+                    reports_list = fan_out(question_data, cluster_ids, cluster_reports)
+                    
+                    # 将验证报告也合并到 integrated_analysis 中
+                    if market_name not in integrated_analysis:
+                        integrated_analysis[market_name] = {}
+                    integrated_analysis[market_name]["validation_reports"] = reports_list
+                    all_validation_reports.extend(reports_list)
+                    print(f"   ✓ Validation complete: {len(reports_list)} questions, "
+                          f"{len(pending)} validated ({len(reports_list) - len(pending)} deduplicated)\n")
+                
+                except Exception as e:
+                    failed_markets += 1
+                    print(f"   ✗ Error processing market {market_name}: {e}\n")
+                    # 确保使用正确的键名
+                    if market_name not in integrated_analysis:
+                        integrated_analysis[market_name] = {}
+                    integrated_analysis[market_name]["customer_analysis"] = {
+                        "error": str(e),
+                        "status": "failed"
+                    }
+            
+            print(f"Question precheck: {dict(precheck.counts)}")
+            return integrated_analysis, all_validation_reports, failed_markets
         
-        results["integrated_analysis"] = integrated_analysis_output
-        results["validation_reports"] = all_validation_reports
+        # ========== Step 3: 保存完整的分析结果 ==========
+        def save_stage(market_segments, customer_analysis):
+            print("=" * 60)
+            print("STEP 3: Saving Complete Analysis Results")
+            print("=" * 60)
+            
+            market_analysis_json = market_segments[0]
+            integrated_analysis, all_validation_reports, _ = customer_analysis
+            
+            # 保存纯市场分析（不含受众分析）
+            pure_market_analysis = {
+                "metadata": {
+                    "analysis_type": "market_analysis_only",
+                    "analysis_timestamp": timestamp,
+                    "analysis_date": datetime.now().isoformat(),
+                },
+                "markets": market_analysis_json
+            }
+            
+            pure_market_path = output_dir / f"market_analysis_pure_{timestamp}.json"
+            pure_market_path.write_text(
+                json.dumps(pure_market_analysis, indent=2, ensure_ascii=False),
+                encoding="utf-8"
+            )
+            files_generated.append(str(pure_market_path))
+            print(f"✓ Pure market analysis saved: {pure_market_path.name}")
+            
+            # 保存集成分析（市场分析 + 受众分析）
+            integrated_analysis_output = {
+                "metadata": {
+                    "analysis_type": "integrated_market_and_customer",
+                    "analysis_timestamp": timestamp,
+                    "analysis_date": datetime.now().isoformat(),
+                },
+                "markets": integrated_analysis
+            }
+            
+            integrated_path = output_dir / f"integrated_analysis_{timestamp}.json"
+            integrated_path.write_text(
+                json.dumps(integrated_analysis_output, indent=2, ensure_ascii=False),
+                encoding="utf-8"
+            )
+            files_generated.append(str(integrated_path))
+            print(f"✓ Integrated analysis saved: {integrated_path.name}")
+            
+            results["integrated_analysis"] = integrated_analysis_output
+            results["validation_reports"] = all_validation_reports
+        
+        pipeline = DAG("integrated_analysis")
+        pipeline.add_stage("market_analysis", market_stage, cache_key="market_analysis",
+                           timeout=PIPELINE_STAGE_TIMEOUT)
+        pipeline.add_stage("market_segments", market_segments_stage, inputs=["market_analysis"])
+        pipeline.add_stage("schema_description", schema_stage, cache_key="schema_description",
+                           timeout=PIPELINE_STAGE_TIMEOUT,
+                           when=lambda: request.analysis_type != "market_only")
+        pipeline.add_stage("customer_analysis", customer_stage, inputs=["market_segments", "schema_description"],
+                           when=lambda market_segments, schema_description: request.analysis_type != "market_only")
+        pipeline.add_stage("save_results", save_stage, inputs=["market_segments", "customer_analysis"])
+        
+        # The run's checkpoints double as the stage cache, so a resumed run
+        # skips the market analysis it already paid for
+        with track_usage() as usage, use_api_key(api_key_to_use):
+            outcome = await pipeline.run(cache=RunCheckpointCache(checkpoint_store, run_id))
+        
+        # Failed markets have no checkpoint, so resuming the run retries only them
+        failed_markets = outcome["customer_analysis"][2] if outcome.ran("customer_analysis") else 0
+        # Serialized once: stored with the run and spliced into every response
+        results_json = dumps(results)
+        if not failed_markets:
+            checkpoint_store.save_step_raw(run_id, INTEGRATED_RESULT_STEP, results_json)
+        checkpoint_store.finish_run(run_id, "partial" if failed_markets else "completed")
         
         return {
-            "results": results,
+            "run_id": run_id,
+            "results": RawJSON(results_json, results),
             "files_generated": files_generated,
-            "timestamp": timestamp
+            "timestamp": timestamp,
+            "stage_timings": outcome.timings,
+            "token_usage": usage.snapshot()
         }
         
     except Exception as e:
         print(f"Error in integrated analysis: {e}")
+        if run_id:
+            checkpoint_store.finish_run(run_id, "failed")
         raise e
 
+def load_integrated_result(run_id: str) -> Optional[RawJSON]:
+    """Stored results of a completed integrated analysis run, as raw JSON"""
+    stored = checkpoint_store.load_step_raw(run_id, INTEGRATED_RESULT_STEP)
+    return RawJSON(stored) if stored is not None else None
+
 # Brand Strategy Analysis Functions
+# 品牌策略Agent重试耗尽后返回的默认结果
+FALLBACK_BRAND_STRATEGY = {
+    "chatapp_name": "Aurora Insights",
+    "chatapp_description": "An AI-powered brand platform that transforms analytical insights into compelling, market-ready product narratives.",
+    "chatapp_core_features": [
+        {
+            "feature_title": "Brand Positioning Engine",
+            "intro": "Defines the brand's competitive edge and value promise using structured strategic logic."
+        },
+        {
+            "feature_title": "Market Intelligence Hub",
+            "intro": "Aggregates and analyzes market data to identify opportunities and trends."
+        },
+        {
+            "feature_title": "Audience Insight Generator",
+            "intro": "Creates detailed audience personas and behavioral analysis."
+        },
+        {
+            "feature_title": "Narrative Builder",
+            "intro": "Transforms insights into compelling brand stories and messaging."
+        }
+    ]
+}
+
 async def run_brand_strategy_analysis(request: BrandStrategyRequest) -> Dict[str, Any]:
     """运行品牌策略分析"""
     try:
-        # 设置API密钥
+        # API密钥只用于本次请求的模型调用（不写入进程环境变量）
         api_key_to_use = request.openai_api_key or os.getenv("OPENAI_API_KEY")
-        if api_key_to_use:
-            os.environ["OPENAI_API_KEY"] = api_key_to_use
         
         # 导入品牌策略Agent
         sys.path.append(str(Path(__file__).resolve().parent.parent))
@@ -759,75 +956,22 @@ async def run_brand_strategy_analysis(request: BrandStrategyRequest) -> Dict[str
                 "data": {}
             }, ensure_ascii=False, indent=2)
         
-        # 构建提示消息
-        example_json = """{
-    "chatapp_name": "Aurora Insights",
-    "chatapp_description": "An AI-powered brand platform that transforms analytical insights into compelling, market-ready product narratives.",
-    "chatapp_core_features": [
-        {
-        "feature_title": "Brand Positioning Engine",
-        "intro": "Defines the brand's competitive edge and value promise using structured strategic logic."
-        }
-    ]
-    }"""
-
+        # 构建提示消息（输出结构由 brand_strategist_agent 的 output_type 约束）
         msg = (
             "Help me to do brand design.\n"
             "No extra exlain and question.\n"
+            "'chatapp_core_features' MUST be 4.\n\n"
             "<data>\n"
             f"{data_json}\n"
-            "</data>\n\n"
-            "## Output Schema Example\n"
-            "'chatapp_core_features' MUST be 4. The output must follow this JSON structure:\n"
-            "```json\n"
-            f"{example_json}\n"
-            "```"
+            "</data>"
         )
         
         # 调用品牌策略Agent
-        result = await run_with_retry(brand_strategist_agent, msg)
-        
-        if result:
-            # 解析AI返回的结果
-            try:
-                # 清理可能的代码块标记
-                cleaned_output = result.final_output.strip()
-                if cleaned_output.startswith("```json"):
-                    # 移除开头的```json
-                    cleaned_output = cleaned_output[7:]
-                if cleaned_output.endswith("```"):
-                    # 移除结尾的```
-                    cleaned_output = cleaned_output[:-3]
-                cleaned_output = cleaned_output.strip()
-                
-                brand_strategy = json.loads(cleaned_output)
-            except json.JSONDecodeError:
-                # 如果清理后仍然无法解析，保存原始输出
-                brand_strategy = {"raw_output": result.final_output}
-        else:
-            # 使用模拟结果
-            brand_strategy = {
-                "chatapp_name": "Aurora Insights",
-                "chatapp_description": "An AI-powered brand platform that transforms analytical insights into compelling, market-ready product narratives.",
-                "chatapp_core_features": [
-                    {
-                        "feature_title": "Brand Positioning Engine",
-                        "intro": "Defines the brand's competitive edge and value promise using structured strategic logic."
-                    },
-                    {
-                        "feature_title": "Market Intelligence Hub",
-                        "intro": "Aggregates and analyzes market data to identify opportunities and trends."
-                    },
-                    {
-                        "feature_title": "Audience Insight Generator",
-                        "intro": "Creates detailed audience personas and behavioral analysis."
-                    },
-                    {
-                        "feature_title": "Narrative Builder",
-                        "intro": "Transforms insights into compelling brand stories and messaging."
-                    }
-                ]
-            }
+        with use_api_key(api_key_to_use):
+            result = await run_with_retry(brand_strategist_agent, msg)
+        # 重试耗尽时使用默认结果（响应的message会注明）
+        fallback = result is None
+        brand_strategy = copy.deepcopy(FALLBACK_BRAND_STRATEGY) if fallback else output_data(result.final_output)
         
         # 保存结果到文件
         output_dir = Path(__file__).resolve().parent / "outputs"
@@ -838,13 +982,251 @@ async def run_brand_strategy_analysis(request: BrandStrategyRequest) -> Dict[str
         
         return {
             "brand_strategy": brand_strategy,
-            "files_generated": [str(result_file)]
+            "files_generated": [str(result_file)],
+            "fallback": fallback
         }
         
     except Exception as e:
         print(f"Brand strategy analysis failed: {e}")
         raise e
 
+# BI analysis pipeline (used by /analyze)
+async def run_bi_analysis(request: BIAnalysisRequest, agents: Optional[SharedResources] = None,
+                          session=None) -> Dict[str, Any]:
+    """Execute the requested BI analysis and collect results, files and save status
+
+    Batch items pass the batch's SharedResources, so items for the same
+    project reuse one agent, and their own branch of the user's session.
+    """
+    # OpenAI API key with fallback mechanism (applied to this run's calls only)
+    api_key_to_use = resolve_api_key(request.openai_api_key)
+    
+    # Initialize agent with provided configuration
+    create_agent = lambda: initialize_agent(
+        supabase_project_id=request.supabase_project_id,
+        supabase_access_token=request.supabase_access_token,
+        user_name=request.user_name
+    )
+    if agents is not None:
+        agent = await agents.get((request.supabase_project_id, request.supabase_access_token), create_agent)
+    else:
+        agent = await create_agent()
+    
+    # Stages start as soon as their inputs are ready: market and audience
+    # analysis run concurrently once the compliance check has passed, each on
+    # its own branch of the user's session (merged in a fixed order afterwards)
+    pipeline = DAG(f"analyze:{request.analysis_type}")
+    session = session if session is not None else get_session(request.user_name)
+    fork = SessionFork(session)
+    parallel = request.analysis_type == "all"
+    
+    async def schema_stage():
+        return await run_schema_analysis(agent, request.user_name, session)
+    
+    async def market_stage(**_):
+        return await run_market_analysis(agent, request.user_name, fork.branch("market") if parallel else session)
+    
+    async def audience_stage(**_):
+        return await run_audience_analysis(agent, request.user_name, fork.branch("audience") if parallel else session)
+    
+    if request.analysis_type == "all":
+        def compliance_stage(schema):
+            tables_info = schema["json_data"].get("description", {}).get("tables", [])
+            return data_check(tables_info, api_key_to_use)
+        
+        async def validation_stage(schema, audience):
+            return await run_question_validation(audience["output"], schema["output"])
+        
+        async def persist_stage(schema, market, audience):
+            await save_to_database("schema_analysis", schema["output"])
+            await save_to_database("market_analysis", market["output"])
+            await save_to_database("audience_analysis", audience["output"])
+            return True
+        
+        compliance_passed = lambda compliance: compliance[0]
+        pipeline.add_stage("schema", schema_stage, timeout=PIPELINE_STAGE_TIMEOUT)
+        # data_check uses the synchronous OpenAI client, so it runs off the event loop
+        pipeline.add_stage("compliance", compliance_stage, inputs=["schema"], blocking=True)
+        pipeline.add_stage("market", market_stage, inputs=["compliance"], when=compliance_passed,
+                           timeout=PIPELINE_STAGE_TIMEOUT)
+        pipeline.add_stage("audience", audience_stage, inputs=["compliance"], when=compliance_passed,
+                           timeout=PIPELINE_STAGE_TIMEOUT)
+        pipeline.add_stage("validation", validation_stage, inputs=["schema", "audience"])
+        pipeline.add_stage("persist", persist_stage, inputs=["schema", "market", "audience"])
+    else:
+        stage_func = {"schema": schema_stage, "market": market_stage, "audience": audience_stage}[request.analysis_type]
+        
+        async def persist_stage(**outputs):
+            await save_to_database(f"{request.analysis_type}_analysis", outputs[request.analysis_type]["output"])
+            return True
+        
+        pipeline.add_stage(request.analysis_type, stage_func, timeout=PIPELINE_STAGE_TIMEOUT)
+        pipeline.add_stage("persist", persist_stage, inputs=[request.analysis_type])
+    
+    async with fork:
+        with track_usage() as usage, use_api_key(api_key_to_use):
+            outcome = await pipeline.run()
+        await fork.merge("market", "audience")
+    
+    results = {}
+    files_generated = []
+    if outcome.ran("schema"):
+        results["schema_analysis"] = outcome["schema"]["output"]
+        results["schema_json"] = outcome["schema"]["json_data"]
+        files_generated.extend(outcome["schema"]["files"])
+    if outcome.ran("compliance"):
+        all_allowed, summary = outcome["compliance"]
+        results["data_compliance"] = summary
+        if not all_allowed:
+            results["analysis_stopped"] = "Data compliance check failed"
+    for name in ("market", "audience"):
+        if outcome.ran(name):
+            results[f"{name}_analysis"] = outcome[name]["output"]
+            files_generated.extend(outcome[name]["files"])
+    if outcome.ran("validation"):
+        results["question_validation"] = outcome["validation"]
+    
+    return {
+        "results": results,
+        "files_generated": files_generated,
+        "database_saved": outcome.ran("persist"),
+        "stage_timings": outcome.timings,
+        "token_usage": usage.snapshot()
+    }
+
+# Request coalescing (single-flight)
+# Credentials are not part of the key; followers must present a Supabase
+# token already proven to work for the same project. user_name stays in the
+# key, since each run writes to that user's conversation session.
+COALESCE_EXCLUDED_FIELDS = {"supabase_access_token", "openai_api_key", "fields", "page"}
+analysis_flights = SingleFlight()
+authorized_credentials = set()
+_prompt_version = None
+
+def get_prompt_version() -> str:
+    """Short hash of the prompt files, so prompt changes never share results"""
+    global _prompt_version
+    if _prompt_version is None:
+        digest = hashlib.sha256()
+        root = Path(__file__).resolve().parent
+        for prompt_file in sorted(list((root / "prompts").glob("*.md")) + list((root.parent / "demo2").glob("*.md"))):
+            digest.update(prompt_file.read_bytes())
+        _prompt_version = digest.hexdigest()[:12]
+    return _prompt_version
+
+async def run_coalesced(namespace: str, request: BaseModel, func):
+    """Run func() through single-flight; returns (result, coalesced)"""
+    payload = request.model_dump(exclude=COALESCE_EXCLUDED_FIELDS)
+    payload["prompt_version"] = get_prompt_version()
+    key = make_request_key(namespace, payload)
+    project_id = request.supabase_project_id
+    credential = credential_fingerprint(request.supabase_access_token)
+    
+    result, coalesced = await analysis_flights.do(
+        key,
+        func,
+        credential=credential,
+        authorize=lambda fingerprint: (project_id, fingerprint) in authorized_credentials
+    )
+    # A completed run proves the token can read this project
+    authorized_credentials.add((project_id, credential))
+    return result, coalesced
+
+async def with_serialized_results(run):
+    """Await run and serialize its results once, so coalesced callers share the bytes"""
+    result = await run
+    return dict(result, results=RawJSON(dumps(result["results"]), result["results"]))
+
+async def run_stored_analysis(request: BIAnalysisRequest, agents: Optional[SharedResources] = None,
+                              session=None) -> Dict[str, Any]:
+    """run_bi_analysis with its serialized results stored as a completed run
+
+    Later pages (next_cursor) and exports are read from the stored copy with
+    GET /runs/{run_id}/result and /runs/{run_id}/export, instead of running
+    the analysis again.
+    """
+    result = await with_serialized_results(run_bi_analysis(request, agents, session))
+    run_id = checkpoint_store.new_run_id()
+    
+    def store():
+        checkpoint_store.start_run(run_id, {
+            "supabase_project_id": request.supabase_project_id,
+            "user_name": request.user_name,
+            "analysis_type": request.analysis_type,
+            "timestamp": datetime.now().strftime("%Y%m%d%H%M%S")
+        })
+        checkpoint_store.save_step_raw(run_id, INTEGRATED_RESULT_STEP, result["results"].data)
+        checkpoint_store.finish_run(run_id, "completed")
+    
+    await asyncio.to_thread(store)
+    return dict(result, run_id=run_id)
+
+def select_results(results, fields: Optional[List[str]] = None, page: Optional[PageRequest] = None):
+    """Requested fields / page of results; returns (results, page info or None)
+
+    Without a selection the (raw) results are returned untouched.
+    """
+    if not fields and page is None:
+        return results, None
+    if isinstance(results, RawJSON):
+        results = results.decoded()
+    try:
+        return view_results(results, fields, page)
+    except ProjectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Warm-up: everything the first request would otherwise pay for
+warmup = Warmup()
+WARMUP_PRECONNECT = os.getenv("WARMUP_PRECONNECT", "true").lower() == "true"
+
+@warmup.step("import_sdks")
+def warm_import_sdks():
+    return import_modules(HEAVY_MODULES)
+
+@warmup.step("load_prompts")
+def warm_load_prompts():
+    prompt_files = sorted(list(PROMPTS_DIR.glob("*.md")) + list(DEMO2_PROMPTS_DIR.glob("*.md")))
+    for prompt_file in prompt_files:
+        read_prompt(prompt_file)
+    get_prompt_version()
+    return {"files": len(prompt_files)}
+
+@warmup.step("build_agents")
+def warm_build_agents():
+    # Tool and output schemas shared by every request's agent, plus the
+    # modules that build the brand agent, the question checker and the question table
+    current_time_tool()
+    for model in (SchemaDescription, MarketAnalysis, AudienceAnalysis):
+        structured_output(model)
+    import_modules(("brand_strategist_agent", "question_check_test", "bi_core.question_table"))
+
+@warmup.step("open_stores")
+def warm_open_stores():
+    idempotency_store.open()
+    checkpoint_store.open()
+    get_session(os.getenv("USER_NAME", "huimin"))
+
+@warmup.step("build_clients")
+def warm_build_clients():
+    from agents.models.openai_provider import shared_http_client
+    shared_http_client()
+    if os.getenv("OPENAI_API_KEY"):
+        openai_client()
+
+@warmup.step("preconnect_openai", enabled=WARMUP_PRECONNECT)
+async def warm_preconnect_openai():
+    # Open pooled TLS connections so the first LLM call skips the handshake;
+    # the response itself (likely 401 without a key) does not matter
+    from agents.models.openai_provider import shared_http_client
+    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    await shared_http_client().head(f"{base_url}/models", timeout=5)
+    if os.getenv("OPENAI_API_KEY"):
+        from openai import APIStatusError
+        try:
+            await asyncio.to_thread(openai_client().with_options(max_retries=0, timeout=5).models.list)
+        except APIStatusError:
+            pass
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -855,6 +1237,13 @@ async def health_check():
         "service": "BI Analysis API"
     }
 
+# Readiness endpoint
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once the start-up warm-up has finished (503 before), with per-step timings"""
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 # Configuration endpoint
 @app.get("/config")
 async def get_config():
@@ -866,11 +1255,26 @@ async def get_config():
         "timestamp": datetime.now().isoformat()
     }
 
+# Metrics endpoint
+@app.get("/metrics")
+async def get_metrics():
+    """Get runtime metrics such as rate limiter queue wait, circuit breaker state and prompt cache hit rates"""
+    return {
+        "rate_limiter": get_rate_limiter().metrics(),
+        "circuit_breakers": circuit_breaker_metrics(),
+        "request_coalescing": analysis_flights.metrics(),
+        "token_usage": usage_metrics(),
+        # Metrics are per worker process
+        "worker": {"pid": os.getpid(), "workers": worker_count()},
+        "timestamp": datetime.now().isoformat()
+    }
+
 # Main analysis endpoint
 @app.post("/analyze", response_model=BIAnalysisResponse)
 async def analyze_data(request: BIAnalysisRequest):
     """
     Main analysis endpoint that handles different types of BI analysis requests
+    Identical concurrent requests share one execution
     """
     start_time = time.time()
     
@@ -882,108 +1286,31 @@ async def analyze_data(request: BIAnalysisRequest):
                 detail="Data review result is false. Analysis cannot proceed."
             )
         
-        # Set OpenAI API key with fallback mechanism
-        api_key_to_use = request.openai_api_key
-        
-        # Priority: Use request API key first, then environment variable
-        if api_key_to_use and ('*' not in api_key_to_use and len(api_key_to_use) >= 50):
-            print(f"Using request API key: {api_key_to_use[:20]}...")
-            os.environ["OPENAI_API_KEY"] = api_key_to_use
-        elif os.getenv("OPENAI_API_KEY") and ('*' not in os.getenv("OPENAI_API_KEY") and len(os.getenv("OPENAI_API_KEY")) >= 50):
-            print(f"Using environment API key: {os.getenv('OPENAI_API_KEY')[:20]}...")
-            api_key_to_use = os.getenv("OPENAI_API_KEY")
-        else:
-            # Use fallback API key only if both are invalid
-            fallback_key = os.getenv("FALLBACK_OPENAI_API_KEY", "invalid_key")
-            print(f"Both request and environment keys are invalid, using fallback: {fallback_key[:20]}...")
-            os.environ["OPENAI_API_KEY"] = fallback_key
-            api_key_to_use = fallback_key
-        
-        # Initialize agent with provided configuration
-        agent = await initialize_agent(
-            supabase_project_id=request.supabase_project_id,
-            supabase_access_token=request.supabase_access_token,
-            user_name=request.user_name
+        result, coalesced = await run_coalesced(
+            "analyze",
+            request,
+            lambda: run_stored_analysis(request)
         )
         
-        results = {}
-        files_generated = []
-        database_saved = False
-        
-        # Execute analysis based on type
-        if request.analysis_type == "schema":
-            result = await run_schema_analysis(agent, request.user_name)
-            results["schema_analysis"] = result["output"]
-            results["schema_json"] = result["json_data"]
-            files_generated.extend(result["files"])
-            await save_to_database("schema_analysis", result["output"])
-            database_saved = True
-            
-        elif request.analysis_type == "market":
-            result = await run_market_analysis(agent, request.user_name)
-            results["market_analysis"] = result["output"]
-            files_generated.extend(result["files"])
-            await save_to_database("market_analysis", result["output"])
-            database_saved = True
-            
-        elif request.analysis_type == "audience":
-            result = await run_audience_analysis(agent, request.user_name)
-            results["audience_analysis"] = result["output"]
-            files_generated.extend(result["files"])
-            await save_to_database("audience_analysis", result["output"])
-            database_saved = True
-            
-        elif request.analysis_type == "all":
-            # Run schema analysis first
-            schema_result = await run_schema_analysis(agent, request.user_name)
-            results["schema_analysis"] = schema_result["output"]
-            results["schema_json"] = schema_result["json_data"]
-            files_generated.extend(schema_result["files"])
-            
-            # Data compliance check
-            tables_info = schema_result["json_data"].get("description", {}).get("tables", [])
-            all_allowed, summary = data_check(tables_info, api_key_to_use)
-            results["data_compliance"] = summary
-            
-            if all_allowed:
-                # Run market and audience analysis in parallel
-                market_result, audience_result = await asyncio.gather(
-                    run_market_analysis(agent, request.user_name),
-                    run_audience_analysis(agent, request.user_name)
-                )
-                
-                results["market_analysis"] = market_result["output"]
-                results["audience_analysis"] = audience_result["output"]
-                files_generated.extend(market_result["files"])
-                files_generated.extend(audience_result["files"])
-                
-                # Run question validation
-                question_reports = await run_question_validation(
-                    audience_result["output"], 
-                    schema_result["output"]
-                )
-                results["question_validation"] = question_reports
-                
-                # Save all results to database
-                await save_to_database("schema_analysis", schema_result["output"])
-                await save_to_database("market_analysis", market_result["output"])
-                await save_to_database("audience_analysis", audience_result["output"])
-                database_saved = True
-            else:
-                results["analysis_stopped"] = "Data compliance check failed"
-        
+        results, page = select_results(result["results"], request.fields, request.page)
         execution_time = time.time() - start_time
         
-        return BIAnalysisResponse(
-            success=True,
-            analysis_type=request.analysis_type,
-            message=f"{request.analysis_type} analysis completed successfully",
-            results=results,
-            files_generated=files_generated,
-            database_saved=database_saved,
-            execution_time=execution_time,
-            timestamp=datetime.now().isoformat()
-        )
+        # Built directly: results are already JSON, re-validating them is pure overhead
+        return FastJSONResponse({
+            "success": True,
+            "analysis_type": request.analysis_type,
+            "message": f"{request.analysis_type} analysis completed successfully",
+            "run_id": result["run_id"],
+            "results": results,
+            "files_generated": result["files_generated"],
+            "database_saved": result["database_saved"],
+            "coalesced": coalesced,
+            "stage_timings": result["stage_timings"],
+            "token_usage": result["token_usage"],
+            "page": page,
+            "execution_time": execution_time,
+            "timestamp": datetime.now().isoformat()
+        })
         
     except HTTPException:
         raise
@@ -994,6 +1321,86 @@ async def analyze_data(request: BIAnalysisRequest):
             detail=f"Analysis failed: {str(e)}"
         )
 
+# Batch analysis endpoint
+@app.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(
+    requests: List[BIAnalysisRequest],
+    stream: bool = Query(default=False, description="Stream one NDJSON line per item as it finishes"),
+    max_concurrency: Optional[int] = Query(default=None, ge=1, description="Items run at once (capped by BATCH_MAX_CONCURRENCY)")
+):
+    """
+    Batch analysis endpoint for multiple requests (e.g. a nightly refresh of many projects)
+    Items run concurrently; items for the same project share one agent and
+    identical items share one run (also with concurrent /analyze calls).
+    Each run works on its own branch of the user's conversation session;
+    the branches of finished runs are merged in item order after the batch.
+    Every item reports its own status, timing and error, so one failing item
+    does not fail the batch.
+    """
+    if len(requests) > max_batch_items():
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {max_batch_items()} items")
+    start_time = time.time()
+    concurrency = batch_concurrency(max_concurrency)
+    agents = SharedResources()
+    sessions = BatchSessions(get_session)
+    items = list(enumerate(requests))
+    
+    async def run_item(item) -> Dict[str, Any]:
+        index, request = item
+        if not request.data_review_result:
+            raise SkipItem("Data review result is false. Analysis cannot proceed.")
+        result, coalesced = await run_coalesced(
+            "analyze",
+            request,
+            lambda: sessions.run(
+                request.user_name, index, lambda session: run_stored_analysis(request, agents, session)
+            )
+        )
+        results, page = select_results(result["results"], request.fields, request.page)
+        return {
+            "run_id": result["run_id"],
+            "results": results,
+            "files_generated": result["files_generated"],
+            "database_saved": result["database_saved"],
+            "coalesced": coalesced,
+            "stage_timings": result["stage_timings"],
+            "token_usage": result["token_usage"],
+            "page": page
+        }
+    
+    def item_line(outcome: Dict[str, Any]) -> Dict[str, Any]:
+        request = requests[outcome["index"]]
+        return dict(outcome, analysis_type=request.analysis_type, supabase_project_id=request.supabase_project_id)
+    
+    def summary(outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        counts = summarize_batch(outcomes)
+        return {
+            "success": counts["failed"] == 0,
+            "analysis_type": "batch",
+            "message": f"Batch analysis finished: {counts['succeeded']} succeeded, "
+                       f"{counts['failed']} failed, {counts['skipped']} skipped",
+            "summary": counts,
+            "max_concurrency": concurrency,
+            "agents_built": agents.built,
+            "execution_time": time.time() - start_time,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    if stream:
+        async def lines():
+            outcomes = []
+            async for outcome in run_batch(items, run_item, concurrency):
+                outcomes.append(outcome)
+                yield dumps(dict(item_line(outcome), type="item")) + b"\n"
+            await sessions.merge()
+            yield dumps(dict(summary(outcomes), type="summary")) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    outcomes = [outcome async for outcome in run_batch(items, run_item, concurrency)]
+    await sessions.merge()
+    outcomes.sort(key=lambda outcome: outcome["index"])
+    return FastJSONResponse(dict(summary(outcomes), items=[item_line(outcome) for outcome in outcomes]))
+
 # Results management endpoints
 @app.get("/results")
 async def list_results():
@@ -1029,6 +1436,78 @@ async def get_result(filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
 
+@app.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    """Get status and completed steps of a checkpointed integrated analysis run"""
+    run = checkpoint_store.get_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+@app.get("/runs/{run_id}/result")
+async def get_run_result(
+    run_id: str,
+    fields: Optional[str] = Query(default=None, description="Comma separated JSON pointers into results"),
+    section: Optional[str] = Query(default=None, description="JSON pointer of a list to paginate"),
+    cursor: Optional[str] = Query(default=None, description="next_cursor of the previous page"),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    """Get the stored results of a completed run (integrated or /analyze), optionally narrowed or paginated"""
+    run = checkpoint_store.get_run(run_id)
+    stored_results = load_integrated_result(run_id) if run is not None else None
+    if stored_results is None:
+        raise HTTPException(status_code=404, detail="No stored result for this run")
+    if cursor and not section:
+        raise HTTPException(status_code=400, detail="cursor requires a page section")
+    results, page = select_results(
+        stored_results,
+        [pointer.strip() for pointer in fields.split(",") if pointer.strip()] if fields else None,
+        PageRequest(section=section, cursor=cursor, limit=limit) if section else None
+    )
+    return FastJSONResponse({
+        "run_id": run_id,
+        "status": run["status"],
+        "metadata": run["metadata"],
+        "results": results,
+        "page": page
+    })
+
+@app.get("/runs/{run_id}/export/{section}")
+async def export_run_section(
+    run_id: str,
+    section: str,
+    export_format: str = Query(default="ndjson", alias="format", description="ndjson, csv or parquet")
+):
+    """Stream one list of a stored run result as rows: validation_reports, questions, markets or audits"""
+    if section not in EXPORT_SECTIONS:
+        raise HTTPException(status_code=404,
+                            detail=f"Unknown export section, expected one of: {', '.join(EXPORT_SECTIONS)}")
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown export format, expected one of: {', '.join(EXPORT_FORMATS)}")
+    size = await asyncio.to_thread(checkpoint_store.step_size, run_id, INTEGRATED_RESULT_STEP)
+    if size is None:
+        raise HTTPException(status_code=404, detail="No stored result for this run")
+    if size > EXPORT_MAX_BYTES:
+        raise HTTPException(status_code=413,
+                            detail=f"Stored result is {size} bytes, above the export limit of {EXPORT_MAX_BYTES}")
+    stored = await asyncio.to_thread(checkpoint_store.load_step_raw, run_id, INTEGRATED_RESULT_STEP)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="No stored result for this run")
+    try:
+        # Finding the section scans the stored text, so off the event loop
+        chunks = await asyncio.to_thread(export_section, stored, section, export_format)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except MissingSection as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    extension = "jsonl" if export_format == "ndjson" else export_format
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[export_format], headers={
+        "Content-Disposition": f'attachment; filename="{run_id}_{section}.{extension}"'
+    })
+
 # Data compliance review endpoint
 @app.post("/review", response_model=DataReviewResponse)
 async def review_data_compliance(request: DataReviewRequest):
@@ -1051,8 +1530,6 @@ async def review_data_compliance(request: DataReviewRequest):
                 # Use fallback key
                 api_key_to_use = os.getenv("FALLBACK_OPENAI_API_KEY", "invalid_key")
         
-        os.environ["OPENAI_API_KEY"] = api_key_to_use
-        
         # Get table information
         if request.tables_info:
             # If table information is provided, use it directly
@@ -1067,7 +1544,8 @@ async def review_data_compliance(request: DataReviewRequest):
                 user_name=request.user_name
             )
             
-            schema_result = await run_schema_analysis(agent, request.user_name)
+            with use_api_key(api_key_to_use):
+                schema_result = await run_schema_analysis(agent, request.user_name)
             tables_info = schema_result["json_data"].get("description", {}).get("tables", [])
             
             if not tables_info:
@@ -1080,7 +1558,8 @@ async def review_data_compliance(request: DataReviewRequest):
         print(f"Starting data compliance review for {len(tables_info)} tables...")
         
         # Execute data compliance check
-        all_allowed, summary = data_check(tables_info, api_key_to_use)
+        # data_check uses the synchronous OpenAI client, so it runs off the event loop
+        all_allowed, summary = await asyncio.to_thread(data_check, tables_info, api_key_to_use)
         
         execution_time = time.time() - start_time
         
@@ -1116,20 +1595,56 @@ async def integrated_analysis(request: IntegratedAnalysisRequest):
         print(f"Starting integrated analysis for user: {request.user_name}")
         print(f"Analysis type: {request.analysis_type}")
         
-        # Run the integrated analysis
-        result = await run_integrated_analysis(request)
+        if request.resume_run_id:
+            run = checkpoint_store.get_run(request.resume_run_id)
+            if run is None:
+                raise HTTPException(status_code=404, detail=f"Run not found: {request.resume_run_id}")
+            if run["metadata"].get("supabase_project_id") != request.supabase_project_id:
+                raise HTTPException(status_code=400, detail="Run belongs to a different Supabase project")
+            
+            # A completed run has nothing left to do: answer from its stored results
+            stored_results = load_integrated_result(request.resume_run_id) if run["status"] == "completed" else None
+            if stored_results is not None:
+                results, page = select_results(stored_results, request.fields, request.page)
+                return FastJSONResponse({
+                    "success": True,
+                    "message": "Integrated analysis loaded from completed run",
+                    "analysis_type": run["metadata"].get("analysis_type", request.analysis_type),
+                    "results": results,
+                    "files_generated": [],
+                    "coalesced": False,
+                    "run_id": request.resume_run_id,
+                    "stage_timings": {},
+                    "token_usage": {},
+                    "page": page,
+                    "execution_time": time.time() - start_time,
+                    "timestamp": run["metadata"]["timestamp"]
+                })
+        
+        # Run the integrated analysis (identical concurrent requests share one run)
+        result, coalesced = await run_coalesced(
+            "integrated-analysis",
+            request,
+            lambda: run_integrated_analysis(request)
+        )
         
+        results, page = select_results(result["results"], request.fields, request.page)
         execution_time = time.time() - start_time
         
-        return IntegratedAnalysisResponse(
-            success=True,
-            message=f"Integrated analysis completed successfully",
-            analysis_type=request.analysis_type,
-            results=result["results"],
-            files_generated=result["files_generated"],
-            execution_time=execution_time,
-            timestamp=result["timestamp"]
-        )
+        return FastJSONResponse({
+            "success": True,
+            "message": "Integrated analysis completed successfully",
+            "analysis_type": request.analysis_type,
+            "results": results,
+            "files_generated": result["files_generated"],
+            "coalesced": coalesced,
+            "run_id": result["run_id"],
+            "stage_timings": result.get("stage_timings", {}),
+            "token_usage": result.get("token_usage", {}),
+            "page": page,
+            "execution_time": execution_time,
+            "timestamp": result["timestamp"]
+        })
         
     except HTTPException:
         raise
@@ -1159,7 +1674,8 @@ async def brand_strategy_analysis(request: BrandStrategyRequest):
         
         return BrandStrategyResponse(
             success=True,
-            message="Brand strategy analysis completed successfully",
+            message=("Brand strategist agent unavailable, returned the default brand strategy"
+                     if result["fallback"] else "Brand strategy analysis completed successfully"),
             brand_strategy=result["brand_strategy"],
             files_generated=result["files_generated"],
             execution_time=execution_time,
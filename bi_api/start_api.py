@@ -2,10 +2,16 @@
 """
 启动 BI Analysis API 服务的脚本
 """
-import uvicorn
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bi_core.server import run_server
+from bi_core.startup import mask_secret
+
 def main():
     """启动 API 服务"""
     # 加载环境变量
@@ -18,9 +24,9 @@ def main():
     print("=" * 60)
     print("BI Analysis API 环境变量检查")
     print("=" * 60)
-    print(f"OPENAI_API_KEY: {'已设置' if os.getenv('OPENAI_API_KEY') else '未设置'}")
+    print(f"OPENAI_API_KEY: {mask_secret(os.getenv('OPENAI_API_KEY'))}")
     print(f"SUPABASE_PROJECT_ID: {'已设置' if os.getenv('SUPABASE_PROJECT_ID') else '未设置'}")
-    print(f"SUPABASE_ACCESS_TOKEN: {'已设置' if os.getenv('SUPABASE_ACCESS_TOKEN') else '未设置'}")
+    print(f"SUPABASE_ACCESS_TOKEN: {mask_secret(os.getenv('SUPABASE_ACCESS_TOKEN'))}")
     print(f"USER_NAME: {os.getenv('USER_NAME', 'huimin')}")
     print(f"DATA_REVIEW_RESULT: {os.getenv('DATA_REVIEW_RESULT', 'true')}")
     print(f"ENVIRONMENT: {os.getenv('ENVIRONMENT', 'production')}")
@@ -39,15 +45,12 @@ def main():
     # 获取端口，Render 会通过环境变量 PORT 指定端口
     port = int(os.environ.get("PORT", 8000))
     
-    # 检查是否为开发环境
-    is_development = os.environ.get("ENVIRONMENT", "production") == "development"
-    
-    uvicorn.run(
+    # ENVIRONMENT=development: 单进程热重载; 否则多 worker 生产模式 (WEB_CONCURRENCY 等)
+    run_server(
         "app:app",  # 使用 BI Analysis API
         host="0.0.0.0",
         port=port,
-        reload=is_development,  # 只在开发环境启用热重载
-        log_level="info"
+        app_dir=str(Path(__file__).resolve().parent)
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BI Core Package - shared runtime for the analysis services
+
+Infrastructure used by bi_api, analysis_api and the command line scripts,
+such as the process-wide LLM rate limiter, retry/circuit breaker policy and
+the call helpers that apply them, per-stage token budgets, and the DAG
+executor the analysis pipelines run on.
+"""
+
+__version__ = "1.0.0"
+__author__ = "AI Analysis Team"
+
+from .rate_limiter import (
+    RateLimiter,
+    TokenBucket,
+    estimate_tokens,
+    get_rate_limiter
+)
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    circuit_breaker_metrics,
+    is_output_error,
+    is_retryable
+)
+from .llm import (
+    run_agent,
+    chat_completion,
+    current_api_key,
+    openai_client,
+    stage_agent,
+    use_api_key
+)
+from .token_budget import (
+    TokenBudget,
+    TokenBudgetExceeded,
+    count_tokens,
+    get_token_budget
+)
+from .usage import (
+    UsageTracker,
+    record_usage,
+    track_usage,
+    usage_metrics
+)
+from .dag import (
+    DAG,
+    DAGResult,
+    SkipStage,
+    Stage,
+    StageFailed,
+    get_stage_budget
+)
+
+__all__ = [
+    "RateLimiter",
+    "TokenBucket",
+    "estimate_tokens",
+    "get_rate_limiter",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "RetryPolicy",
+    "circuit_breaker_metrics",
+    "is_output_error",
+    "is_retryable",
+    "run_agent",
+    "chat_completion",
+    "current_api_key",
+    "openai_client",
+    "stage_agent",
+    "use_api_key",
+    "TokenBudget",
+    "TokenBudgetExceeded",
+    "count_tokens",
+    "get_token_budget",
+    "UsageTracker",
+    "record_usage",
+    "track_usage",
+    "usage_metrics",
+    "DAG",
+    "DAGResult",
+    "SkipStage",
+    "Stage",
+    "StageFailed",
+    "get_stage_budget"
+]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Concurrent batch execution for the /analyze/batch endpoints
+
+run_batch() runs one coroutine per item with at most max_concurrency in
+flight and yields each item's outcome (status, timings, result or error) as
+soon as it finishes, so a failing item never fails the batch and results can
+be streamed back as NDJSON. SharedResources lets items of the same batch that
+target the same project share one agent (or any other per-project resource)
+instead of building their own.
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Sequence
+
+DEFAULT_BATCH_CONCURRENCY = 8
+DEFAULT_MAX_BATCH_ITEMS = 500
+
+
+def batch_concurrency(requested: Optional[int] = None) -> int:
+    """Items run at once: requested, capped by BATCH_MAX_CONCURRENCY (default 8)"""
+    limit = max(1, int(os.getenv("BATCH_MAX_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY)))
+    return max(1, min(requested, limit)) if requested else limit
+
+
+def max_batch_items() -> int:
+    """Largest accepted batch (MAX_BATCH_ITEMS, default 500)"""
+    return max(1, int(os.getenv("MAX_BATCH_ITEMS", DEFAULT_MAX_BATCH_ITEMS)))
+
+
+class SkipItem(Exception):
+    """Raised by an item function to report the item as skipped, not failed"""
+
+
+class SharedResources:
+    """Per-batch async memo: the first item needing a key builds the resource, the rest await it
+
+    A factory that raises is not remembered, so the next item for that key
+    tries again.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self.built = 0
+
+    async def get(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            self.built += 1
+        try:
+            # shield: one waiting item being cancelled must not cancel the shared build
+            return await asyncio.shield(task)
+        except Exception:
+            if self._tasks.get(key) is task and task.done():
+                del self._tasks[key]
+            raise
+
+
+def _error_message(error: BaseException) -> str:
+    # HTTPException carries its message in detail
+    detail = getattr(error, "detail", None)
+    return str(detail) if detail else (str(error) or type(error).__name__)
+
+
+async def run_batch(items: Sequence[Any], func: Callable[[Any], Awaitable[Any]],
+                    max_concurrency: int = DEFAULT_BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """Run func(item) for every item and yield outcomes in completion order
+
+    Each outcome has index, status (succeeded, failed or skipped),
+    queued_seconds, execution_time and either result or error. Closing the
+    iterator early (e.g. the client disconnected) cancels the unfinished items.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    submitted = time.perf_counter()
+
+    async def run_one(index: int, item: Any) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            outcome: Dict[str, Any] = {"index": index, "queued_seconds": round(started - submitted, 4)}
+            try:
+                outcome["result"] = await func(item)
+                outcome["status"] = "succeeded"
+            except SkipItem as e:
+                outcome["status"] = "skipped"
+                outcome["error"] = _error_message(e)
+            except Exception as e:
+                outcome["status"] = "failed"
+                outcome["error"] = _error_message(e)
+            outcome["execution_time"] = round(time.perf_counter() - started, 4)
+            return outcome
+
+    tasks = [asyncio.ensure_future(run_one(index, item)) for index, item in enumerate(items)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def summarize_batch(outcomes: Sequence[Dict[str, Any]]) -> Dict[str, int]:
+    counts = {"total": len(outcomes), "succeeded": 0, "failed": 0, "skipped": 0}
+    for outcome in outcomes:
+        counts[outcome["status"]] += 1
+    return counts
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-run checkpoints for resumable multi-step analyses
+
+Each completed step of a run (market analysis, one market's customer analysis,
+one validation batch, ...) is persisted under the run id as soon as it
+finishes. Resuming a run skips every step that already has a checkpoint, so a
+rerun after a failure or restart only pays for the remaining work.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class CheckpointStore:
+    """SQLite-backed store of run metadata and step results"""
+
+    def __init__(self, db_path: str = "checkpoints.db"):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CheckpointStore":
+        """Build a store from CHECKPOINT_DB"""
+        return cls(db_path=os.getenv("CHECKPOINT_DB", "checkpoints.db"))
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    metadata TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS run_steps (
+                    run_id TEXT NOT NULL,
+                    step TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, step)
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def open(self):
+        """Open the database now (e.g. during warm-up) instead of on first use"""
+        with self._lock:
+            self._connection()
+        return self
+
+    @staticmethod
+    def new_run_id() -> str:
+        return uuid.uuid4().hex
+
+    def start_run(self, run_id: str, metadata: Dict[str, Any]):
+        """Register a run (no-op if it already exists)"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, metadata, status, created_at, updated_at) "
+                "VALUES (?, ?, 'running', ?, ?)",
+                (run_id, json.dumps(metadata, ensure_ascii=False), now, now),
+            )
+            conn.execute("UPDATE runs SET status = 'running', updated_at = ? WHERE run_id = ?", (now, run_id))
+            conn.commit()
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Run metadata, status and completed step names, or None if unknown"""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT metadata, status, created_at, updated_at FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            steps = [r[0] for r in conn.execute(
+                "SELECT step FROM run_steps WHERE run_id = ? ORDER BY created_at", (run_id,)
+            )]
+        metadata, status, created_at, updated_at = row
+        return {
+            "run_id": run_id,
+            "metadata": json.loads(metadata),
+            "status": status,
+            "completed_steps": steps,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def finish_run(self, run_id: str, status: str = "completed"):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                         (status, time.time(), run_id))
+            conn.commit()
+
+    def load_step(self, run_id: str, step: str) -> Optional[Any]:
+        """Stored result of a step, or None if the step has not completed"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT payload FROM run_steps WHERE run_id = ? AND step = ?", (run_id, step)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_step_raw(self, run_id: str, step: str) -> Optional[bytes]:
+        """Stored JSON text of a step, without decoding it, or None if missing"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT payload FROM run_steps WHERE run_id = ? AND step = ?", (run_id, step)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0] if isinstance(row[0], bytes) else row[0].encode("utf-8")
+
+    def step_size(self, run_id: str, step: str) -> Optional[int]:
+        """Size in bytes of a step's stored JSON text, without reading it, or None if missing"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT length(CAST(payload AS BLOB)) FROM run_steps WHERE run_id = ? AND step = ?", (run_id, step)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_step_raw(self, run_id: str, step: str, payload: bytes):
+        """Store already serialized JSON as a step result (readable by both loaders)"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO run_steps (run_id, step, payload, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, step, payload, time.time()),
+            )
+            conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+            conn.commit()
+
+    def save_step(self, run_id: str, step: str, value: Any):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO run_steps (run_id, step, payload, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, step, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+            conn.commit()
+
+    def completed_steps(self, run_id: str) -> List[str]:
+        run = self.get_run(run_id)
+        return run["completed_steps"] if run else []
+
+    async def step(self, run_id: str, step: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the checkpointed result of a step, running and saving it if missing
+
+        func() must return a JSON-serializable value; it is only saved once it
+        returns, so a step that raises is retried on the next resume.
+        """
+        cached = self.load_step(run_id, step)
+        if cached is not None:
+            print(f"↺ Resuming from checkpoint: {step}")
+            return cached
+        value = await func()
+        self.save_step(run_id, step, value)
+        return value
+
+
+class RunCheckpointCache:
+    """One run's checkpoints exposed as a DAG stage cache (load/save by step name)"""
+
+    def __init__(self, store: CheckpointStore, run_id: str):
+        self.store = store
+        self.run_id = run_id
+
+    def load(self, key: str) -> Optional[Any]:
+        value = self.store.load_step(self.run_id, key)
+        if value is not None:
+            print(f"↺ Resuming from checkpoint: {key}")
+        return value
+
+    def save(self, key: str, value: Any):
+        self.store.save_step(self.run_id, key, value)
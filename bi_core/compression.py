@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP compression for large analysis payloads
+
+CompressionMiddleware negotiates the response encoding from Accept-Encoding
+(zstd, br, gzip; zstd and br only when the zstandard / brotli packages are
+installed) and compresses responses above a size threshold. Streaming
+responses are compressed chunk by chunk and flushed after every chunk, so
+clients still see each chunk as soon as it is produced.
+
+RequestDecompressionMiddleware accepts request bodies sent with a
+Content-Encoding (gzip, deflate, br, zstd) on selected paths, so large
+uploads such as tables_info or analysis_data can be sent compressed. Every
+decoder is driven with a cap on its output per step and both the compressed
+and the decompressed size are limited, so oversized uploads and compression
+bombs are rejected without being buffered or expanded in full.
+
+Both middlewares hand bodies of at least offload_size bytes to a worker
+thread, so compressing or decoding a large payload does not stall the event
+loop for every other request.
+"""
+import asyncio
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: br is simply not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd is simply not offered
+    zstandard = None
+
+# Content types worth compressing (prefix match)
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript",
+                      "application/xml", "text/")
+# Server preference when the client accepts several encodings equally
+PREFERRED_ENCODINGS = ("zstd", "br", "gzip")
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+# Bodies at least this large are (de)compressed in a worker thread
+OFFLOAD_SIZE = 256 * 1024
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encodings() -> List[str]:
+    """Response encodings this process can produce, in preference order"""
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [name for name in PREFERRED_ENCODINGS if installed[name]]
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Iterable[str]) -> Optional[str]:
+    """Best encoding from an Accept-Encoding header, or None for identity"""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name] = quality
+    best, best_quality = None, 0.0
+    for name in encodings:
+        quality = weights.get(name, weights.get("*", 0.0))
+        # Strictly greater keeps the server preference on ties
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses of at least minimum_size bytes"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_level: int = 5,
+                 zstd_level: int = 3, encodings: Optional[Iterable[str]] = None,
+                 offload_size: int = OFFLOAD_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.levels = {"gzip": gzip_level, "br": brotli_level, "zstd": zstd_level}
+        self.encodings = [e for e in (encodings or available_encodings()) if e in available_encodings()]
+
+    def _encoder(self, encoding: str):
+        level = self.levels[encoding]
+        if encoding == "zstd":
+            return _ZstdEncoder(level)
+        if encoding == "br":
+            return _BrotliEncoder(level)
+        return _GzipEncoder(level)
+
+    async def _encode(self, encoder, body: bytes, more_body: bool) -> bytes:
+        def encode():
+            return encoder.compress(body) + (encoder.flush() if more_body else encoder.finish())
+
+        if len(body) >= self.offload_size:
+            return await asyncio.to_thread(encode)
+        return encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(_header(scope.get("headers", []), b"accept-encoding") or "", self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = message.get("headers", [])
+                content_type = _header(headers, b"content-type") or ""
+                passthrough = (
+                    _header(headers, b"content-encoding") is not None
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or message["status"] in (204, 304)
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    # Whole response is small: send it as is
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = self._encoder(encoding)
+                headers = [
+                    (k, v) for k, v in start_message.get("headers", [])
+                    if k.lower() not in (b"content-length", b"content-encoding")
+                ]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                vary = _header(headers, b"vary")
+                if vary is None:
+                    headers.append((b"vary", b"Accept-Encoding"))
+                elif "accept-encoding" not in vary.lower():
+                    headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+                    headers.append((b"vary", f"{vary}, Accept-Encoding".encode("latin-1")))
+                if not more_body:
+                    compressed = await self._encode(encoder, body, more_body=False)
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send(dict(start_message, headers=headers))
+                    await send({"type": "http.response.body", "body": compressed, "more_body": False})
+                    return
+                await send(dict(start_message, headers=headers))
+            chunk = await self._encode(encoder, body, more_body)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+
+class RequestBodyTooLarge(ValueError):
+    pass
+
+
+def _zlib_output(body: bytes, wbits: int) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(wbits)
+    for offset in range(0, len(body), DECOMPRESS_CHUNK_SIZE):
+        chunk = body[offset:offset + DECOMPRESS_CHUNK_SIZE]
+        while chunk:
+            yield decompressor.decompress(chunk, DECOMPRESS_CHUNK_SIZE)
+            chunk = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+def _brotli_output(body: bytes) -> Iterator[bytes]:
+    decompressor = brotli.Decompressor()
+    for offset in range(0, len(body), DECOMPRESS_CHUNK_SIZE):
+        data = decompressor.process(body[offset:offset + DECOMPRESS_CHUNK_SIZE],
+                                    output_buffer_limit=DECOMPRESS_CHUNK_SIZE)
+        yield data
+        # Output held back by the limit comes out of calls without input
+        while data and not decompressor.is_finished():
+            data = decompressor.process(b"", output_buffer_limit=DECOMPRESS_CHUNK_SIZE)
+            yield data
+
+
+def _zstd_output(body: bytes) -> Iterator[bytes]:
+    with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+        while True:
+            data = reader.read(DECOMPRESS_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+
+def _decompressed_chunks(body: bytes, encoding: str) -> Optional[Iterator[bytes]]:
+    """Decompressed body in chunks of at most about DECOMPRESS_CHUNK_SIZE bytes, or None if unsupported
+
+    Every decoder caps the output of each step, so a compression bomb is
+    stopped as soon as it passes the size limit instead of being expanded
+    in full first. brotli releases before 1.2 cannot cap their output, so br
+    request bodies need brotli >= 1.2.
+    """
+    if encoding in ("gzip", "x-gzip"):
+        return _zlib_output(body, 47)  # gzip or zlib header, detected automatically
+    if encoding == "deflate":
+        return _zlib_output(body, zlib.MAX_WBITS)
+    # can_accept_more_data() came with output_buffer_limit in brotli 1.2
+    if encoding == "br" and brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data"):
+        return _brotli_output(body)
+    if encoding == "zstd" and zstandard is not None:
+        return _zstd_output(body)
+    return None
+
+
+def decompress_body(body: bytes, encoding: str, max_size: int) -> bytes:
+    """Decompress a request body, raising RequestBodyTooLarge past max_size bytes"""
+    chunks = _decompressed_chunks(body, encoding)
+    if chunks is None:
+        raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+    output = []
+    size = 0
+    for data in chunks:
+        size += len(data)
+        if size > max_size:
+            raise RequestBodyTooLarge(f"Decompressed request body exceeds {max_size} bytes")
+        output.append(data)
+    return b"".join(output)
+
+
+class RequestDecompressionMiddleware:
+    """ASGI middleware decoding Content-Encoding request bodies on the given paths"""
+
+    def __init__(self, app, paths: Iterable[str], max_size: int = 50 * 1024 * 1024,
+                 max_compressed_size: Optional[int] = None, offload_size: int = OFFLOAD_SIZE):
+        self.app = app
+        self.paths = set(paths)
+        self.max_size = max_size
+        # The compressed body is buffered before decoding, so it is capped too
+        self.max_compressed_size = max_size if max_compressed_size is None else max_compressed_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = scope.get("headers", [])
+        encoding = (_header(headers, b"content-encoding") or "identity").strip().lower()
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        too_large = f"Compressed request body exceeds {self.max_compressed_size} bytes"
+        declared = _header(headers, b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_compressed_size:
+            await self._send_error(send, 413, too_large)
+            return
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_compressed_size:
+                # Stop reading: the rest of the upload is never buffered
+                await self._send_error(send, 413, too_large)
+                return
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        compressed = b"".join(chunks)
+        try:
+            if len(compressed) >= self.offload_size:
+                body = await asyncio.to_thread(decompress_body, compressed, encoding, self.max_size)
+            else:
+                body = decompress_body(compressed, encoding, self.max_size)
+        except RequestBodyTooLarge as e:
+            await self._send_error(send, 413, str(e))
+            return
+        except ValueError as e:
+            await self._send_error(send, 415, str(e))
+            return
+        except Exception as e:
+            await self._send_error(send, 400, f"Could not decompress {encoding} request body: {e}")
+            return
+
+        headers = [
+            (k, v) for k, v in headers if k.lower() not in (b"content-encoding", b"content-length")
+        ]
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        body_sent = False
+
+        async def decompressed_receive():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(dict(scope, headers=headers), decompressed_receive, send)
+
+    @staticmethod
+    async def _send_error(send, status: int, detail: str):
+        payload = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(payload)).encode("latin-1"))],
+        })
+        await send({"type": "http.response.body", "body": payload})
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Small dependency-driven DAG executor for analysis pipelines
+
+Stages declare the names of their inputs (other stages or values passed in the
+run context). A stage starts as soon as all of its inputs are available, so
+independent stages run concurrently; a process-wide budget caps how many
+stages execute at once across all pipelines. Stages can have a timeout,
+retries, a skip condition and a cache key that lets a cache (for example a
+run checkpoint) satisfy the stage without executing it.
+"""
+import asyncio
+import inspect
+import os
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+
+class SkipStage(Exception):
+    """Raise inside a stage to skip it and every stage depending on it"""
+
+
+class StageFailed(Exception):
+    """A stage failed after exhausting its retries"""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+class Stage:
+    """One node of a DAG"""
+
+    def __init__(self, name: str, func: Callable, inputs: Iterable[str] = (), timeout: Optional[float] = None,
+                 retries: int = 0, retry_delay: float = 1.0, blocking: bool = False,
+                 when: Optional[Callable[..., bool]] = None,
+                 cache_key: Optional[Union[str, Callable[..., str]]] = None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.blocking = blocking
+        self.when = when
+        self.cache_key = cache_key
+
+    def resolve_cache_key(self, kwargs: Dict[str, Any]) -> Optional[str]:
+        if self.cache_key is None:
+            return None
+        if callable(self.cache_key):
+            return self.cache_key(**kwargs)
+        return self.cache_key
+
+
+class DAGResult:
+    """Stage outputs plus per-stage status and timings"""
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.status: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.results.get(name, default)
+
+    def ran(self, name: str) -> bool:
+        return self.status.get(name) in ("done", "cached")
+
+
+_budgets: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def get_stage_budget() -> asyncio.Semaphore:
+    """Process-wide cap on concurrently executing stages (PIPELINE_MAX_CONCURRENT_STAGES)"""
+    loop = asyncio.get_running_loop()
+    budget = _budgets.get(loop)
+    if budget is None:
+        budget = asyncio.Semaphore(int(os.getenv("PIPELINE_MAX_CONCURRENT_STAGES", 16)))
+        _budgets[loop] = budget
+    return budget
+
+
+class DAG:
+    """A set of stages wired together by their declared inputs"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: Dict[str, Stage] = {}
+
+    def add_stage(self, name: str, func: Callable, inputs: Iterable[str] = (), **options) -> Stage:
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage '{name}' in DAG '{self.name}'")
+        stage = Stage(name, func, inputs, **options)
+        self.stages[name] = stage
+        return stage
+
+    def stage(self, name: Optional[str] = None, inputs: Iterable[str] = (), **options):
+        """Decorator form of add_stage()"""
+        def decorator(func):
+            self.add_stage(name or func.__name__, func, inputs, **options)
+            return func
+        return decorator
+
+    def topological_order(self, context: Iterable[str] = ()) -> List[str]:
+        """Stage names in dependency order; raises ValueError on unknown inputs or cycles"""
+        available = set(context)
+        for stage in self.stages.values():
+            missing = [i for i in stage.inputs if i not in self.stages and i not in available]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' has unknown inputs: {', '.join(missing)}")
+        order, done, visiting = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected in DAG '{self.name}' at stage '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].inputs:
+                if dependency in self.stages:
+                    visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def run(self, context: Optional[Dict[str, Any]] = None, cache=None) -> DAGResult:
+        """Execute every stage; returns a DAGResult or raises StageFailed
+
+        cache, if given, needs load(key) -> value or None and save(key, value).
+        """
+        context = dict(context or {})
+        self.topological_order(context)
+        result = DAGResult()
+        events = {name: asyncio.Event() for name in self.stages}
+
+        async def run_stage(stage: Stage):
+            for dependency in stage.inputs:
+                if dependency in events:
+                    await events[dependency].wait()
+            try:
+                if any(result.status.get(d) in ("skipped", "failed") for d in stage.inputs if d in self.stages):
+                    result.status[stage.name] = "skipped"
+                    return
+                kwargs = {
+                    d: result.results[d] if d in self.stages else context[d]
+                    for d in stage.inputs
+                }
+                if stage.when is not None and not stage.when(**kwargs):
+                    result.status[stage.name] = "skipped"
+                    return
+                await self._execute(stage, kwargs, result, cache)
+            finally:
+                events[stage.name].set()
+
+        tasks = [asyncio.ensure_future(run_stage(stage)) for stage in self.stages.values()]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return result
+
+    async def _execute(self, stage: Stage, kwargs: Dict[str, Any], result: DAGResult, cache):
+        cache_key = stage.resolve_cache_key(kwargs) if cache is not None else None
+        if cache_key is not None:
+            cached = cache.load(cache_key)
+            if cached is not None:
+                result.results[stage.name] = cached
+                result.status[stage.name] = "cached"
+                result.timings[stage.name] = 0.0
+                return
+
+        started = time.perf_counter()
+        async with get_stage_budget():
+            for attempt in range(stage.retries + 1):
+                try:
+                    value = await self._call(stage, kwargs)
+                    break
+                except SkipStage:
+                    result.status[stage.name] = "skipped"
+                    result.timings[stage.name] = time.perf_counter() - started
+                    return
+                except Exception as e:
+                    if attempt == stage.retries:
+                        result.status[stage.name] = "failed"
+                        result.timings[stage.name] = time.perf_counter() - started
+                        raise StageFailed(stage.name, e) from e
+                    print(f"[{self.name}] stage {stage.name} attempt {attempt + 1} failed: {e}")
+                    await asyncio.sleep(stage.retry_delay * (2 ** attempt))
+
+        result.results[stage.name] = value
+        result.status[stage.name] = "done"
+        result.timings[stage.name] = time.perf_counter() - started
+        if cache_key is not None:
+            cache.save(cache_key, value)
+
+    @staticmethod
+    async def _call(stage: Stage, kwargs: Dict[str, Any]) -> Any:
+        async def invoke():
+            if stage.blocking:
+                # Synchronous clients run in a worker thread so the event loop stays responsive
+                return await asyncio.to_thread(stage.func, **kwargs)
+            value = stage.func(**kwargs)
+            if inspect.isawaitable(value):
+                value = await value
+            return value
+
+        if stage.timeout:
+            return await asyncio.wait_for(invoke(), timeout=stage.timeout)
+        return await invoke()
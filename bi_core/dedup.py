@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Near-duplicate question clustering before question validation
+
+Audience analyses for neighbouring markets (and the personas within one
+market) ask many of the same questions in slightly different words. Each one
+costs a question_check model call, so questions are clustered first and only
+one representative per cluster is validated; its report is then copied to
+every member of the cluster with the member's own question fields.
+
+Similarity is TF-IDF cosine over character n-grams of the normalized text
+(NFKC, case-folded, punctuation dropped), which needs no tokenizer and works
+for Chinese (with shorter n-grams) as well as English. Clustering is greedy:
+a question joins the most similar existing representative at or above the
+threshold, otherwise it becomes a representative itself, so the earliest
+phrasing always represents its cluster and results are deterministic.
+Questions that mention different numbers ("last 6 months" / "last 12
+months") or opposite directions ("highest" / "lowest", "above" / "below",
+"increase" / "decrease") are never merged: they differ in a single word, so
+their n-grams are nearly the same, but they need different queries.
+
+QUESTION_DEDUP_THRESHOLD (default 0.8) sets the similarity threshold; a
+value of 1 or more only merges questions that are identical once normalized,
+and QUESTION_DEDUP=false disables clustering altogether.
+"""
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_DEDUP_THRESHOLD = 0.8
+NGRAM_RANGE = (3, 5)
+CJK_NGRAM_RANGE = (2, 3)
+
+_WORD = re.compile(r"\w+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+
+# Direction and comparison words by the direction they ask for; questions
+# only merge when they ask for the same directions
+DIRECTION_WORDS = {
+    "max": """highest higher high top most more maximum max largest larger biggest bigger greatest greater best
+              better above exceed exceeds exceeding 最高 最多 最大 最好 高于 超过 多于""",
+    "min": """lowest lower low bottom least less fewest fewer minimum min smallest smaller worst worse below
+              under cheapest cheaper 最低 最少 最小 最差 低于 少于""",
+    "up": """increase increases increased increasing rise rises rising grow grows growing growth gain gains
+             增加 增长 上升 上涨""",
+    "down": """decrease decreases decreased decreasing decline declines declining drop drops dropping fall falls
+               falling shrink shrinking 减少 下降 下跌 降低""",
+}
+_DIRECTIONS = {word: direction for direction, words in DIRECTION_WORDS.items() for word in words.split()}
+_CJK_DIRECTIONS = [(word, direction) for word, direction in _DIRECTIONS.items() if _CJK.search(word)]
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form of a question: NFKC, case-folded, words separated by single spaces"""
+    return " ".join(_WORD.findall(unicodedata.normalize("NFKC", text or "").casefold()))
+
+
+def question_key(normalized: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """(numbers, directions) of a normalized question; questions with different keys never merge"""
+    numbers = tuple(sorted(_NUMBER.findall(normalized)))
+    directions = {_DIRECTIONS[word] for word in normalized.split() if word in _DIRECTIONS}
+    directions.update(direction for word, direction in _CJK_DIRECTIONS if word in normalized)
+    return numbers, tuple(sorted(directions))
+
+
+def _ngrams(normalized: str) -> Counter:
+    """Character n-grams of every word, padded with spaces at the word boundaries"""
+    grams: Counter = Counter()
+    for word in normalized.split():
+        # CJK text has no word breaks and one character carries a whole word's meaning
+        low, high = CJK_NGRAM_RANGE if _CJK.search(word) else NGRAM_RANGE
+        padded = f" {word} "
+        for n in range(low, high + 1):
+            for start in range(len(padded) - n + 1):
+                grams[padded[start:start + n]] += 1
+    return grams
+
+
+class QuestionClusterer:
+    """Assigns questions to clusters of near-duplicates, across any number of calls
+
+    Keep one instance for a whole run so questions repeated by later markets
+    join the clusters of earlier ones. Cluster ids are consecutive integers
+    in order of first appearance.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_DEDUP_THRESHOLD, enabled: bool = True):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.seen = 0
+        # Per cluster: representative's normalized text, n-gram counts and question_key
+        self._texts: List[str] = []
+        self._grams: List[Counter] = []
+        self._keys: List[Tuple[Tuple[str, ...], Tuple[str, ...]]] = []
+        self._exact: Dict[str, int] = {}
+        # Document frequency over every question seen, for the IDF weights
+        self._df: Counter = Counter()
+
+    @classmethod
+    def from_env(cls) -> "QuestionClusterer":
+        return cls(
+            threshold=float(os.getenv("QUESTION_DEDUP_THRESHOLD", DEFAULT_DEDUP_THRESHOLD)),
+            enabled=os.getenv("QUESTION_DEDUP", "true").lower() not in ("0", "false", "no", "off"),
+        )
+
+    @property
+    def clusters(self) -> int:
+        return len(self._texts)
+
+    def _idf(self, gram: str) -> float:
+        # Smoothed IDF: grams that occur in every question still count a little
+        return math.log((1 + self.seen) / (1 + self._df[gram])) + 1
+
+    def _vector(self, grams: Counter) -> Dict[str, float]:
+        weights = {gram: (1 + math.log(count)) * self._idf(gram) for gram, count in grams.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {gram: w / norm for gram, w in weights.items()}
+
+    def _new_cluster(self, normalized: str, grams: Counter, key: Tuple[Tuple[str, ...], Tuple[str, ...]]) -> int:
+        cluster_id = len(self._texts)
+        self._texts.append(normalized)
+        self._grams.append(grams)
+        self._keys.append(key)
+        self._exact[normalized] = cluster_id
+        return cluster_id
+
+    def assign(self, questions: Sequence[str]) -> List[int]:
+        """Cluster id of every question, creating clusters for new ones"""
+        normalized = [normalize_question(q) for q in questions]
+        grams = [_ngrams(text) for text in normalized]
+        self.seen += len(normalized)
+        for counts in grams:
+            self._df.update(counts.keys())
+
+        # IDF changes as questions are added, so representatives are re-weighted per call
+        representatives = [self._vector(g) for g in self._grams]
+        cluster_ids = []
+        for text, counts in zip(normalized, grams):
+            if not self.enabled:
+                cluster_ids.append(self._new_cluster(text, counts, ((), ())))
+                continue
+            if text in self._exact:
+                cluster_ids.append(self._exact[text])
+                continue
+            key = question_key(text)
+            vector = self._vector(counts)
+            best, best_score = None, self.threshold
+            if self.threshold < 1:
+                for cluster_id, representative in enumerate(representatives):
+                    if self._keys[cluster_id] != key:
+                        continue
+                    score = sum(w * representative.get(gram, 0.0) for gram, w in vector.items())
+                    if score >= best_score:
+                        best, best_score = cluster_id, score
+            if best is None:
+                best = self._new_cluster(text, counts, key)
+                representatives.append(vector)
+            cluster_ids.append(best)
+        return cluster_ids
+
+
+def pick_representatives(questions: Sequence[Dict[str, Any]], cluster_ids: Sequence[int],
+                         reports: Dict[int, Dict[str, Any]]) -> List[Tuple[int, Dict[str, Any]]]:
+    """(cluster id, question) of the first question of every cluster that has no report yet"""
+    picked: Dict[int, Dict[str, Any]] = {}
+    for question, cluster_id in zip(questions, cluster_ids):
+        if cluster_id not in reports and cluster_id not in picked:
+            picked[cluster_id] = question
+    return list(picked.items())
+
+
+def fan_out(questions: Sequence[Dict[str, Any]], cluster_ids: Sequence[int],
+            reports: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One report per question: its cluster's report with the question's own fields
+
+    Every report gets cluster_id; reports copied from another question also
+    get representative_question, the question that was actually validated.
+    """
+    fanned = []
+    for question, cluster_id in zip(questions, cluster_ids):
+        report = dict(reports[cluster_id])
+        validated = report.get("question")
+        report.update(question)
+        report["cluster_id"] = cluster_id
+        if validated is not None and validated != question.get("question"):
+            report["representative_question"] = validated
+        fanned.append(report)
+    return fanned
+
+
+def validate_deduplicated(questions: Sequence[Dict[str, Any]], check: Callable[[Dict[str, Any]], Dict[str, Any]],
+                          clusterer: Optional[QuestionClusterer] = None,
+                          reports: Optional[Dict[int, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """check() one representative per cluster and return a report for every question
+
+    Pass the same clusterer and reports dict to later calls to reuse reports
+    of questions validated earlier.
+    """
+    clusterer = clusterer or QuestionClusterer.from_env()
+    reports = {} if reports is None else reports
+    cluster_ids = clusterer.assign([q.get("question", "") for q in questions])
+    for cluster_id, question in pick_representatives(questions, cluster_ids, reports):
+        reports[cluster_id] = check(question)
+    return fan_out(questions, cluster_ids, reports)
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming export of stored analysis results as NDJSON, CSV or Parquet
+
+A stored run result is one JSON document (see GET /runs/{run_id}/result).
+Analysts usually want one list in it as a table: the validation reports,
+the valued questions of every audience, the market segments or the data
+compliance audits. export_section() turns such a list into a stream of
+chunks without decoding the document: the stored JSON text is scanned in
+place (iter_items) and only the item being written is decoded, so memory
+stays bounded by the stored text plus the largest single item rather than
+the whole decoded result. The text itself is held in memory (the scanner
+needs random access to it and CSV/Parquet read it twice), so callers should
+refuse results above a size limit before loading them.
+
+Integrated analysis and /analyze runs keep these lists under different
+keys, so every section names where to find it in either layout. A result
+with none of them (audits of an integrated run, which does not audit)
+raises MissingSection.
+
+Items become flat rows: top-level keys are columns, nested objects and
+lists are written as JSON text. CSV and Parquet need their columns (and
+Parquet its column types) before the first row, so the section is scanned
+twice: once to collect the columns, once to write the rows. Columns whose
+values mix types are written as text.
+
+Parquet export needs pyarrow (optional dependency); every batch of rows is
+written as one row group and sent as soon as it is encoded.
+"""
+import csv
+import io
+import re
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
+
+from bi_core.projection import WILDCARD, parse_pointer
+
+
+def _pyarrow():
+    """pyarrow with its Parquet writer, or None when it is not installed
+
+    Imported on first use rather than with this module: pyarrow (and numpy
+    with it) is the slowest import of the API, and only Parquet export needs it.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # optional: Parquet export is unavailable without it
+        return None
+    return pyarrow
+
+
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Text formats are sent in chunks of about this many bytes
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Rows per Parquet row group
+EXPORT_BATCH_ROWS = 10000
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Next bracket, skipping over strings (which may contain brackets) and everything else
+_BRACKET = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*([\[\]{}])', re.DOTALL)
+_SCALAR_END = re.compile(rb"[,\]}\s]|$")
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+
+class ExportError(ValueError):
+    """Unknown section or format, or a malformed stored result"""
+
+
+# ---------------------------------------------------------------------------
+# Incremental scan of the stored JSON text
+# ---------------------------------------------------------------------------
+
+def _skip_whitespace(document, position: int) -> int:
+    return _WHITESPACE.match(document, position).end()
+
+
+def _value_end(document, position: int) -> int:
+    """End of the JSON value starting at position (which is not whitespace)"""
+    first = document[position:position + 1]
+    if first == b'"':
+        match = _STRING.match(document, position)
+        if match is None:
+            raise ExportError("Unterminated string in stored result")
+        return match.end()
+    if first in (b"{", b"["):
+        depth = 0
+        while True:
+            match = _BRACKET.match(document, position)
+            if match is None:
+                raise ExportError("Unterminated object or array in stored result")
+            position = match.end()
+            if match.group(1) in (b"{", b"["):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return position
+    return _SCALAR_END.search(document, position).start()
+
+
+def _walk(document, position: int, tokens: Sequence[str]) -> Generator[Tuple[int, int], None, int]:
+    """Yield the (start, end) spans selected by tokens in the value at position; return the value's end
+
+    Every part of the document is scanned once: children that are not
+    selected are skipped, selected ones are walked into.
+    """
+    if not tokens:
+        end = _value_end(document, position)
+        yield position, end
+        return end
+    opening = document[position:position + 1]
+    if opening not in (b"{", b"["):
+        return _value_end(document, position)
+    closing = b"}" if opening == b"{" else b"]"
+    token, rest = tokens[0], tokens[1:]
+    position = _skip_whitespace(document, position + 1)
+    if document[position:position + 1] == closing:
+        return position + 1
+    index = 0
+    while True:
+        if opening == b"{":
+            key_end = _value_end(document, position)
+            key = orjson.loads(document[position:key_end])
+            position = _skip_whitespace(document, key_end)
+            if document[position:position + 1] != b":":
+                raise ExportError("Expected ':' in stored result")
+            position = _skip_whitespace(document, position + 1)
+        else:
+            key = str(index)
+            index += 1
+        if token == WILDCARD or key == token:
+            end = yield from _walk(document, position, rest)
+        else:
+            end = _value_end(document, position)
+        position = _skip_whitespace(document, end)
+        separator = document[position:position + 1]
+        if separator == closing:
+            return position + 1
+        if separator != b",":
+            raise ExportError("Expected ',' in stored result")
+        position = _skip_whitespace(document, position + 1)
+
+
+def iter_items(document, pointer: str) -> Iterator[Any]:
+    """Decoded values selected by a JSON pointer ("*" matches every element), one at a time
+
+    Only the selected values are decoded; everything else in the document
+    is skipped over as text.
+    """
+    view = memoryview(document)
+    start = _skip_whitespace(document, 0)
+    if start >= len(document):
+        return
+    for begin, end in _walk(document, start, parse_pointer(pointer)):
+        yield orjson.loads(view[begin:end])
+
+
+# ---------------------------------------------------------------------------
+# Rows
+# ---------------------------------------------------------------------------
+
+def flatten(item: Any) -> Dict[str, Any]:
+    """Flat row of an item: scalars as they are, nested values as JSON text"""
+    if not isinstance(item, dict):
+        item = {"value": item}
+    return {key: value if value is None or isinstance(value, (str, int, float, bool))
+            else orjson.dumps(value).decode("utf-8")
+            for key, value in item.items()}
+
+
+def _kind(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int" if _INT64[0] <= value <= _INT64[1] else "string"
+    if isinstance(value, float):
+        return "float"
+    return "string"
+
+
+def _merge_kinds(current: Optional[str], new: Optional[str]) -> Optional[str]:
+    if current is None or current == new:
+        return new or current
+    if new is None:
+        return current
+    if {current, new} == {"int", "float"}:
+        return "float"
+    return "string"
+
+
+def column_kinds(rows: Iterator[Dict[str, Any]]) -> Dict[str, str]:
+    """Columns in order of first appearance and the type of their values (bool, int, float or string)"""
+    kinds: Dict[str, Optional[str]] = {}
+    for row in rows:
+        for column, value in row.items():
+            kinds[column] = _merge_kinds(kinds.get(column), _kind(value))
+    return {column: kind or "string" for column, kind in kinds.items()}
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else orjson.dumps(value).decode("utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Formats
+# ---------------------------------------------------------------------------
+
+def _ndjson(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for row in rows:
+        buffer += orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _csv(rows: Callable[[], Iterator[Dict[str, Any]]]) -> Iterator[bytes]:
+    columns = list(column_kinds(rows()))
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for row in rows():
+        writer.writerow([_text(row.get(column)) for column in columns])
+        if text.tell() >= EXPORT_CHUNK_SIZE:
+            yield text.getvalue().encode("utf-8")
+            text.seek(0)
+            text.truncate()
+    if text.tell():
+        yield text.getvalue().encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file that hands out what was written since the last take()
+
+    The position keeps counting across take() calls, as the Parquet writer
+    records the file offsets of its row groups.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_value(value: Any, kind: str) -> Any:
+    if value is None:
+        return None
+    if kind == "string":
+        return _text(value)
+    return float(value) if kind == "float" else value
+
+
+def _parquet(rows: Callable[[], Iterator[Dict[str, Any]]]) -> Iterator[bytes]:
+    pyarrow = _pyarrow()
+    kinds = column_kinds(rows())
+    types = {"bool": pyarrow.bool_(), "int": pyarrow.int64(), "float": pyarrow.float64(), "string": pyarrow.string()}
+    schema = pyarrow.schema([(column, types[kind]) for column, kind in kinds.items()])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), schema, compression="zstd")
+
+    def write(batch: List[Dict[str, Any]]):
+        columns = {column: [_arrow_value(row.get(column), kind) for row in batch] for column, kind in kinds.items()}
+        writer.write_batch(pyarrow.RecordBatch.from_pydict(columns, schema=schema))
+
+    batch: List[Dict[str, Any]] = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            write(batch)
+            batch = []
+            yield sink.take()
+    if batch:
+        write(batch)
+    writer.close()
+    yield sink.take()
+
+
+# ---------------------------------------------------------------------------
+# Sections of a stored result
+# ---------------------------------------------------------------------------
+
+def _decoded(value: Any) -> Any:
+    """value, or the object/list if value is JSON text (agent outputs of /analyze are stored as text)"""
+    if isinstance(value, str):
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return value
+    return value
+
+
+def _item_rows(document: bytes, pointer: str) -> Iterator[Dict[str, Any]]:
+    return (flatten(item) for item in iter_items(document, pointer + "/*"))
+
+
+def _market_row(market: Any) -> Dict[str, Any]:
+    if isinstance(market, dict):
+        market = {key: value for key, value in market.items() if key != "customer_analysis"}
+    return flatten(market)
+
+
+def _market_rows(document: bytes, pointer: str) -> Iterator[Dict[str, Any]]:
+    return (_market_row(market) for market in iter_items(document, pointer + "/*"))
+
+
+def _analysis_market_rows(document: bytes, pointer: str) -> Iterator[Dict[str, Any]]:
+    """Market segments of a market analysis stored as one value"""
+    for analysis in iter_items(document, pointer):
+        analysis = _decoded(analysis)
+        if isinstance(analysis, dict):
+            yield from (_market_row(market) for market in analysis.get("market_segments") or [])
+
+
+def _question_table():
+    from bi_core.question_table import QUESTION_COLUMNS, SEGMENT_COLUMNS, QuestionTable
+    return QuestionTable, ("market",) + SEGMENT_COLUMNS + QUESTION_COLUMNS
+
+
+def _market_question_rows(document: bytes, pointer: str) -> Iterator[Dict[str, Any]]:
+    """One row per valued question of the integrated analysis, built a market at a time"""
+    table_class, columns = _question_table()
+    for market in iter_items(document, pointer + "/*"):
+        if not isinstance(market, dict) or not market.get("customer_analysis"):
+            continue
+        table = table_class.from_customer_analysis(market["customer_analysis"], market.get("market_name"))
+        yield from table.records(columns)
+
+
+def _audience_question_rows(document: bytes, pointer: str) -> Iterator[Dict[str, Any]]:
+    """One row per valued question of an audience analysis stored as one value"""
+    table_class, columns = _question_table()
+    for analysis in iter_items(document, pointer):
+        yield from table_class.from_customer_analysis(_decoded(analysis)).records(columns)
+
+
+# Section name -> (JSON pointer, rows of the value there) per result layout:
+# integrated analysis runs first, then /analyze runs. The first pointer
+# present in a stored result is exported.
+EXPORT_SECTIONS: Dict[str, Tuple[Tuple[str, Callable[[bytes, str], Iterator[Dict[str, Any]]]], ...]] = {
+    "validation_reports": (("/validation_reports", _item_rows), ("/question_validation", _item_rows)),
+    "questions": (("/integrated_analysis/markets/market_segments", _market_question_rows),
+                  ("/audience_analysis", _audience_question_rows)),
+    "markets": (("/market_segments", _market_rows), ("/market_analysis", _analysis_market_rows)),
+    "audits": (("/data_compliance/tables_audited", _item_rows),),
+}
+
+
+class MissingSection(ExportError):
+    """The stored result has no data for the section (answered with 404)"""
+
+
+def _present(document: bytes, pointer: str) -> bool:
+    start = _skip_whitespace(document, 0)
+    return start < len(document) and next(_walk(document, start, parse_pointer(pointer)), None) is not None
+
+
+def export_section(document: bytes, section: str, export_format: str) -> Iterator[bytes]:
+    """Chunks of one section of a stored result in the given format
+
+    Raises ExportError for an unknown section or format, MissingSection when
+    the result has no such section and ImportError for Parquet without
+    pyarrow, before anything is produced.
+    """
+    if section not in EXPORT_SECTIONS:
+        raise ExportError(f"Unknown export section: {section}")
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format: {export_format}")
+    if export_format == "parquet" and _pyarrow() is None:
+        raise ImportError("pyarrow is required for Parquet export")
+    source = next(((pointer, rows) for pointer, rows in EXPORT_SECTIONS[section] if _present(document, pointer)), None)
+    if source is None:
+        raise MissingSection(f"This run has no {section}")
+    pointer, rows = source
+    if export_format == "ndjson":
+        return _ndjson(rows(document, pointer))
+    if export_format == "csv":
+        return _csv(lambda: rows(document, pointer))
+    return _parquet(lambda: rows(document, pointer))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fast JSON serialization for large analysis responses
+
+FastJSONResponse serializes with orjson when it is installed (stdlib json
+otherwise) and skips FastAPI's jsonable_encoder pass when an endpoint returns
+it directly. Values that already exist as JSON text, such as stored run
+results or a coalesced run's serialized output, are wrapped in RawJSON and
+spliced into the response bytes as they are, without being decoded and
+encoded again.
+"""
+import json
+import re
+import secrets
+from typing import Any, List, Union
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+
+class RawJSON:
+    """A value that is already serialized JSON text, emitted verbatim by dumps()
+
+    value optionally keeps the object data was serialized from, so callers
+    that need to look inside do not have to decode it again.
+    """
+
+    __slots__ = ("data", "value")
+
+    def __init__(self, data: Union[bytes, str], value: Any = None):
+        self.data = data.encode("utf-8") if isinstance(data, str) else data
+        self.value = value
+
+    def decoded(self) -> Any:
+        if self.value is None:
+            self.value = loads(self.data)
+        return self.value
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return f"RawJSON({len(self.data)} bytes)"
+
+
+def _plain(value: Any) -> Any:
+    """Types neither encoder handles natively"""
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+def _encode(value: Any, default) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=default, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON for value, with RawJSON values spliced in unchanged"""
+    if isinstance(value, RawJSON):
+        return value.data
+    fragments: List[bytes] = []
+    # Both encoders escape NUL, so a raw NUL byte never occurs in their output
+    # on its own; the nonce keeps user strings from matching the placeholder
+    nonce = secrets.token_hex(8)
+
+    def default(obj):
+        if isinstance(obj, RawJSON):
+            fragments.append(obj.data)
+            return f"\x00{nonce}:{len(fragments) - 1}"
+        return _plain(obj)
+
+    encoded = _encode(value, default)
+    if not fragments:
+        return encoded
+    placeholder = re.compile(rb'"\\u0000' + nonce.encode("ascii") + rb':(\d+)"')
+    return placeholder.sub(lambda match: fragments[int(match.group(1))], encoded)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps(), so content may contain RawJSON values"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
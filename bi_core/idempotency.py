@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Idempotency-Key support for POST endpoints
+
+Clients that retry after a proxy timeout send the same Idempotency-Key header.
+The first request with a key runs normally and its final response is stored in
+SQLite; a retry replays the stored response, or waits for the execution that
+is still running, instead of starting the multi-minute pipeline again.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAY_HEADER = "idempotent-replayed"
+
+
+class IdempotencyStore:
+    """SQLite-backed record of in-progress and completed keyed requests"""
+
+    def __init__(self, db_path: str = "idempotency.db", ttl_seconds: float = 86400,
+                 lock_seconds: float = 1800):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyStore":
+        """Build a store from IDEMPOTENCY_DB, IDEMPOTENCY_TTL_SECONDS and IDEMPOTENCY_LOCK_SECONDS"""
+        return cls(
+            db_path=os.getenv("IDEMPOTENCY_DB", "idempotency.db"),
+            ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400)),
+            lock_seconds=float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 1800)),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing the app does not touch the filesystem
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    key TEXT PRIMARY KEY,
+                    request_hash TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    status_code INTEGER,
+                    headers TEXT,
+                    body BLOB,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def open(self):
+        """Open the database now (e.g. during warm-up) instead of on first use"""
+        with self._lock:
+            self._connection()
+        return self
+
+    def begin(self, key: str, request_hash: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Claim a key; returns (state, record)
+
+        state is "new" when the caller should execute the request, otherwise
+        "in_progress", "completed" or "mismatch" (same key, different body).
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+            # Committed before the early returns below, which would otherwise
+            # hold the write lock and stall the other workers
+            conn.commit()
+            row = conn.execute(
+                "SELECT request_hash, status, status_code, headers, body, created_at "
+                "FROM idempotency_keys WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                stored_hash, status, status_code, headers, body, created_at = row
+                abandoned = status == "in_progress" and now - created_at > self.lock_seconds
+                if not abandoned:
+                    if stored_hash != request_hash:
+                        return "mismatch", None
+                    record = {
+                        "status_code": status_code,
+                        "headers": json.loads(headers) if headers else [],
+                        "body": body,
+                    }
+                    return status, record
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency_keys "
+                "(key, request_hash, status, created_at, expires_at) VALUES (?, ?, 'in_progress', ?, ?)",
+                (key, request_hash, now, now + self.ttl_seconds),
+            )
+            conn.commit()
+        return "new", None
+
+    def complete(self, key: str, status_code: int, headers: List[Tuple[str, str]], body: bytes):
+        """Store the final response for a key"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE idempotency_keys SET status = 'completed', status_code = ?, headers = ?, "
+                "body = ?, expires_at = ? WHERE key = ?",
+                (status_code, json.dumps(headers), body, now + self.ttl_seconds, key),
+            )
+            conn.commit()
+
+    def release(self, key: str):
+        """Forget a key whose execution failed so a retry runs again"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+            conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Current record for a key, if any"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT status, status_code, headers, body FROM idempotency_keys WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, status_code, headers, body = row
+        return {
+            "status": status,
+            "status_code": status_code,
+            "headers": json.loads(headers) if headers else [],
+            "body": body,
+        }
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware applying Idempotency-Key semantics to POST requests
+
+    Only final responses are replayed: 2xx and 4xx responses are stored, while
+    5xx responses release the key so the client's retry executes again; a
+    retry already waiting on the failed execution claims the key and runs.
+    """
+
+    def __init__(self, app, store: Optional[IdempotencyStore] = None, poll_interval: float = 1.0,
+                 wait_timeout: float = 600.0):
+        self.app = app
+        self.store = store or IdempotencyStore.from_env()
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+        self._running: Dict[str, asyncio.Event] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        client_key = None
+        for name, value in scope.get("headers", []):
+            if name.decode("latin-1").lower() == IDEMPOTENCY_HEADER:
+                client_key = value.decode("latin-1").strip()
+                break
+        if not client_key:
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        key = f"{scope['path']}:{client_key}"
+        request_hash = hashlib.sha256(scope["path"].encode("utf-8") + b"\x00" + body).hexdigest()
+
+        # A key released by a failed execution is claimed again by one of the
+        # requests waiting on it, so the client's retry runs instead of failing
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            state, record = await asyncio.to_thread(self.store.begin, key, request_hash)
+            if state == "mismatch":
+                await self._send_json(send, 422, {
+                    "detail": "Idempotency-Key was already used with a different request body"
+                })
+                return
+            if state == "completed":
+                await self._replay(send, record)
+                return
+            if state == "new":
+                break
+            if time.monotonic() >= deadline:
+                await self._send_json(send, 409, {
+                    "detail": "A request with this Idempotency-Key is still in progress"
+                }, [(b"retry-after", str(int(self.poll_interval * 10)).encode())])
+                return
+            record = await self._wait_for(key, deadline)
+            if record is not None:
+                await self._replay(send, record)
+                return
+
+        await self._execute(scope, body, receive, send, key)
+
+    async def _execute(self, scope, body: bytes, receive, send, key: str):
+        done = asyncio.Event()
+        self._running[key] = done
+        status_code = 500
+        response_headers: List[Tuple[str, str]] = []
+        chunks: List[bytes] = []
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message):
+            nonlocal status_code, response_headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = [
+                    (k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture)
+        except BaseException:
+            # Shielded so a cancelled request still frees its key
+            await asyncio.shield(asyncio.to_thread(self.store.release, key))
+            raise
+        else:
+            if status_code >= 500:
+                await asyncio.to_thread(self.store.release, key)
+            else:
+                await asyncio.to_thread(self.store.complete, key, status_code, response_headers,
+                                        b"".join(chunks))
+        finally:
+            done.set()
+            self._running.pop(key, None)
+
+    async def _wait_for(self, key: str, deadline: float) -> Optional[Dict[str, Any]]:
+        """Attach to a running execution (in this process or another worker)
+
+        Returns the completed record, or None when the key should be checked
+        again: it was released, claimed by another retry, or the deadline passed.
+        """
+        local = self._running.get(key)
+        if local is not None:
+            try:
+                await asyncio.wait_for(local.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                return None
+            record = await asyncio.to_thread(self.store.get, key)
+            return record if record and record["status"] == "completed" else None
+        while time.monotonic() < deadline:
+            await asyncio.sleep(max(0.0, min(self.poll_interval, deadline - time.monotonic())))
+            record = await asyncio.to_thread(self.store.get, key)
+            if record is None:
+                return None
+            if record["status"] == "completed":
+                return record
+        return None
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _replay(send, record: Dict[str, Any]):
+        headers = [
+            (k.encode("latin-1"), v.encode("latin-1"))
+            for k, v in record["headers"]
+            if k.lower() != REPLAY_HEADER
+        ]
+        headers.append((REPLAY_HEADER.encode(), b"true"))
+        await send({"type": "http.response.start", "status": record["status_code"], "headers": headers})
+        await send({"type": "http.response.body", "body": record["body"] or b""})
+
+    @staticmethod
+    async def _send_json(send, status_code: int, payload: Dict[str, Any], extra_headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ] + list(extra_headers or [])
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
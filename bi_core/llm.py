@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single entry point for LLM calls made by the analysis services
+
+Agent runs go through run_agent() and direct chat completions through
+chat_completion(), so cross-cutting concerns such as rate limiting, retries,
+circuit breaking and token budgets are applied in one place instead of at
+every call site. The agents SDK is imported on first call, so importing this
+module does not slow down service start-up.
+
+Requests that bring their own OpenAI key run inside use_api_key(); calls made
+in that block (including child tasks and worker threads) pass the key to
+their client explicitly instead of reading the process-wide OPENAI_API_KEY,
+so concurrent requests never call the model with each other's keys.
+"""
+import asyncio
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import replace
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from .rate_limiter import get_rate_limiter
+from .resilience import RetryPolicy, call_with_retry, call_with_retry_async
+from .token_budget import get_token_budget
+from .usage import agent_usage, completion_usage, record_usage
+
+
+def agent_model_name(agent) -> str:
+    """Model name an agent will call (agents may hold a str or a Model object)"""
+    model = getattr(agent, "model", None)
+    if isinstance(model, str):
+        return model
+    return getattr(model, "model", None) or "default"
+
+
+def _agent_result_tokens(result) -> Optional[int]:
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def _completion_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+_request_api_key: ContextVar[Optional[str]] = ContextVar("request_api_key", default=None)
+
+
+@contextmanager
+def use_api_key(api_key: Optional[str]) -> Iterator[None]:
+    """Make LLM calls inside the block (including child tasks) use api_key"""
+    token = _request_api_key.set(api_key or None)
+    try:
+        yield
+    finally:
+        _request_api_key.reset(token)
+
+
+def current_api_key() -> Optional[str]:
+    """Key of the enclosing use_api_key() block, else OPENAI_API_KEY"""
+    return _request_api_key.get() or os.getenv("OPENAI_API_KEY")
+
+
+@lru_cache(maxsize=32)
+def _model_provider(api_key: str):
+    from agents.models.multi_provider import MultiProvider
+
+    return MultiProvider(openai_api_key=api_key)
+
+
+@lru_cache(maxsize=32)
+def _openai_client(api_key: Optional[str]):
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key)
+
+
+def openai_client(api_key: Optional[str] = None):
+    """Shared synchronous OpenAI client for an API key (default: current_api_key())
+
+    Reusing one client per key keeps its connection pool, so repeated calls
+    skip the TCP/TLS handshake.
+    """
+    return _openai_client(api_key or current_api_key())
+
+
+def stage_agent(agent, stage: str, stage_instructions: Optional[str] = None, output_type=None):
+    """Clone of agent for one pipeline stage, laid out for provider prompt caching
+
+    The static stage prompt is appended to the system instructions, so every
+    request for the stage starts with the same long prefix and only the short
+    variable input (market name, data, ...) comes after the session history.
+    prompt_cache_key routes requests of the same stage to the same cache.
+    """
+    from agents import ModelSettings
+
+    changes = {
+        "model_settings": agent.model_settings.resolve(
+            ModelSettings(extra_args={"prompt_cache_key": f"{agent.name}:{stage}"})
+        )
+    }
+    if stage_instructions:
+        changes["instructions"] = f"{agent.instructions}\n\n{stage_instructions}"
+    if output_type is not None:
+        changes["output_type"] = output_type
+    return agent.clone(**changes)
+
+
+async def run_agent(agent, input, timeout: Optional[float] = None,
+                    retry_policy: Optional[RetryPolicy] = None, stage: Optional[str] = None, **kwargs):
+    """Runner.run() behind the shared limiter, retry policy and model circuit breaker
+
+    Hosted MCP and web search tools execute inside the agent run, so their
+    failures surface here and are covered by the same policy. The request is
+    sized before it is sent, and every model call of the run is fitted to the
+    stage's token budget; the limiter reserves the fitted size. Token counting
+    runs in a worker thread. Usage is recorded under stage (default: the
+    agent name). Inside use_api_key() the run's model provider gets that key.
+    """
+    from agents import RunConfig, Runner
+    from agents.run import ModelInputData
+
+    model = agent_model_name(agent)
+    stage = stage or getattr(agent, "name", model)
+    request_key = _request_api_key.get()
+    api_key = current_api_key()
+    instructions = agent.instructions if isinstance(getattr(agent, "instructions", None), str) else None
+    budget = get_token_budget()
+    limiter = get_rate_limiter()
+
+    # Pre-flight: system prompt + stored session history + new input, sized as
+    # the first model call will send it (fails fast if even trimming cannot help)
+    session = kwargs.get("session")
+    history = await session.get_items() if session is not None else []
+    new_items = input if isinstance(input, list) else [{"role": "user", "content": input}]
+    _, estimated, _ = await asyncio.to_thread(budget.fit_items, stage, model, instructions, history + new_items)
+
+    async def attempt():
+        call_estimates = []
+        trimmed = []
+
+        async def fit_model_input(data):
+            model_data = data.model_data
+            items, tokens, changed = await asyncio.to_thread(
+                budget.fit_items, stage, model, model_data.instructions, model_data.input
+            )
+            call_estimates.append(tokens)
+            if not changed:
+                return model_data
+            trimmed.append(tokens)
+            return ModelInputData(input=items, instructions=model_data.instructions)
+
+        run_config = kwargs.get("run_config")
+        if run_config is None:
+            run_config = RunConfig(model_provider=_model_provider(request_key)) if request_key else RunConfig()
+        if run_config.call_model_input_filter is None:
+            run_config = replace(run_config, call_model_input_filter=fit_model_input)
+        run_kwargs = dict(kwargs, run_config=run_config)
+
+        await limiter.acquire_async(model, api_key, estimated)
+        result = await Runner.run(agent, input=input, **run_kwargs)
+        limiter.settle(model, api_key, estimated, _agent_result_tokens(result))
+        requests, input_tokens, cached_tokens, output_tokens = agent_usage(result)
+        record_usage(stage, input_tokens, cached_tokens, output_tokens, requests=requests,
+                     estimated_input_tokens=sum(call_estimates) or estimated, trimmed=bool(trimmed))
+        return result
+
+    return await call_with_retry_async(attempt, model, retry_policy, timeout)
+
+
+def chat_completion(client, model: str, messages: List[Dict[str, Any]],
+                    retry_policy: Optional[RetryPolicy] = None, stage: Optional[str] = None, **kwargs):
+    """client.chat.completions.create() behind the shared limiter, retry policy and circuit breaker
+
+    Messages are fitted to the stage's token budget before sending; usage is
+    recorded under stage (default: the model name). Rate-limit waits and retry
+    back-off sleep in the calling thread, so async code must call this through
+    asyncio.to_thread().
+    """
+    stage = stage or model
+    api_key = getattr(client, "api_key", None)
+    messages, estimated, trimmed = get_token_budget().fit_messages(stage, model, messages)
+    limiter = get_rate_limiter()
+    # Retries are handled by our policy; the SDK's own retries would multiply them
+    if hasattr(client, "with_options"):
+        client = client.with_options(max_retries=0)
+
+    def attempt():
+        limiter.acquire(model, api_key, estimated)
+        response = client.chat.completions.create(model=model, messages=messages, **kwargs)
+        limiter.settle(model, api_key, estimated, _completion_tokens(response))
+        requests, input_tokens, cached_tokens, output_tokens = completion_usage(response)
+        record_usage(stage, input_tokens, cached_tokens, output_tokens, requests=requests,
+                     estimated_input_tokens=estimated, trimmed=trimmed)
+        return response
+
+    return call_with_retry(attempt, model, retry_policy)
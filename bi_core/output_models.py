@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured output models for the analysis agents
+
+Agents that produce JSON declare one of these models as their output_type, so
+the model is constrained to the schema and the SDK hands back a validated
+object instead of free-form text that has to be cleaned and re-parsed. Fields
+that downstream code reads are typed; free-form analysis sections stay dicts
+so the prompts can keep evolving without schema changes.
+"""
+import json
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type, Union
+
+from pydantic import BaseModel, ConfigDict, Field
+
+if TYPE_CHECKING:
+    from agents import AgentOutputSchema
+
+
+class _OutputModel(BaseModel):
+    # Keep any extra keys the model adds instead of dropping them
+    model_config = ConfigDict(extra="allow")
+
+
+# ---------- Schema description ----------
+
+class TableDescription(_OutputModel):
+    table_name: str
+    columns: List[str]
+    sample_data: List[Dict[str, Any]] = Field(default_factory=list)
+
+
+class SchemaTables(_OutputModel):
+    tables: List[TableDescription] = Field(description="Every table in the public schema")
+
+
+class SchemaDescription(_OutputModel):
+    description: SchemaTables
+
+
+# ---------- Market analysis ----------
+
+class MarketSegment(_OutputModel):
+    market_name: str
+    description: str = ""
+    strategy: str = ""
+
+
+class MarketSummary(_OutputModel):
+    headline: str
+    core_insight: str = ""
+    risk_outlook: str = ""
+    strategic_call: str = ""
+
+
+class MarketAnalysis(_OutputModel):
+    market_size_and_growth: Optional[Dict[str, Any]] = None
+    market_structure_and_competition: Optional[Dict[str, Any]] = None
+    demand_and_drivers: Optional[Dict[str, Any]] = None
+    value_chain_and_ecosystem: Optional[Dict[str, Any]] = None
+    trends_and_risks: Optional[Dict[str, Any]] = None
+    strategic_summary: Optional[Dict[str, Any]] = None
+    market_segments: List[MarketSegment] = Field(
+        default_factory=list,
+        description="Target markets worth a dedicated audience analysis, most attractive first"
+    )
+    summary: MarketSummary
+
+
+# ---------- Audience analysis ----------
+
+class SegmentProfile(_OutputModel):
+    industry: str = "Unknown"
+    company_size: str = "Unknown"
+    region: Union[str, List[str]] = "Unknown"
+    roles: Union[str, List[str]] = Field(default_factory=list)
+
+
+class ValuedQuestion(_OutputModel):
+    question: str
+    mapped_pain_point: str = ""
+    problem_type: str = ""
+    monetization_path: Union[str, List[str]] = Field(default_factory=list)
+    decision_value: str = ""
+
+
+class WillingnessToPay(_OutputModel):
+    tier: str = "Unknown"
+    budget_range_usd: str = "Unknown"
+
+
+class AudienceSegment(_OutputModel):
+    segment_name: str
+    profile: SegmentProfile = Field(default_factory=SegmentProfile)
+    valued_questions: List[ValuedQuestion] = Field(default_factory=list)
+    motivation_logic: Optional[Dict[str, Any]] = None
+    value_perception: Optional[Dict[str, Any]] = None
+    willingness_to_pay: WillingnessToPay = Field(default_factory=WillingnessToPay)
+    relationship_channel: Optional[Dict[str, Any]] = None
+
+
+class AudienceSummary(_OutputModel):
+    primary_focus_segment: str = ""
+    top_valued_questions: List[str] = Field(default_factory=list)
+    insight: str = ""
+
+
+class AudienceAnalysis(_OutputModel):
+    segments: List[AudienceSegment]
+    summary: Optional[AudienceSummary] = None
+
+
+# ---------- Brand strategy ----------
+
+class CoreFeature(_OutputModel):
+    feature_title: str
+    intro: str
+
+
+class BrandStrategy(_OutputModel):
+    chatapp_name: str
+    chatapp_description: str
+    chatapp_core_features: List[CoreFeature] = Field(description="Exactly 4 core features")
+
+
+@lru_cache(maxsize=None)
+def structured_output(model: Type[BaseModel]) -> "AgentOutputSchema":
+    """output_type for an agent returning the given model
+
+    The free-form dict sections cannot be expressed in strict JSON schema
+    mode, so the schema is sent non-strict and pydantic validates the result.
+    The schema is built once per model.
+    """
+    from agents import AgentOutputSchema
+
+    return AgentOutputSchema(model, strict_json_schema=False)
+
+
+def output_data(final_output: Any) -> Any:
+    """A run's final_output as plain JSON data (dicts/lists)"""
+    if isinstance(final_output, BaseModel):
+        return final_output.model_dump(mode="json", exclude_none=True)
+    if isinstance(final_output, str):
+        return json.loads(final_output)
+    return final_output
+
+
+def output_json(final_output: Any) -> str:
+    """A run's final_output as a JSON string (what is stored, saved and returned)"""
+    if isinstance(final_output, BaseModel):
+        return final_output.model_dump_json(exclude_none=True)
+    if isinstance(final_output, str):
+        return final_output
+    return json.dumps(final_output, ensure_ascii=False)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rule-based first tier of question validation
+
+QuestionPrecheck answers the obvious questions before question_check is
+asked, using a SchemaIndex of the discovered schema: when every content term
+names a table or column of one table and the question is a plain count
+("how many listings per room type"), ranking ("which neighbourhoods have the
+highest average price"), breakdown ("average minimum nights by room type")
+or trend ("how many reviews per month"), it gets query_type 1 with templated
+SQL. Anything else goes to the model, in particular:
+
+  - terms that only match sample values ("how many listings are in
+    Brooklyn?" needs a filter, not a breakdown by neighbourhood_group);
+  - terms that match nothing: the answer may be in a free-text column whose
+    values are not indexed ("what do guests say about cleanliness?"), so
+    only the model decides query_type 3;
+  - several tables, no recognizable intent, or non-Latin text the index
+    cannot tokenize.
+
+Reports produced here have the same shape as question_check's (the question
+object plus sql_query and query_type) and a precheck entry naming the rule,
+so they flow through SQL validation and fan-out unchanged.
+QUESTION_PRECHECK=false sends every question to the model.
+"""
+import os
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from bi_core.schema_index import (
+    Hit, SchemaIndex, has_cjk, is_identifier_column, is_numeric_type, is_temporal_type, question_terms,
+)
+
+RANK_LIMIT = 10
+
+_COUNT = re.compile(r"\bhow many\b|\bnumber of\b|\bcount\b")
+_RANK = re.compile(r"\b(which|top|highest|lowest|most|least|fewest|best|worst|largest|smallest|biggest"
+                   r"|greatest|cheapest|rank|ranking)\b")
+_ASCENDING = re.compile(r"\b(lowest|least|fewest|worst|smallest|cheapest)\b")
+_TREND = re.compile(r"\b(trends?|over time|month over month|monthly|per month|by month|weekly|per week"
+                    r"|daily|per day|yearly|per year|seasonal|seasonality)\b")
+_BREAKDOWN = re.compile(r"\b(by|per|for each|across)\b")
+_AVERAGE = re.compile(r"\b(average|avg|mean)\b")
+_TOTAL = re.compile(r"\b(total|sum)\b")
+_PERIODS = (("daily", "day"), ("per day", "day"), ("weekly", "week"), ("per week", "week"),
+            ("yearly", "year"), ("per year", "year"))
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class QuestionPrecheck:
+    """Deterministic classifier run before question_check; counts which rule answered each question"""
+
+    def __init__(self, index: SchemaIndex, enabled: bool = True):
+        self.index = index
+        self.enabled = enabled and bool(index)
+        self.counts: Counter = Counter()
+
+    @classmethod
+    def from_schema(cls, schema) -> "QuestionPrecheck":
+        """Classifier over schema analysis output (or an already built SchemaIndex)"""
+        return cls(
+            schema if isinstance(schema, SchemaIndex) else SchemaIndex.from_schema(schema),
+            enabled=os.getenv("QUESTION_PRECHECK", "true").lower() not in ("0", "false", "no", "off"),
+        )
+
+    def classify(self, question: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """A report for question, or None when it needs the model"""
+        if not self.enabled:
+            return None
+        text = str(question.get("question") or "")
+        if has_cjk(text) or not question_terms(text):
+            return None
+        matches = self.index.match(text, values=False)
+        if not matches or not all(matches.values()):
+            return None
+        return self._template(question, text.lower(), matches)
+
+    def wrap(self, check: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        """check with this classifier in front of it"""
+        def checked(question: Dict[str, Any]) -> Dict[str, Any]:
+            report = self.classify(question)
+            if report is not None:
+                return report
+            self.counts["model"] += 1
+            return check(question)
+        return checked
+
+    def _report(self, question: Dict[str, Any], query_type: int, sql: Optional[str], rule: str,
+                **details) -> Dict[str, Any]:
+        self.counts[rule] += 1
+        report = dict(question)
+        report["sql_query"] = sql
+        report["query_type"] = query_type
+        report["precheck"] = dict(rule=rule, **details)
+        return report
+
+    @staticmethod
+    def _table(matches: Dict[str, Set[Hit]]) -> Optional[str]:
+        """The one table every matched term can refer to"""
+        tables = None
+        for hits in matches.values():
+            # A term that names a table refers to that table, not to columns like <table>_id
+            term_tables = {table for table, column in hits if column is None} or {table for table, _ in hits}
+            tables = term_tables if tables is None else tables & term_tables
+        return next(iter(tables)) if tables and len(tables) == 1 else None
+
+    def _template(self, question: Dict[str, Any], text: str,
+                  matches: Dict[str, Set[Hit]]) -> Optional[Dict[str, Any]]:
+        table = self._table(matches)
+        if table is None:
+            return None
+        columns = {column for hits in matches.values() if (table, None) not in hits
+                   for hit_table, column in hits if hit_table == table and column is not None}
+        types = self.index.catalog.tables[table]
+        measures = sorted(c for c in columns if is_numeric_type(types[c]) and not is_identifier_column(c))
+        dates = sorted(c for c in columns if is_temporal_type(types[c]))
+        dimensions = sorted(c for c in columns
+                            if c not in measures and c not in dates and not is_identifier_column(c))
+        if len(measures) > 1:
+            return None
+        measure = measures[0] if measures else None
+        aggregate = self._aggregate(text, measure)
+        if aggregate is None:
+            return None
+        expression, alias = aggregate
+
+        if _TREND.search(text):
+            date_columns = dates or sorted(c for c, t in types.items() if is_temporal_type(t))
+            if dimensions or len(date_columns) != 1:
+                return None
+            period = next((unit for phrase, unit in _PERIODS if phrase in text), "month")
+            bucket = f"date_trunc('{period}', {_quote(date_columns[0])})"
+            sql = (f"SELECT {bucket} AS period, {expression} AS {alias} FROM {_quote(table)} "
+                   f"GROUP BY 1 ORDER BY 1")
+            return self._report(question, 1, sql, "trend", table=table, columns=date_columns + measures)
+        if dates or len(dimensions) > 1:
+            return None
+        if _COUNT.search(text) and measure is None:
+            if not dimensions:
+                sql = f"SELECT COUNT(*) AS {alias} FROM {_quote(table)}"
+            else:
+                dimension = _quote(dimensions[0])
+                sql = (f"SELECT {dimension}, COUNT(*) AS {alias} FROM {_quote(table)} "
+                       f"GROUP BY {dimension} ORDER BY {alias} DESC")
+            return self._report(question, 1, sql, "count", table=table, columns=dimensions)
+        if _RANK.search(text) and dimensions:
+            dimension = _quote(dimensions[0])
+            direction = "ASC" if _ASCENDING.search(text) else "DESC"
+            sql = (f"SELECT {dimension}, {expression} AS {alias} FROM {_quote(table)} "
+                   f"GROUP BY {dimension} ORDER BY {alias} {direction} LIMIT {RANK_LIMIT}")
+            return self._report(question, 1, sql, "rank", table=table, columns=dimensions + measures)
+        if _BREAKDOWN.search(text) and dimensions and measure is not None:
+            dimension = _quote(dimensions[0])
+            sql = (f"SELECT {dimension}, {expression} AS {alias} FROM {_quote(table)} "
+                   f"GROUP BY {dimension} ORDER BY {dimension}")
+            return self._report(question, 1, sql, "breakdown", table=table, columns=dimensions + measures)
+        return None
+
+    @staticmethod
+    def _aggregate(text: str, measure: Optional[str]) -> Optional[List[str]]:
+        """[SQL expression, alias] for the measure the question asks about"""
+        if measure is None:
+            return None if _AVERAGE.search(text) or _TOTAL.search(text) else ["COUNT(*)", "count"]
+        if _TOTAL.search(text):
+            return [f"SUM({_quote(measure)})", f"total_{measure}"]
+        if _AVERAGE.search(text) or _TREND.search(text):
+            return [f"AVG({_quote(measure)})", f"avg_{measure}"]
+        # A measure without an aggregate ("highest price") is ambiguous
+        return None
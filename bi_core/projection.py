@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Field projection and cursor pagination for analysis results
+
+Clients that render only part of a result (market segment names, one page of
+validation reports, ...) select it with JSON pointers (RFC 6901) relative to
+the results object, e.g. "/validation_reports" or
+"/integrated_analysis/markets/market_segments/*/market_name", where "*"
+matches every element of a list or every value of an object. Agent outputs
+that are stored as JSON text (market_analysis, audience_analysis, ...) are
+decoded when a pointer descends into them.
+
+One list-valued section can be paginated per request; the opaque cursor
+encodes the section and the offset of the next page. Cursors are stable on
+stored results (GET /runs/{run_id}/result), which is where later pages of a
+live result should be read from.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+WILDCARD = "*"
+
+_MISSING = object()
+
+
+class ProjectionError(ValueError):
+    """Invalid pointer, section or cursor (answered with 400)"""
+
+
+class PageRequest(BaseModel):
+    """Pagination of one list-valued section of the results"""
+    section: str = Field(..., description="JSON pointer of the list to paginate, e.g. /validation_reports")
+    cursor: Optional[str] = Field(default=None, description="next_cursor of the previous page")
+    limit: int = Field(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Items per page")
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Reference tokens of a JSON pointer ("" or "/" is the whole document)"""
+    if pointer in ("", "/"):
+        return []
+    if not pointer.startswith("/"):
+        raise ProjectionError(f"JSON pointer must start with '/': {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _container(value: Any) -> Any:
+    """value itself, or the decoded object/list if value is JSON text"""
+    if isinstance(value, str) and value.lstrip()[:1] in ("{", "["):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _child(value: Any, token: str) -> Any:
+    if isinstance(value, dict):
+        return value.get(token, _MISSING)
+    if isinstance(value, list):
+        if token.isdigit() and int(token) < len(value):
+            return value[int(token)]
+    return _MISSING
+
+
+class _Indexed(dict):
+    """Selected elements of a list by their index, until _finalize turns them into a list
+
+    Keeping the indices lets projections of different elements (or of
+    different fields of one element) be merged element by element.
+    """
+
+
+def _project(value: Any, tokens: Sequence[str]) -> Any:
+    """Copy of the parts of value selected by tokens, or _MISSING"""
+    if not tokens:
+        return value
+    value = _container(value)
+    token, rest = tokens[0], tokens[1:]
+    if token == WILDCARD:
+        if isinstance(value, list):
+            items = ((index, _project(item, rest)) for index, item in enumerate(value))
+            return _Indexed((index, item) for index, item in items if item is not _MISSING)
+        if isinstance(value, dict):
+            items = {key: _project(item, rest) for key, item in value.items()}
+            return {key: item for key, item in items.items() if item is not _MISSING}
+        return _MISSING
+    child = _child(value, token)
+    if child is _MISSING:
+        return _MISSING
+    projected = _project(child, rest)
+    if projected is _MISSING:
+        return _MISSING
+    if isinstance(value, list):
+        return _Indexed({int(token): projected})
+    return {token: projected}
+
+
+def _merge(target: Any, source: Any) -> Any:
+    """Union of two projections of the same document"""
+    if isinstance(target, dict) and isinstance(source, dict) and type(target) is type(source):
+        merged = type(target)(target)
+        for key, value in source.items():
+            merged[key] = _merge(merged[key], value) if key in merged else value
+        return merged
+    # A whole list and some of its elements
+    if isinstance(target, list) and isinstance(source, _Indexed):
+        return [_merge(item, source[index]) if index in source else item for index, item in enumerate(target)]
+    if isinstance(target, _Indexed) and isinstance(source, list):
+        return _merge(source, target)
+    return source
+
+
+def _finalize(value: Any) -> Any:
+    """value with every _Indexed turned into the list of its elements in document order"""
+    if isinstance(value, _Indexed):
+        return [_finalize(value[index]) for index in sorted(value)]
+    if isinstance(value, dict):
+        return {key: _finalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_finalize(item) for item in value]
+    return value
+
+
+def project(document: Any, pointers: Sequence[str]) -> Any:
+    """Subset of document containing only the values the pointers select
+
+    Pointers that select nothing are ignored. The result keeps the document's
+    shape, so clients read the same paths as in the full result; an index into
+    a list keeps only that element.
+    """
+    result = _MISSING
+    for pointer in pointers:
+        selected = _project(document, parse_pointer(pointer))
+        if selected is _MISSING:
+            continue
+        result = selected if result is _MISSING else _merge(result, selected)
+    return {} if result is _MISSING else _finalize(result)
+
+
+def _replace(value: Any, tokens: Sequence[str], func) -> Any:
+    """Shallow copy of value with func applied at the pointer tokens"""
+    if not tokens:
+        return func(value)
+    value = _container(value)
+    child = _child(value, tokens[0])
+    if child is _MISSING:
+        raise ProjectionError(f"No such section: /{'/'.join(tokens)}")
+    if isinstance(value, list):
+        copy = list(value)
+        copy[int(tokens[0])] = _replace(child, tokens[1:], func)
+    else:
+        copy = dict(value)
+        copy[tokens[0]] = _replace(child, tokens[1:], func)
+    return copy
+
+
+def encode_cursor(section: str, offset: int) -> str:
+    payload = json.dumps({"s": section, "o": offset}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, section: str) -> int:
+    """Offset encoded in cursor, which must have been issued for section"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(payload["o"])
+        issued_for = payload["s"]
+    except (ValueError, KeyError, TypeError):
+        raise ProjectionError("Invalid cursor")
+    if issued_for != section or offset < 0:
+        raise ProjectionError(f"Cursor was not issued for section {section}")
+    return offset
+
+
+def paginate(document: Any, section: str, cursor: Optional[str] = None,
+             limit: int = DEFAULT_PAGE_SIZE) -> Tuple[Any, Dict[str, Any]]:
+    """document with the list at section cut to one page, and the page info"""
+    tokens = parse_pointer(section)
+    if WILDCARD in tokens or not tokens:
+        raise ProjectionError("Page section must point at one list")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = decode_cursor(cursor, section) if cursor else 0
+    page: Dict[str, Any] = {}
+
+    def cut(value):
+        value = _container(value)
+        if not isinstance(value, list):
+            raise ProjectionError(f"Section {section} is not a list")
+        end = offset + limit
+        page.update(section=section, offset=offset, limit=limit, total=len(value),
+                    next_cursor=encode_cursor(section, end) if end < len(value) else None)
+        return value[offset:end]
+
+    return _replace(document, tokens, cut), page
+
+
+def view_results(results: Any, fields: Optional[Sequence[str]] = None,
+                 page: Optional[PageRequest] = None) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """Apply pagination, then field projection; returns (results, page info or None)"""
+    page_info = None
+    if page is not None:
+        results, page_info = paginate(results, page.section, page.cursor, page.limit)
+    if fields:
+        results = project(results, fields)
+    return results, page_info
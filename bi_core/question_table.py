@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar table of the valued questions of audience analyses
+
+QuestionTable holds one row per question in a pandas DataFrame. Segment-level
+fields (segment name, industry, region, willingness to pay, ...) are stored
+once per segment and repeated into categorical columns, instead of copying a
+dict of them for every question, so tables of tens of thousands of questions
+stay small and filtering, deduplication and ranking are vectorized.
+
+records() gives the rows as question objects in the shape question_check
+expects. to_arrow() / to_parquet() / record_batches() export the table
+through pyarrow (optional dependency); categorical columns become Arrow
+dictionary arrays and, with pandas' Arrow-backed string dtype, text columns
+are handed over without copying.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: only needed for Arrow/Parquet export
+    pyarrow = None
+
+# Per-segment fields, in the order of the question objects
+SEGMENT_COLUMNS = ("customer_name", "industry", "company_size", "region", "roles",
+                   "willingness_to_pay_tier", "budget_range_usd")
+# Per-question fields
+QUESTION_COLUMNS = ("question", "pain_point", "problem_type", "monetization_path", "decision_value")
+CATEGORICAL_COLUMNS = ("market",) + SEGMENT_COLUMNS + ("problem_type", "decision_value")
+# decision_value from lowest to highest, for ranking; anything else ranks below Low
+DECISION_VALUE_ORDER = ("Low", "Medium", "High")
+
+_UNKNOWN = "Unknown"
+
+
+def _joined(value: Any, default: str = _UNKNOWN) -> str:
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return default if value is None else str(value)
+
+
+def segments_of(customer_data: Any) -> List[Dict[str, Any]]:
+    """Segments of an audience analysis in any of its formats (segments, target_customers or a list)"""
+    if isinstance(customer_data, list):
+        return customer_data
+    if isinstance(customer_data, dict):
+        if "segments" in customer_data:
+            return customer_data["segments"] or []
+        if "target_customers" in customer_data:
+            return customer_data["target_customers"] or []
+        print(f"Warning: Unknown customer data format: {list(customer_data.keys())}")
+    return []
+
+
+def _segment_fields(segment: Dict[str, Any]) -> Tuple[str, ...]:
+    profile = segment.get("profile") or {}
+    willingness = segment.get("willingness_to_pay") or {}
+    return (
+        segment.get("segment_name", segment.get("customer_name", _UNKNOWN)),
+        profile.get("industry", _UNKNOWN),
+        profile.get("company_size", _UNKNOWN),
+        _joined(profile.get("region", _UNKNOWN)),
+        _joined(profile.get("roles", _UNKNOWN)),
+        willingness.get("tier", _UNKNOWN),
+        willingness.get("budget_range_usd", _UNKNOWN),
+    )
+
+
+class QuestionTable:
+    """One row per valued question; market is None for a single audience analysis"""
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    @classmethod
+    def from_customer_analyses(cls, analyses: Iterable[Tuple[Optional[str], Any]]) -> "QuestionTable":
+        """Table of the questions of several (market name, audience analysis) pairs"""
+        segment_rows: List[Tuple[Any, ...]] = []
+        counts: List[int] = []
+        questions: Dict[str, List[Any]] = {column: [] for column in QUESTION_COLUMNS}
+        for market, customer_data in analyses:
+            for segment in segments_of(customer_data):
+                valued = [q for q in segment.get("valued_questions") or [] if isinstance(q, dict)]
+                if not valued:
+                    continue
+                segment_rows.append((market,) + _segment_fields(segment))
+                counts.append(len(valued))
+                for question in valued:
+                    questions["question"].append(question.get("question", ""))
+                    questions["pain_point"].append(question.get("mapped_pain_point", ""))
+                    questions["problem_type"].append(question.get("problem_type", ""))
+                    questions["monetization_path"].append(_joined(question.get("monetization_path", ""), ""))
+                    questions["decision_value"].append(question.get("decision_value", ""))
+
+        # Segment fields are repeated by index, not copied per question
+        repeat = np.repeat(np.arange(len(segment_rows), dtype=np.intp), counts)
+        segments = np.empty((len(segment_rows), len(SEGMENT_COLUMNS) + 1), dtype=object)
+        for index, row in enumerate(segment_rows):
+            segments[index, :] = row
+        data: Dict[str, Any] = {}
+        for position, column in enumerate(("market",) + SEGMENT_COLUMNS):
+            data[column] = pd.Categorical(segments[repeat, position])
+        for column in QUESTION_COLUMNS:
+            values = questions[column]
+            data[column] = pd.Categorical(values) if column in CATEGORICAL_COLUMNS else values
+        return cls(pd.DataFrame(data))
+
+    @classmethod
+    def from_customer_analysis(cls, customer_data: Any, market: Optional[str] = None) -> "QuestionTable":
+        return cls.from_customer_analyses([(market, customer_data)])
+
+    @classmethod
+    def from_integrated_analysis(cls, integrated_analysis: Dict[str, Any]) -> "QuestionTable":
+        """Questions of every market of an integrated analysis (markets with a customer_analysis)"""
+        markets = (integrated_analysis or {}).get("market_segments") or []
+        return cls.from_customer_analyses(
+            (market.get("market_name"), market["customer_analysis"])
+            for market in markets if isinstance(market, dict) and market.get("customer_analysis")
+        )
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def records(self, columns: Sequence[str] = SEGMENT_COLUMNS + QUESTION_COLUMNS) -> List[Dict[str, Any]]:
+        """Rows as plain dicts (question objects for question_check)"""
+        return self.frame.loc[:, list(columns)].astype(object).to_dict("records")
+
+    def filter(self, **criteria: Union[Any, Sequence[Any]]) -> "QuestionTable":
+        """Rows whose columns equal the given values (a list or tuple matches any of its values)"""
+        mask = np.ones(len(self.frame), dtype=bool)
+        for column, wanted in criteria.items():
+            values = list(wanted) if isinstance(wanted, (list, tuple, set, frozenset)) else [wanted]
+            mask &= self.frame[column].isin(values).to_numpy()
+        return QuestionTable(self.frame.loc[mask].reset_index(drop=True))
+
+    def normalized_questions(self) -> pd.Series:
+        """Question text NFKC-normalized, case-folded and stripped of punctuation (as bi_core.dedup does)"""
+        return (self.frame["question"].astype(str).str.normalize("NFKC").str.casefold()
+                .str.replace(r"\W+", " ", regex=True).str.strip())
+
+    def dedup(self, within: Sequence[str] = ()) -> "QuestionTable":
+        """First row of every normalized question (per combination of the within columns)"""
+        keys = self.frame.loc[:, list(within)].copy() if within else pd.DataFrame(index=self.frame.index)
+        keys["_question"] = self.normalized_questions()
+        return QuestionTable(self.frame.loc[~keys.duplicated().to_numpy()].reset_index(drop=True))
+
+    def rank(self, within: Sequence[str] = ("customer_name",), top: Optional[int] = None) -> "QuestionTable":
+        """Rows ordered by decision_value (High first) within each group, with a 1-based rank column
+
+        Ties keep the analysis order. top keeps the first top rows of each group.
+        """
+        order = {value.casefold(): position for position, value in enumerate(DECISION_VALUE_ORDER)}
+        score = self.frame["decision_value"].astype(str).str.casefold().map(order).fillna(-1)
+        frame = self.frame.assign(_score=score.to_numpy())
+        if within:
+            frame["rank"] = frame.groupby(list(within), observed=True)["_score"].rank(
+                method="first", ascending=False).astype("int64")
+        else:
+            frame["rank"] = frame["_score"].rank(method="first", ascending=False).astype("int64")
+        if top is not None:
+            frame = frame.loc[frame["rank"] <= top]
+        frame = frame.sort_values(list(within) + ["rank"], kind="stable")
+        return QuestionTable(frame.drop(columns="_score").reset_index(drop=True))
+
+    def to_arrow(self) -> "pyarrow.Table":
+        if pyarrow is None:
+            raise ImportError("pyarrow is required for Arrow/Parquet export")
+        return pyarrow.Table.from_pandas(self.frame, preserve_index=False)
+
+    def record_batches(self, rows: int = 10000) -> Iterator["pyarrow.RecordBatch"]:
+        """The table as Arrow record batches of at most rows rows (slices, not copies)"""
+        return iter(self.to_arrow().to_batches(max_chunksize=rows))
+
+    def to_parquet(self, where, compression: str = "zstd") -> None:
+        """Write the table as Parquet to a path or writable binary file"""
+        if pyarrow is None:
+            raise ImportError("pyarrow is required for Arrow/Parquet export")
+        pyarrow.parquet.write_table(self.to_arrow(), where, compression=compression)
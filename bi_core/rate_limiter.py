@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process-wide RPM/TPM rate limiter for OpenAI calls
+
+Every agent run and chat completion shares the same organisation limits, so
+all call sites reserve capacity from one limiter keyed by (model, API key).
+Reservations are granted in arrival order: a caller that cannot be served
+immediately is told how long to wait instead of failing, which keeps
+concurrent requests queued fairly rather than bursting into 429 errors.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .server import worker_count
+
+DEFAULT_RPM_LIMIT = 500
+DEFAULT_TPM_LIMIT = 200000
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token estimate (about 4 characters per token)"""
+    if text is None:
+        return 0
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, default=str)
+    return max(1, len(text) // 4)
+
+
+def key_fingerprint(api_key: Optional[str]) -> str:
+    """Short, non-reversible identifier for an API key"""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of rejecting callers
+
+    The balance may go negative; the deficit divided by the refill rate is the
+    time the caller has to wait. Later callers see a larger deficit, so waits
+    are served in FIFO order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens and return the seconds to wait before using them"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def adjust(self, amount: float):
+        """Give back (positive) or charge extra (negative) tokens after the fact"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Shared requests-per-minute and tokens-per-minute limiter"""
+
+    def __init__(self, rpm_limit: int = DEFAULT_RPM_LIMIT, tpm_limit: int = DEFAULT_TPM_LIMIT,
+                 model_limits: Optional[Dict[str, Dict[str, int]]] = None):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.model_limits = model_limits or {}
+        self._buckets: Dict[Tuple[str, str], Tuple[TokenBucket, TokenBucket]] = {}
+        self._metrics: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Build a limiter from OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT and OPENAI_RATE_LIMITS
+
+        OPENAI_RATE_LIMITS holds per-model overrides as JSON, for example
+        {"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}. A limit of 0 disables it.
+        Limits are per host: with several server workers (WEB_CONCURRENCY)
+        each process gets an equal share.
+        """
+        try:
+            model_limits = json.loads(os.getenv("OPENAI_RATE_LIMITS", "") or "{}")
+        except json.JSONDecodeError as e:
+            print(f"Ignoring invalid OPENAI_RATE_LIMITS: {e}")
+            model_limits = {}
+        workers = worker_count()
+
+        def share(limit) -> int:
+            limit = int(limit)
+            return max(1, limit // workers) if limit > 0 else limit
+
+        return cls(
+            rpm_limit=share(os.getenv("OPENAI_RPM_LIMIT", DEFAULT_RPM_LIMIT)),
+            tpm_limit=share(os.getenv("OPENAI_TPM_LIMIT", DEFAULT_TPM_LIMIT)),
+            model_limits={
+                model: {name: share(value) for name, value in limits.items()}
+                for model, limits in model_limits.items()
+            },
+        )
+
+    def _get(self, model: str, api_key: Optional[str]):
+        key = (model or "default", key_fingerprint(api_key))
+        with self._lock:
+            if key not in self._buckets:
+                limits = self.model_limits.get(key[0], {})
+                self._buckets[key] = (
+                    TokenBucket(limits.get("rpm", self.rpm_limit)),
+                    TokenBucket(limits.get("tpm", self.tpm_limit)),
+                )
+                self._metrics[key] = {
+                    "requests": 0,
+                    "queued_requests": 0,
+                    "waiting": 0,
+                    "total_wait_s": 0.0,
+                    "max_wait_s": 0.0,
+                    "estimated_tokens": 0,
+                    "actual_tokens": 0,
+                }
+            return key, self._buckets[key]
+
+    def _reserve(self, model: str, api_key: Optional[str], estimated_tokens: int):
+        key, (rpm_bucket, tpm_bucket) = self._get(model, api_key)
+        wait = max(rpm_bucket.reserve(1), tpm_bucket.reserve(estimated_tokens))
+        with self._lock:
+            stats = self._metrics[key]
+            stats["requests"] += 1
+            stats["estimated_tokens"] += estimated_tokens
+            if wait > 0:
+                stats["queued_requests"] += 1
+                stats["waiting"] += 1
+                stats["total_wait_s"] += wait
+                stats["max_wait_s"] = max(stats["max_wait_s"], wait)
+        return key, wait
+
+    def _done_waiting(self, key):
+        with self._lock:
+            self._metrics[key]["waiting"] -= 1
+
+    def _refund(self, key, estimated_tokens: int):
+        """Return the reservation of a caller that gave up while queued"""
+        rpm_bucket, tpm_bucket = self._buckets[key]
+        rpm_bucket.adjust(1)
+        tpm_bucket.adjust(estimated_tokens)
+        with self._lock:
+            stats = self._metrics[key]
+            stats["requests"] -= 1
+            stats["estimated_tokens"] -= estimated_tokens
+
+    def acquire(self, model: str, api_key: Optional[str] = None, estimated_tokens: int = 0) -> float:
+        """Block until the call may proceed; returns the seconds waited
+
+        Only for worker threads: sleeping here on the event loop would stall
+        every request it serves, so that raises RuntimeError instead.
+        """
+        if _on_event_loop():
+            raise RuntimeError("RateLimiter.acquire() called on the event loop; "
+                               "use acquire_async() or run the caller in a worker thread")
+        key, wait = self._reserve(model, api_key, estimated_tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            except BaseException:
+                self._refund(key, estimated_tokens)
+                raise
+            finally:
+                self._done_waiting(key)
+        return wait
+
+    async def acquire_async(self, model: str, api_key: Optional[str] = None, estimated_tokens: int = 0) -> float:
+        """Async variant of acquire() that yields to the event loop while queued
+
+        A caller cancelled while queued (client disconnect, stage timeout)
+        gives its reservation back, so it does not delay the callers after it.
+        """
+        key, wait = self._reserve(model, api_key, estimated_tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                self._refund(key, estimated_tokens)
+                raise
+            finally:
+                self._done_waiting(key)
+        return wait
+
+    def settle(self, model: str, api_key: Optional[str], estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the TPM bucket once the real token usage is known"""
+        if actual_tokens is None:
+            return
+        key, (_, tpm_bucket) = self._get(model, api_key)
+        tpm_bucket.adjust(estimated_tokens - actual_tokens)
+        with self._lock:
+            self._metrics[key]["actual_tokens"] += actual_tokens
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per model/key counters, including total and maximum queue wait"""
+        with self._lock:
+            return {
+                f"{model}:{fingerprint}": {
+                    name: round(value, 4) if isinstance(value, float) else value
+                    for name, value in stats.items()
+                }
+                for (model, fingerprint), stats in self._metrics.items()
+            }
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter, creating it from the environment"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter.from_env()
+    return _rate_limiter
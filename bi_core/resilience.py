@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retry and circuit breaker policy for LLM calls
+
+Transient upstream failures (rate limits, timeouts, 5xx, dropped connections)
+are retried with exponential backoff and full jitter, honouring Retry-After
+when the server sends it, and so are structured outputs that fail to parse or
+validate, since sampling again usually fixes them. Anything else fails
+immediately. A circuit breaker
+per model fails fast while the upstream is down instead of queueing more
+doomed requests behind it.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit '{name}' is open, retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether an exception is worth retrying"""
+    # Imported here so importing bi_core stays cheap; by the time a call has
+    # failed the SDKs are loaded anyway
+    import httpx
+    import openai
+
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if is_output_error(exc):
+        return True
+    if isinstance(exc, openai.RateLimitError):
+        # Exhausted quota will not recover by waiting
+        return getattr(exc, "code", None) != "insufficient_quota"
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    return False
+
+
+def is_output_error(exc: BaseException) -> bool:
+    """Whether the model answered but its output did not match the output type"""
+    from agents.exceptions import ModelBehaviorError
+
+    return isinstance(exc, ModelBehaviorError)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Delay requested by the server through retry-after-ms / Retry-After headers"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Build a policy from LLM_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY and LLM_RETRY_MAX_DELAY"""
+        return cls(
+            max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", 4)),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0)),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", 30.0)),
+        )
+
+    def delay(self, attempt: int, exc: Optional[BaseException] = None) -> float:
+        """Seconds to wait after the given (1-based) failed attempt"""
+        server_delay = retry_after_seconds(exc) if exc is not None else None
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures → half-open after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not go upstream"""
+        with self._lock:
+            if self.state == self.OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                if elapsed < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                # Let a single probe through; everyone else keeps failing fast
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """End a call that says nothing about upstream health, freeing the half-open probe slot"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "rejected_calls": self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide breaker for an upstream (one per model)"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30.0)),
+            )
+        return _breakers[name]
+
+
+def circuit_breaker_metrics() -> Dict[str, Dict[str, Any]]:
+    """State of every circuit breaker"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def _record_outcome(breaker: CircuitBreaker, exc: BaseException):
+    # Only upstream health problems count against the breaker; a bad request
+    # from one caller says nothing about whether the model is reachable, so
+    # it neither counts as a failure nor closes a half-open breaker. A malformed
+    # output is worth retrying, but the model did answer, so it counts as healthy.
+    if is_output_error(exc):
+        breaker.record_success()
+    elif is_retryable(exc):
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
+async def call_with_retry_async(func: Callable, breaker_name: str, policy: Optional[RetryPolicy] = None,
+                                timeout: Optional[float] = None):
+    """Await func() with retries, backoff and the named circuit breaker"""
+    policy = policy or RetryPolicy.from_env()
+    breaker = get_circuit_breaker(breaker_name)
+    for attempt in range(1, policy.max_attempts + 1):
+        breaker.before_call()
+        try:
+            if timeout:
+                result = await asyncio.wait_for(func(), timeout=timeout)
+            else:
+                result = await func()
+        except Exception as e:
+            _record_outcome(breaker, e)
+            if not is_retryable(e) or attempt == policy.max_attempts:
+                raise
+            delay = policy.delay(attempt, e)
+            print(f"{breaker_name}: attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        except BaseException:
+            # A cancelled probe must not leave the half-open breaker waiting for it forever
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+def call_with_retry(func: Callable, breaker_name: str, policy: Optional[RetryPolicy] = None):
+    """Blocking variant of call_with_retry_async() for synchronous clients"""
+    policy = policy or RetryPolicy.from_env()
+    breaker = get_circuit_breaker(breaker_name)
+    for attempt in range(1, policy.max_attempts + 1):
+        breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            _record_outcome(breaker, e)
+            if not is_retryable(e) or attempt == policy.max_attempts:
+                raise
+            delay = policy.delay(attempt, e)
+            print(f"{breaker_name}: attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
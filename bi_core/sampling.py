@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bounded table samples for the compliance audit and validation prompts
+
+Schema discovery returns whatever sample_data the model fetched, and the
+audit prompt used to embed the whole table description, so wide tables with
+long free-text columns (review comments, listing descriptions) made prompts
+grow with the data. TableSampler turns a table description into a profile
+whose size depends only on its settings:
+
+  - at most max_rows sample rows, picked to be diverse: stratified over the
+    most varied low-cardinality column when there is one (one row per
+    category before any category gets a second), otherwise a reservoir
+    sample. The random generator is seeded with the table name, so the same
+    table always gives the same profile (and prompt);
+  - per-column summary statistics over all sample rows (non-null and
+    distinct counts, min/max of numbers and dates, length range of text and
+    the most common values) instead of the raw rows;
+  - every value truncated to max_value_chars, at most max_columns columns
+    profiled and at most MAX_COLUMN_NAMES column names listed.
+
+SAMPLE_ROWS, SAMPLE_VALUE_CHARS and SAMPLE_COLUMNS override the defaults.
+"""
+import json
+import os
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from bi_core.schema_index import is_identifier_column, is_numeric_type, is_temporal_type
+from bi_core.sql_check import sample_type
+
+DEFAULT_SAMPLE_ROWS = 5
+DEFAULT_SAMPLE_VALUE_CHARS = 80
+DEFAULT_SAMPLE_COLUMNS = 40
+# Column names listed beyond the profiled columns
+MAX_COLUMN_NAMES = 200
+# Most common values shown per column
+MAX_EXAMPLES = 3
+
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+
+
+def truncate(value: Any, max_chars: int) -> Any:
+    """value with text longer than max_chars cut; nested values become (cut) JSON text"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = _text(value)
+    if len(text) > max_chars:
+        return f"{text[:max_chars]}... ({len(text)} chars)"
+    return text
+
+
+def _key(value: Any) -> Any:
+    """Hashable stand-in for a sample value"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+def reservoir_sample(count: int, k: int, rng: random.Random) -> List[int]:
+    """Indices of a uniform sample of k of count items (algorithm R), in item order"""
+    reservoir = list(range(min(count, k)))
+    for index in range(k, count):
+        slot = rng.randint(0, index)
+        if slot < k:
+            reservoir[slot] = index
+    return sorted(reservoir)
+
+
+def stratified_sample(strata: Sequence[Any], k: int, rng: random.Random) -> List[int]:
+    """Indices of k items taken round-robin over their strata (random within a stratum), in item order"""
+    groups: Dict[Any, List[int]] = {}
+    for index, stratum in enumerate(strata):
+        groups.setdefault(stratum, []).append(index)
+    for members in groups.values():
+        rng.shuffle(members)
+    picked: List[int] = []
+    depth = 0
+    while len(picked) < min(k, len(strata)):
+        for members in groups.values():
+            if depth < len(members) and len(picked) < k:
+                picked.append(members[depth])
+        depth += 1
+    return sorted(picked)
+
+
+class TableSampler:
+    """Builds bounded profiles (sample rows and column statistics) of table descriptions"""
+
+    def __init__(self, max_rows: int = DEFAULT_SAMPLE_ROWS, max_value_chars: int = DEFAULT_SAMPLE_VALUE_CHARS,
+                 max_columns: int = DEFAULT_SAMPLE_COLUMNS):
+        self.max_rows = max_rows
+        self.max_value_chars = max_value_chars
+        self.max_columns = max_columns
+
+    @classmethod
+    def from_env(cls) -> "TableSampler":
+        return cls(
+            max_rows=int(os.getenv("SAMPLE_ROWS", DEFAULT_SAMPLE_ROWS)),
+            max_value_chars=int(os.getenv("SAMPLE_VALUE_CHARS", DEFAULT_SAMPLE_VALUE_CHARS)),
+            max_columns=int(os.getenv("SAMPLE_COLUMNS", DEFAULT_SAMPLE_COLUMNS)),
+        )
+
+    def pick_rows(self, rows: Sequence[Dict[str, Any]], columns: Sequence[str], seed: str) -> List[int]:
+        """Indices of at most max_rows diverse rows
+
+        Rows are stratified over the non-key column with the most distinct
+        values that still repeat and fit in max_rows; without one, they are
+        reservoir sampled.
+        """
+        if len(rows) <= self.max_rows:
+            return list(range(len(rows)))
+        rng = random.Random(seed)
+        best, best_distinct = None, 1
+        for column in columns:
+            if is_identifier_column(column):
+                continue
+            distinct = len({_key(row.get(column)) for row in rows})
+            if best_distinct < distinct <= self.max_rows:
+                best, best_distinct = column, distinct
+        if best is None:
+            return reservoir_sample(len(rows), self.max_rows, rng)
+        return stratified_sample([_key(row.get(best)) for row in rows], self.max_rows, rng)
+
+    def column_stats(self, values: List[Any], declared: Optional[str] = None) -> Dict[str, Any]:
+        """Summary of the sample values of one column"""
+        present = [value for value in values if value is not None]
+        types = {sample_type(value) for value in present}
+        column_type = declared or (types.pop() if len(types) == 1 else "TEXT")
+        counts = Counter(_key(value) for value in present)
+        stats: Dict[str, Any] = {"type": column_type, "non_null": len(present), "distinct": len(counts)}
+        numbers = [value for value in present if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if numbers and (is_numeric_type(column_type) or len(numbers) == len(present)):
+            stats["min"], stats["max"] = min(numbers), max(numbers)
+        elif present and is_temporal_type(column_type):
+            texts = [str(value) for value in present]
+            stats["min"], stats["max"] = min(texts), max(texts)
+        elif present:
+            lengths = [len(_text(value)) for value in present]
+            stats["min_length"], stats["max_length"] = min(lengths), max(lengths)
+        # min/max already describe numbers and dates that never repeat
+        if counts and not ("min" in stats and len(counts) == len(present)):
+            stats["top_values"] = [truncate(value, self.max_value_chars)
+                                   for value, _ in counts.most_common(MAX_EXAMPLES)]
+        return stats
+
+    def profile(self, table_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Bounded description of a table: its columns, their statistics and a few sample rows"""
+        rows = [row for row in table_info.get("sample_data") or [] if isinstance(row, dict)]
+        names: List[str] = []
+        declared: Dict[str, Optional[str]] = {}
+        for column in table_info.get("columns") or []:
+            if isinstance(column, dict):
+                name = column.get("name") or column.get("column_name")
+                column_type = column.get("type") or column.get("data_type")
+            else:
+                name, column_type = column, None
+            if name and str(name) not in declared:
+                names.append(str(name))
+                declared[str(name)] = str(column_type) if column_type else None
+        for row in rows:
+            for name in row:
+                if str(name) not in declared:
+                    names.append(str(name))
+                    declared[str(name)] = None
+
+        table_name = str(table_info.get("table_name", "unknown"))
+        profiled = names[:self.max_columns]
+        picked = self.pick_rows(rows, profiled, table_name)
+        profile: Dict[str, Any] = {"table_name": truncate(table_name, self.max_value_chars)}
+        # Other scalar fields of the description (row counts, comments, ...)
+        profile.update((key, truncate(value, self.max_value_chars)) for key, value in table_info.items()
+                       if key not in ("table_name", "columns", "sample_data") and not isinstance(value, (dict, list)))
+        profile["columns"] = [truncate(name, self.max_value_chars) for name in names[:MAX_COLUMN_NAMES]]
+        if len(names) > MAX_COLUMN_NAMES:
+            profile["more_columns"] = len(names) - MAX_COLUMN_NAMES
+        profile["sample_row_count"] = len(rows)
+        profile["column_stats"] = {
+            truncate(name, self.max_value_chars): self.column_stats([row.get(name) for row in rows], declared[name])
+            for name in profiled
+        } if rows else {}
+        profile["sample_rows"] = [
+            {truncate(name, self.max_value_chars): truncate(rows[index].get(name), self.max_value_chars)
+             for name in profiled}
+            for index in picked
+        ]
+        return profile
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inverted index from question terms to schema tables and columns
+
+Terms are taken from table names, column names (split on underscores and
+camelCase) and the sample values of text columns, and stemmed the same way
+as the words of a question (plural endings dropped, British "-our" spelled
+"-or"), so "Which neighbourhoods ..." finds listings.neighbourhood and
+"room types" finds room_type. A question term also matches identifiers that
+contain it ("review" matches the reviewsdetails table) and other forms of the
+same word ("availability" matches available, "pricing" matches price).
+
+Function words and analysis vocabulary ("which", "average", "trend",
+"month", ...) are not content terms: they say what to compute, not what to
+compute it on, and are never looked up.
+
+slice() uses the index to describe only the tables and columns relevant to
+one question (compact types, a few sample values), which is what the
+question_check prompt needs instead of the whole schema analysis output.
+"""
+import json
+import os
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bi_core.sql_check import SQLCatalog
+
+# (table, column); column is None when the term names the table itself
+Hit = Tuple[str, Optional[str]]
+
+# Shortest question term matched inside a longer identifier
+MIN_SUBSTRING_TERM = 4
+# Shortest common prefix of two forms of the same word
+MIN_SHARED_PREFIX = 4
+# Sample values longer than this (free text such as review comments) are not indexed
+MAX_INDEXED_VALUE_LENGTH = 40
+
+# Schema slice defaults (SCHEMA_SLICE_TABLES / _COLUMNS / _SAMPLES)
+DEFAULT_SLICE_TABLES = 3
+DEFAULT_SLICE_COLUMNS = 12
+DEFAULT_SLICE_SAMPLES = 3
+MAX_SAMPLE_CHARS = 40
+
+_COMPACT_TYPES = {
+    "character varying": "varchar", "double precision": "double", "timestamp without time zone": "timestamp",
+    "timestamp with time zone": "timestamptz", "time without time zone": "time", "boolean": "bool",
+    "integer": "int", "smallint": "int2",
+}
+
+STOPWORDS = frozenset("""
+a about above across after all an and any are as at be been before being between both but by can could
+did do does doing during each for from had has have having how i if in into is it its itself me more my
+no nor not of on once only or other our out over own per same should so some such than that the their
+them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your vs versus within without based among get gets got
+receive receives received make makes made us
+""".split())
+
+# Analysis vocabulary: what to compute rather than what to compute it on
+ANALYSIS_TERMS = frozenset("""
+many much number count counts total totals sum average averages avg mean median top highest high higher
+lowest low lower most least fewest fewer best worst largest smallest biggest greatest maximum minimum max
+min trend trends trending change changes changed changing over time times month months monthly week weeks
+weekly day days daily year years yearly annual annually quarter quarterly season seasonal seasonality
+distribution distribute share percentage percent ratio rate rates compare comparison rank ranking ranked
+overall breakdown group grouped each every per value values level levels amount amounts
+""".split())
+
+_TOKEN = re.compile(r"[^\W_]+")
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+
+
+def stem(token: str) -> str:
+    token = token.lower()
+    if len(token) > 5:
+        token = token.replace("our", "or")
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def identifier_terms(name: str) -> List[str]:
+    """Stemmed terms of a table or column name (room_type -> room, type)"""
+    return [stem(part) for part in _TOKEN.findall(_CAMEL.sub(" ", name))]
+
+
+def question_terms(text: str) -> List[str]:
+    """Stemmed content terms of a question, in order, without duplicates"""
+    terms = []
+    for token in _TOKEN.findall(text or ""):
+        token = token.lower()
+        if len(token) < 2 or token in STOPWORDS or token in ANALYSIS_TERMS or token.isdigit():
+            continue
+        term = stem(token)
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def has_cjk(text: str) -> bool:
+    return bool(_CJK.search(text or ""))
+
+
+def is_numeric_type(column_type: str) -> bool:
+    return bool(re.search(r"int|numeric|decimal|double|float|real|money|serial", column_type, re.IGNORECASE))
+
+
+def is_temporal_type(column_type: str) -> bool:
+    return bool(re.search(r"date|time", column_type, re.IGNORECASE))
+
+
+def compact_type(column_type: str) -> str:
+    lowered = column_type.lower()
+    return _COMPACT_TYPES.get(lowered, lowered)
+
+
+def _sample_text(value: Any) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if len(text) > MAX_SAMPLE_CHARS:
+        text = text[:MAX_SAMPLE_CHARS] + "..."
+    return json.dumps(text, ensure_ascii=False) if isinstance(value, str) else text
+
+
+def _same_word(a: str, b: str) -> bool:
+    """Derived forms of one word (availability / available) share most of a prefix"""
+    shared = len(os.path.commonprefix([a, b]))
+    return shared >= MIN_SHARED_PREFIX and shared >= 0.75 * min(len(a), len(b))
+
+
+def is_identifier_column(column: str) -> bool:
+    return column == "id" or column.endswith("_id")
+
+
+class SchemaIndex:
+    """Inverted index over a SQLCatalog: stemmed term -> tables and columns it names
+
+    Terms of table and column names are kept apart from terms of sample
+    values (value_postings), so callers can tell a question that names a
+    column ("by neighbourhood") from one that names a value of it ("in
+    Brooklyn").
+    """
+
+    def __init__(self, catalog: SQLCatalog):
+        self.catalog = catalog
+        self.postings: Dict[str, Set[Hit]] = defaultdict(set)
+        self.value_postings: Dict[str, Set[Hit]] = defaultdict(set)
+        for table, columns in catalog.tables.items():
+            for term in identifier_terms(table):
+                self.postings[term].add((table, None))
+            for column, column_type in columns.items():
+                for term in identifier_terms(column):
+                    self.postings[term].add((table, column))
+                if is_numeric_type(column_type) or is_temporal_type(column_type):
+                    continue
+                for value in catalog.samples.get(table, {}).get(column, []):
+                    if isinstance(value, str) and len(value) <= MAX_INDEXED_VALUE_LENGTH:
+                        for term in question_terms(value):
+                            self.value_postings[term].add((table, column))
+        self._vocabulary = sorted(set(self.postings) | set(self.value_postings))
+
+    @classmethod
+    def from_schema(cls, schema) -> "SchemaIndex":
+        return cls(SQLCatalog.from_schema(schema))
+
+    def __bool__(self) -> bool:
+        return bool(self.catalog)
+
+    def lookup(self, term: str, values: bool = True) -> Set[Hit]:
+        """Tables and columns named by term: exactly, as part of an identifier, or as a variant of the same word
+
+        With values=False only table and column names count, not sample values.
+        """
+        postings = [self.postings, self.value_postings] if values else [self.postings]
+        hits = set()
+        for indexed in [term] + (self._vocabulary if len(term) >= MIN_SUBSTRING_TERM else []):
+            if indexed == term or term in indexed or _same_word(term, indexed):
+                for posting in postings:
+                    hits |= posting.get(indexed, set())
+        return hits
+
+    def match(self, text: str, values: bool = True) -> Dict[str, Set[Hit]]:
+        """Hits of every content term of text (terms without hits map to an empty set)"""
+        return {term: self.lookup(term, values) for term in question_terms(text)}
+
+    def column_type(self, table: str, column: str) -> str:
+        return self.catalog.tables.get(table, {}).get(column, "TEXT")
+
+    def relevance(self, text: str) -> Dict[str, Dict[Optional[str], float]]:
+        """Score of every table and column the question's terms name
+
+        A term spreads a weight of 1 over its hits, so a term naming one column
+        counts more than one that appears in every table.
+        """
+        scores: Dict[str, Dict[Optional[str], float]] = defaultdict(lambda: defaultdict(float))
+        for hits in self.match(text).values():
+            for table, column in hits:
+                scores[table][column] += 1.0 / len(hits)
+        return scores
+
+    def slice(self, text: str, max_tables: Optional[int] = None, max_columns: Optional[int] = None,
+              max_samples: Optional[int] = None) -> str:
+        """Compact description of the part of the schema relevant to a question
+
+        The top max_tables tables by relevance, each with its relevant columns
+        first (with up to max_samples sample values), then its key columns,
+        then other columns up to max_columns; names of the tables left out are
+        listed on the last line. A question that names nothing in the schema
+        gets every table without sample values.
+        """
+        max_tables = max_tables or int(os.getenv("SCHEMA_SLICE_TABLES", DEFAULT_SLICE_TABLES))
+        max_columns = max_columns or int(os.getenv("SCHEMA_SLICE_COLUMNS", DEFAULT_SLICE_COLUMNS))
+        if max_samples is None:
+            max_samples = int(os.getenv("SCHEMA_SLICE_SAMPLES", DEFAULT_SLICE_SAMPLES))
+        scores = self.relevance(text)
+        order = list(self.catalog.tables)
+        if scores:
+            tables = sorted(scores, key=lambda t: (-sum(scores[t].values()), order.index(t)))[:max_tables]
+        else:
+            tables, max_samples = order, 0
+
+        lines = []
+        for table in tables:
+            columns = self.catalog.tables[table]
+            relevant = sorted((c for c in scores.get(table, {}) if c is not None),
+                              key=lambda c: (-scores[table][c], list(columns).index(c)))
+            keys = [c for c in columns if is_identifier_column(c) and c not in relevant]
+            rest = [c for c in columns if c not in relevant and c not in keys]
+            shown = (relevant + keys + rest)[:max(max_columns, len(relevant))]
+            parts = []
+            for column in shown:
+                part = f"{column} {compact_type(columns[column])}"
+                values = self.catalog.samples.get(table, {}).get(column, []) if column in relevant else []
+                # Distinct values only, so repeated samples do not crowd out the others
+                examples = list(dict.fromkeys(_sample_text(value) for value in values))[:max_samples]
+                if examples:
+                    part += " e.g. " + ", ".join(examples)
+                parts.append(part)
+            hidden = len(columns) - len(shown)
+            lines.append(f"{table}({'; '.join(parts)}{f'; +{hidden} more columns' if hidden else ''})")
+        others = [t for t in order if t not in tables]
+        if others:
+            lines.append("Other tables: " + ", ".join(others))
+        return "\n".join(lines)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Server run profiles for the API services
+
+Development runs a single auto-reloading uvicorn process. Production runs
+several worker processes (so a handler stuck in a synchronous OpenAI call only
+stalls its own worker) with uvloop/httptools when they are installed (the
+uvicorn[standard] requirement; without them the asyncio loop and h11 are
+used), tuned keep-alive and listen backlog, graceful shutdown and worker
+recycling.
+
+Worker processes share nothing in memory. Limits that are meant per host, such
+as the OpenAI rate limiter, read WEB_CONCURRENCY and take their share of the
+quota; state that must be shared (idempotency keys, checkpoints, sessions)
+already lives in SQLite files.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+from typing import Optional
+
+
+# Workers when WEB_CONCURRENCY is unset: every worker loads its own copy of the
+# SDKs, agents and caches, and the pipeline is I/O-bound, so the CPU count
+# mostly buys memory pressure on small instances
+DEFAULT_WORKERS = 2
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def worker_count() -> int:
+    """Number of server worker processes on this host, read from WEB_CONCURRENCY
+
+    run_server() exports the profile's worker count (DEFAULT_WORKERS unless
+    configured) before starting workers, so this is only 1 by default for an
+    app started some other way, e.g. a plain single-process `uvicorn app:app`.
+    """
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    except ValueError:
+        return 1
+
+
+class ServerProfile:
+    """uvicorn settings for one run mode"""
+
+    def __init__(self, production: bool = True, workers: int = 1, loop: str = "auto", http: str = "auto",
+                 backlog: int = 2048, keep_alive: int = 5, graceful_timeout: Optional[int] = None,
+                 max_requests: Optional[int] = None, preload: bool = False, log_level: str = "info"):
+        self.production = production
+        self.workers = max(1, workers)
+        self.loop = loop
+        self.http = http
+        self.backlog = backlog
+        self.keep_alive = keep_alive
+        self.graceful_timeout = graceful_timeout
+        self.max_requests = max_requests
+        self.preload = preload
+        self.log_level = log_level
+
+    @classmethod
+    def from_env(cls) -> "ServerProfile":
+        """Build a profile from ENVIRONMENT and the SERVER_* / WEB_CONCURRENCY settings
+
+        ENVIRONMENT=development gives a single reloading process. Otherwise:
+        WEB_CONCURRENCY workers (default: 2, or 1 on a single CPU),
+        SERVER_BACKLOG, SERVER_KEEP_ALIVE (seconds; keep it above the load
+        balancer's idle timeout), SERVER_GRACEFUL_TIMEOUT (seconds in-flight
+        requests get on shutdown), SERVER_MAX_REQUESTS (recycle a worker after
+        that many requests, 0 = never) and SERVER_PRELOAD (import the app once
+        in the supervisor before starting workers; off by default, since it
+        delays binding the port by a full import).
+        """
+        if os.getenv("ENVIRONMENT", "production") == "development":
+            return cls(production=False, log_level=os.getenv("LOG_LEVEL", "info"))
+        max_requests = int(os.getenv("SERVER_MAX_REQUESTS", 0))
+        return cls(
+            production=True,
+            workers=int(os.getenv("WEB_CONCURRENCY") or min(DEFAULT_WORKERS, os.cpu_count() or 1)),
+            loop="uvloop" if _available("uvloop") else "asyncio",
+            http="httptools" if _available("httptools") else "h11",
+            backlog=int(os.getenv("SERVER_BACKLOG", 2048)),
+            keep_alive=int(os.getenv("SERVER_KEEP_ALIVE", 75)),
+            graceful_timeout=int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30)),
+            max_requests=max_requests or None,
+            preload=os.getenv("SERVER_PRELOAD", "false").lower() == "true",
+            log_level=os.getenv("LOG_LEVEL", "info"),
+        )
+
+    def describe(self) -> str:
+        if not self.production:
+            return "development (1 process, auto-reload)"
+        return (f"production ({self.workers} workers, loop={self.loop}, http={self.http}, "
+                f"backlog={self.backlog}, keep-alive={self.keep_alive}s, "
+                f"graceful-timeout={self.graceful_timeout}s)")
+
+
+def preload_app(app_path: str, app_dir: Optional[str] = None):
+    """Import the ASGI app once in the supervisor
+
+    uvicorn starts workers with the spawn method, so nothing imported here is
+    inherited; the point is to fail fast on import/configuration errors before
+    any worker is started, and to have the bytecode cache written once instead
+    of by every worker racing on first start.
+    """
+    if app_dir and app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    module_name, _, attr = app_path.partition(":")
+    module = importlib.import_module(module_name)
+    if not hasattr(module, attr or "app"):
+        raise ImportError(f"{module_name} has no attribute {attr or 'app'}")
+
+
+def run_server(app_path: str, host: str = "0.0.0.0", port: int = 8000,
+               profile: Optional[ServerProfile] = None, app_dir: Optional[str] = None):
+    """Run app_path ("module:attr") with the given profile (default: from the environment)"""
+    import uvicorn
+    from uvicorn.main import STARTUP_FAILURE
+
+    profile = profile or ServerProfile.from_env()
+    print(f"Server profile: {profile.describe()}")
+    if not profile.production:
+        uvicorn.run(app_path, host=host, port=port, reload=True, app_dir=app_dir, log_level=profile.log_level)
+        return
+
+    # Workers inherit the environment; per-host limits divide by this
+    os.environ["WEB_CONCURRENCY"] = str(profile.workers)
+    if profile.preload:
+        preload_app(app_path, app_dir)
+    if app_dir and app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    config = uvicorn.Config(
+        app_path,
+        host=host,
+        port=port,
+        workers=profile.workers,
+        loop=profile.loop,
+        http=profile.http,
+        backlog=profile.backlog,
+        timeout_keep_alive=profile.keep_alive,
+        timeout_graceful_shutdown=profile.graceful_timeout,
+        limit_max_requests=profile.max_requests,
+        log_level=profile.log_level,
+    )
+    server = uvicorn.Server(config)
+    # uvicorn only listens once a server has imported the app; listen first,
+    # so the platform's port check and early connections wait in the backlog
+    # instead of being refused while the app (or every worker) loads
+    sock = config.bind_socket()
+    sock.listen(profile.backlog)
+    try:
+        if profile.workers > 1:
+            from uvicorn.supervisors import Multiprocess
+            Multiprocess(config, target=server.run, sockets=[sock]).run()
+        else:
+            server.run(sockets=[sock])
+    except KeyboardInterrupt:
+        pass
+    if profile.workers == 1 and not server.started:
+        sys.exit(STARTUP_FAILURE)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copy-on-write forks of agent sessions for stages that run in parallel
+
+Stages that share a user's session (schema, market and audience analysis)
+cannot run concurrently on the session itself: their history writes
+interleave and each stage's next model call sees the other stages' turns.
+A SessionFork gives every parallel stage its own SessionBranch instead. A
+branch reads the shared prefix (the parent's history at the time of the
+first read, loaded once for all branches) plus its own turns, and writes
+only to itself. Once the stages have finished, merge() appends the branches'
+turns to the parent in a fixed order and discard() drops a branch, so the
+stored history is the same as if the stages had run one after another.
+
+Branches implement the agents SDK Session protocol and can be passed as
+session= anywhere a SQLiteSession is used. BatchSessions applies the same
+scheme to the runs of a batch: every run gets its own branch of its user's
+session, so runs of the same user can run concurrently.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class SessionBranch:
+    """One stage's isolated view of a forked session
+
+    Items removed with pop_item() or clear_session() from the shared prefix
+    are only hidden in this branch; the parent is never modified before a
+    merge, and a merge only appends the branch's own items.
+    """
+
+    def __init__(self, fork: "SessionFork", name: str):
+        self.name = name
+        self.session_id = f"{fork.parent.session_id}#{name}"
+        self.items: List[Any] = []
+        self._fork = fork
+        self._hidden = 0
+
+    async def _visible_prefix(self) -> List[Any]:
+        prefix = await self._fork.prefix()
+        return prefix[:len(prefix) - self._hidden]
+
+    async def get_items(self, limit: Optional[int] = None) -> List[Any]:
+        items = await self._visible_prefix() + self.items
+        if limit is not None:
+            return items[-limit:] if limit > 0 else []
+        return items
+
+    async def add_items(self, items: List[Any]) -> None:
+        self.items.extend(items)
+
+    async def pop_item(self) -> Optional[Any]:
+        if self.items:
+            return self.items.pop()
+        prefix = await self._visible_prefix()
+        if not prefix:
+            return None
+        self._hidden += 1
+        return prefix[-1]
+
+    async def clear_session(self) -> None:
+        self.items.clear()
+        self._hidden = len(await self._fork.prefix())
+
+
+class SessionFork:
+    """Branches of one parent session, merged or discarded when the parallel stages are done
+
+    Use as an async context manager: branches that were neither merged nor
+    discarded when the block exits (e.g. because a stage raised) are
+    discarded, so a failed parallel section leaves the parent untouched.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._prefix: Optional[List[Any]] = None
+        self._lock = asyncio.Lock()
+        self._branches: Dict[str, SessionBranch] = {}
+
+    async def prefix(self) -> List[Any]:
+        """Parent history at the time of the first read, shared by all branches"""
+        if self._prefix is None:
+            async with self._lock:
+                if self._prefix is None:
+                    self._prefix = await self.parent.get_items()
+        return self._prefix
+
+    def branch(self, name: str) -> SessionBranch:
+        """The branch called name (created on first use)"""
+        if name not in self._branches:
+            self._branches[name] = SessionBranch(self, name)
+        return self._branches[name]
+
+    async def merge(self, *names: str) -> int:
+        """Append the named branches' items to the parent, in the order given; returns items merged"""
+        merged = 0
+        for name in names:
+            branch = self._branches.pop(name, None)
+            if branch is None or not branch.items:
+                continue
+            await self.parent.add_items(branch.items)
+            merged += len(branch.items)
+        return merged
+
+    def discard(self, *names: str):
+        """Drop the named branches (all remaining branches if none are named)"""
+        for name in names or list(self._branches):
+            self._branches.pop(name, None)
+
+    async def __aenter__(self) -> "SessionFork":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.discard()
+        return False
+
+
+class BatchSessions:
+    """Per-batch SessionForks by user: each run works on its own branch
+
+    merge() appends the branches of the runs that finished to their user's
+    session, in run index order, once the batch is done; branches of failed
+    or cancelled runs are dropped.
+    """
+
+    def __init__(self, open_session: Callable[[str], Any]):
+        self._open_session = open_session
+        self._forks: Dict[str, SessionFork] = {}
+        self._finished: Dict[str, List[int]] = {}
+
+    def branch(self, user_name: str, index: int) -> SessionBranch:
+        if user_name not in self._forks:
+            self._forks[user_name] = SessionFork(self._open_session(user_name))
+        return self._forks[user_name].branch(str(index))
+
+    async def run(self, user_name: str, index: int, func: Callable[[SessionBranch], Awaitable[Any]]) -> Any:
+        """Await func(branch) on run index's branch of the user's session"""
+        result = await func(self.branch(user_name, index))
+        self._finished.setdefault(user_name, []).append(index)
+        return result
+
+    async def merge(self) -> int:
+        """Append finished runs' turns to their users' sessions; returns items merged"""
+        merged = 0
+        for user_name, fork in self._forks.items():
+            finished = sorted(self._finished.get(user_name, []))
+            merged += await fork.merge(*(str(index) for index in finished))
+            fork.discard()
+        return merged
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-flight coalescing of identical concurrent requests
+
+When several clients ask for the same analysis at the same time, the first one
+starts the pipeline and later ones attach to the running execution and receive
+its result. Credentials never go into the coalescing key; instead a follower
+only attaches if its credential is one already known to be authorized for the
+resource, otherwise it runs on its own.
+
+Flights live in one worker process; with several server workers, duplicates
+landing on different workers are only deduplicated by the shared
+Idempotency-Key store.
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+
+def make_request_key(namespace: str, payload: Dict[str, Any], exclude: Iterable[str] = ()) -> str:
+    """Stable key for a request payload with the given fields (e.g. credentials) removed"""
+    excluded = set(exclude)
+    normalized = {
+        name: value.strip() if isinstance(value, str) else value
+        for name, value in payload.items()
+        if name not in excluded
+    }
+    encoded = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{namespace}:{hashlib.sha256(encoded.encode('utf-8')).hexdigest()}"
+
+
+def credential_fingerprint(*secrets: Optional[str]) -> str:
+    """Non-reversible fingerprint of the credentials a request carries"""
+    joined = "\x00".join(secret or "" for secret in secrets)
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()[:16]
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Future, credential: str):
+        self.task = task
+        self.credentials: Set[str] = {credential}
+        self.followers = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls that share a key"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = {"executions": 0, "coalesced": 0, "unauthorized_followers": 0}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def metrics(self) -> Dict[str, int]:
+        return dict(self._stats, in_flight=len(self._flights))
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], credential: str = "",
+                 authorize: Optional[Callable[[str], bool]] = None) -> Tuple[Any, bool]:
+        """Run func() once per key; returns (result, coalesced)
+
+        authorize(credential) decides whether a follower whose credential
+        differs from the leader's may share the result.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            if credential in flight.credentials or (authorize is not None and authorize(credential)):
+                flight.credentials.add(credential)
+                flight.followers += 1
+                self._stats["coalesced"] += 1
+                # shield: a disconnecting follower must not cancel the shared run
+                return await asyncio.shield(flight.task), True
+            self._stats["unauthorized_followers"] += 1
+            self._stats["executions"] += 1
+            return await func(), False
+
+        task = asyncio.ensure_future(func())
+        flight = _Flight(task, credential)
+        self._flights[key] = flight
+        self._stats["executions"] += 1
+
+        def _forget(_):
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        task.add_done_callback(_forget)
+        return await asyncio.shield(task), False
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local dry-run validation of the SQL returned by question_check
+
+The question_check model is asked to return SQL that executes, but it has no
+database access, so its sql_query is only a claim. validate_reports() checks
+every returned query locally, without touching the customer database:
+
+  1. The query is parsed with sqlglot in the Postgres dialect and its tables
+     and columns are resolved against the discovered schema. A query that
+     resolves is valid.
+  2. Queries sqlglot cannot qualify (and every query when sqlglot is not
+     installed) are compiled (EXPLAIN, never executed) on an empty in-memory
+     SQLite shadow database that has the schema's tables and columns, which
+     catches unknown tables and columns.
+
+A report whose query_type is 1 (answerable with SQL) but whose query fails
+either check is downgraded to query_type 2, and every checked report gets a
+sql_validation entry with the outcome. SQLite errors that only reflect
+dialect differences (Postgres functions or syntax SQLite lacks) leave the
+query unverified (valid is None) rather than invalid. Only single read-only
+statements (SELECT / WITH) are accepted.
+
+Queries are validated in a thread pool; identical queries are checked once.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import OptimizeError, ParseError, TokenError
+    from sqlglot.optimizer.qualify import qualify
+except ImportError:  # listed in requirements; without it only the SQLite shadow database check runs
+    sqlglot = None
+
+DEFAULT_SQL_CHECK_WORKERS = 8
+# Schema the discovered tables live in; qualified names (public.listings) resolve too
+DEFAULT_SCHEMA = "public"
+
+_READ_ONLY = re.compile(r"^\s*(?:\(\s*)*(select|with)\b", re.IGNORECASE)
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?$")
+# SQLite errors that mean the query is wrong for the schema, not just for SQLite
+_SCHEMA_ERRORS = ("no such table", "no such column", "ambiguous column name")
+
+
+def sample_type(value: Any) -> str:
+    """SQL type of a sample value (TEXT when unknown)"""
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "BIGINT"
+    if isinstance(value, float):
+        return "DOUBLE PRECISION"
+    if isinstance(value, str) and _ISO_DATE.match(value):
+        return "TIMESTAMP" if len(value) > 10 else "DATE"
+    return "TEXT"
+
+
+class SQLCatalog:
+    """Tables and columns of the discovered schema, with column types where known
+
+    Built from schema analysis output: a list of {table_name, columns,
+    sample_data} entries (or the whole {"description": {"tables": [...]}}
+    document, as a dict or JSON text). Columns may be names or
+    {name, type} objects; types missing from the schema are inferred from
+    sample_data, falling back to TEXT. samples keeps the non-null sample
+    values of every column.
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, str]],
+                 samples: Optional[Dict[str, Dict[str, List[Any]]]] = None):
+        self.tables = {name.lower(): {col.lower(): typ for col, typ in columns.items()}
+                       for name, columns in tables.items()}
+        self.samples = {name.lower(): {col.lower(): values for col, values in columns.items()}
+                        for name, columns in (samples or {}).items()}
+        self.fingerprint = hashlib.sha1(
+            json.dumps(self.tables, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    @classmethod
+    def from_schema(cls, schema: Any) -> "SQLCatalog":
+        if isinstance(schema, str):
+            try:
+                schema = json.loads(schema)
+            except ValueError:
+                schema = []
+        if isinstance(schema, dict):
+            schema = schema.get("description", schema).get("tables", [])
+        tables: Dict[str, Dict[str, str]] = {}
+        samples: Dict[str, Dict[str, List[Any]]] = {}
+        for table in schema or []:
+            if not isinstance(table, dict) or not table.get("table_name"):
+                continue
+            rows = [row for row in table.get("sample_data") or [] if isinstance(row, dict)]
+            columns: Dict[str, str] = {}
+            values: Dict[str, List[Any]] = {}
+            for column in table.get("columns") or []:
+                if isinstance(column, dict):
+                    name = column.get("name") or column.get("column_name")
+                    declared = column.get("type") or column.get("data_type")
+                else:
+                    name, declared = column, None
+                if not name:
+                    continue
+                name = str(name)
+                values[name] = [row[name] for row in rows if row.get(name) is not None]
+                columns[name] = str(declared) if declared else sample_type(values[name][0] if values[name] else None)
+            table_name = str(table["table_name"]).split(".")[-1]
+            tables[table_name] = columns
+            samples[table_name] = values
+        return cls(tables, samples)
+
+    def __bool__(self) -> bool:
+        return bool(self.tables)
+
+    def ddl(self, schema: Optional[str] = None) -> List[str]:
+        prefix = f'"{schema}".' if schema else ""
+        statements = []
+        for table, columns in self.tables.items():
+            # SQLite needs at least one column
+            definitions = ", ".join(f'"{col}" {typ}' for col, typ in columns.items()) or '"_" TEXT'
+            statements.append(f'CREATE TABLE {prefix}"{table}" ({definitions})')
+        return statements
+
+
+_shadow = threading.local()
+
+
+def _shadow_db(catalog: SQLCatalog) -> sqlite3.Connection:
+    """This thread's empty in-memory database with the catalog's tables (main and public)"""
+    databases = getattr(_shadow, "databases", None)
+    if databases is None:
+        databases = _shadow.databases = {}
+    connection = databases.get(catalog.fingerprint)
+    if connection is None:
+        connection = sqlite3.connect(":memory:")
+        connection.execute(f"ATTACH DATABASE ':memory:' AS {DEFAULT_SCHEMA}")
+        for statement in catalog.ddl() + catalog.ddl(DEFAULT_SCHEMA):
+            connection.execute(statement)
+        databases[catalog.fingerprint] = connection
+    return connection
+
+
+def _result(valid: Optional[bool], error: Optional[str] = None, stage: Optional[str] = None) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"valid": valid}
+    if error:
+        result["error"] = error
+        result["stage"] = stage
+    return result
+
+
+def _check_sqlglot(sql: str, catalog: SQLCatalog) -> Optional[Dict[str, Any]]:
+    """Result of the Postgres parse and resolve, or None if sqlglot cannot qualify the query"""
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="postgres") if s is not None]
+    except (ParseError, TokenError) as e:
+        return _result(False, str(e).splitlines()[0], "parse")
+    if len(statements) != 1:
+        return _result(False, "Expected exactly one statement", "parse")
+    expression = statements[0]
+    if not isinstance(expression, (exp.Select, exp.Union, exp.Intersect, exp.Except, exp.Subquery)):
+        return _result(False, f"Only SELECT queries are allowed, got {expression.key.upper()}", "parse")
+
+    ctes = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+    for table in expression.find_all(exp.Table):
+        name = table.name.lower()
+        if name and name not in catalog.tables and name not in ctes:
+            return _result(False, f"Unknown table: {table.name}", "resolve")
+    try:
+        qualify(expression, schema=catalog.tables, dialect="postgres", validate_qualify_columns=True)
+    except OptimizeError as e:
+        return _result(False, str(e), "resolve")
+    except Exception:
+        # qualify does not support every construct; leave it to the shadow database
+        return None
+    return _result(True)
+
+
+def check_sql(sql: str, catalog: SQLCatalog) -> Dict[str, Any]:
+    """Validation result for one query: valid (True, False or None if undecided), error, stage"""
+    if not _READ_ONLY.match(_COMMENTS.sub(" ", sql)):
+        return _result(False, "Only SELECT queries are allowed", "parse")
+    if sqlglot is not None:
+        resolved = _check_sqlglot(sql, catalog)
+        if resolved is not None:
+            return resolved
+    # The original query, not a SQLite translation: translating Postgres
+    # functions can turn their arguments into bogus column references
+    try:
+        _shadow_db(catalog).execute(f"EXPLAIN {sql.strip().rstrip(';')}")
+    except (sqlite3.Warning, sqlite3.ProgrammingError):
+        # Raised by the sqlite3 module (not SQLite) for more than one statement
+        return _result(False, "Expected exactly one statement", "parse")
+    except sqlite3.Error as e:
+        message = str(e)
+        if any(message.startswith(prefix) for prefix in _SCHEMA_ERRORS):
+            return _result(False, message, "shadow_db")
+        # Dialect differences: trust sqlglot's Postgres parse if it ran, otherwise undecided
+        return _result(True) if sqlglot is not None else _result(None, message, "shadow_db")
+    return _result(True)
+
+
+def _is_sql_answer(report: Dict[str, Any]) -> bool:
+    return str(report.get("query_type")).strip() == "1"
+
+
+def validate_reports(reports: Sequence[Dict[str, Any]], catalog: SQLCatalog,
+                     max_workers: int = DEFAULT_SQL_CHECK_WORKERS) -> Dict[str, int]:
+    """Check the sql_query of every report in place and correct query_type; returns counts
+
+    Reports are left untouched when the catalog is empty (schema unknown).
+    """
+    counts = {"checked": 0, "valid": 0, "invalid": 0, "unverified": 0, "downgraded": 0}
+    if not catalog:
+        return counts
+    queries = list(dict.fromkeys(report["sql_query"].strip() for report in reports
+                                 if isinstance(report.get("sql_query"), str) and report["sql_query"].strip()))
+    if queries:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as pool:
+            outcomes = dict(zip(queries, pool.map(lambda sql: check_sql(sql, catalog), queries)))
+    else:
+        outcomes = {}
+
+    for report in reports:
+        sql = report.get("sql_query")
+        if isinstance(sql, str) and sql.strip():
+            outcome = dict(outcomes[sql.strip()])
+        elif _is_sql_answer(report):
+            outcome = _result(False, "query_type is 1 but there is no sql_query", "parse")
+        else:
+            continue
+        counts["checked"] += 1
+        counts[{True: "valid", False: "invalid", None: "unverified"}[outcome["valid"]]] += 1
+        if outcome["valid"] is False and _is_sql_answer(report):
+            outcome["original_query_type"] = report["query_type"]
+            report["query_type"] = 2
+            counts["downgraded"] += 1
+        report["sql_validation"] = outcome
+    return counts
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fast cold start and warm-up for the API services
+
+The services import the agents/openai SDKs where they are used instead of at
+module load, so the server binds its socket and answers /health (liveness) as
+soon as FastAPI itself is loaded. A Warmup routine then runs in the background:
+it imports the SDKs, reads the prompt files, builds clients and opens the
+session stores, so the first real request after a deploy does not pay for
+any of it. /ready (readiness) answers 200 only once the warm-up has finished.
+"""
+import asyncio
+import importlib
+import inspect
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+# Modules that dominate import time and are only needed to serve analyses
+HEAVY_MODULES = ("openai", "agents")
+
+
+def import_modules(modules: Iterable[str] = HEAVY_MODULES) -> Dict[str, float]:
+    """Import modules in order and return seconds spent on each (0 if already loaded)"""
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = round(time.perf_counter() - started, 4)
+    return timings
+
+
+def mask_secret(value: Optional[str]) -> str:
+    """Loggable stand-in for an API key or token: its last 4 characters and length"""
+    if not value:
+        return "<not set>"
+    if len(value) < 12:
+        return f"*** ({len(value)} chars)"
+    return f"***{value[-4:]} ({len(value)} chars)"
+
+
+@lru_cache(maxsize=None)
+def _read_prompt(path: str) -> str:
+    return Path(path).read_text(encoding="utf-8")
+
+
+def read_prompt(path: Union[str, Path]) -> str:
+    """Contents of a prompt file, read from disk once per process"""
+    return _read_prompt(str(Path(path).resolve()))
+
+
+class Warmup:
+    """Ordered warm-up steps, run once in the background after start-up
+
+    Steps are registered with the step() decorator; blocking functions run in
+    a worker thread and coroutine functions on the event loop, so the server
+    keeps answering while warming up. A failing step is recorded and does not
+    stop the remaining steps: the service can still serve, just without that
+    part pre-warmed.
+    """
+
+    def __init__(self):
+        self._steps: List[tuple] = []
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def step(self, name: str, enabled: bool = True) -> Callable:
+        """Register the decorated function as the next warm-up step"""
+        def register(func: Callable) -> Callable:
+            if enabled:
+                self._steps.append((name, func))
+            return func
+        return register
+
+    @property
+    def ready(self) -> bool:
+        return self._finished_at is not None
+
+    async def run(self):
+        self._started_at = time.perf_counter()
+        for name, func in self._steps:
+            self._results[name] = {"status": "running"}
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(func):
+                    detail = await func()
+                else:
+                    detail = await asyncio.to_thread(func)
+                result = {"status": "ok"}
+                if detail is not None:
+                    result["detail"] = detail
+            except Exception as e:
+                print(f"Warm-up step {name} failed: {e}")
+                result = {"status": "error", "error": str(e)}
+            result["seconds"] = round(time.perf_counter() - started, 4)
+            self._results[name] = result
+        self._finished_at = time.perf_counter()
+        print(f"Warm-up finished in {self._finished_at - self._started_at:.2f}s")
+
+    def start(self) -> asyncio.Task:
+        """Run the steps in a background task (once)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness plus per-step status and timings"""
+        if self._started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        return {
+            "ready": self.ready,
+            "status": "ready" if self.ready else "warming_up",
+            "warmup_seconds": round(elapsed, 4),
+            "steps": {
+                name: self._results.get(name, {"status": "pending"}) for name, _ in self._steps
+            },
+        }
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pre-flight token counting and per-stage input budgets
+
+Every agent run and chat completion is measured before it is sent. Counting
+uses tiktoken when it is installed and its encoding is available locally, and
+otherwise an offline approximation of the same BPE pre-tokenization. Each
+stage has an input budget (TOKEN_BUDGETS / TOKEN_BUDGET_DEFAULT, capped by
+the model's context window); requests over budget are compressed first
+(oversized tool outputs and messages are truncated) and then trimmed (the
+oldest conversation turns are dropped), without touching the stored session.
+"""
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional: the approximation below is used instead
+    tiktoken = None
+
+# Input context windows of the models the services use
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-5": 400000,
+    "gpt-5-mini": 400000,
+    "gpt-5-nano": 400000,
+}
+DEFAULT_CONTEXT_WINDOW = 128000
+# Room left in the context window for the model's answer
+OUTPUT_RESERVE_TOKENS = 16384
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+# Single items above this size are truncated first when a request is over budget
+COMPRESS_ITEM_TOKENS = 2000
+# Distinct texts whose counts are remembered: session history is re-counted
+# before every model call of every run, and only the newest items are new
+TOKEN_COUNT_CACHE_SIZE = 4096
+
+# Mirrors the shape of the cl100k/o200k pre-tokenizer: letter runs with an
+# optional leading space, up to three digits, punctuation runs, newlines
+_PRETOKEN = re.compile(r" ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+")
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+class TokenBudgetExceeded(ValueError):
+    """Raised when a request cannot fit the model context window even after trimming"""
+
+    def __init__(self, stage: str, tokens: int, limit: int):
+        super().__init__(f"Stage '{stage}' needs {tokens} input tokens, model limit is {limit}")
+        self.stage = stage
+        self.tokens = tokens
+        self.limit = limit
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+    except KeyError:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+    except Exception:
+        # Encodings are downloaded on first use; offline we fall back to the approximation
+        return None
+
+
+def _approximate_tokens(text: str) -> int:
+    tokens = 0
+    for piece in _PRETOKEN.findall(text):
+        stripped = piece.strip()
+        if not stripped:
+            tokens += 1 if "\n" in piece else 0
+            continue
+        cjk = len(_CJK.findall(stripped))
+        if cjk:
+            tokens += cjk + max(0, len(stripped) - cjk) // 4
+        elif stripped[0].isalpha():
+            # Common words are one token, long ones split roughly every 5 characters
+            tokens += 1 if len(stripped) <= 6 else -(-len(stripped) // 5)
+        elif stripped[0].isdigit():
+            tokens += 1
+        else:
+            tokens += -(-len(stripped) // 2)
+    return tokens
+
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def _text_tokens(text: str, model: Optional[str]) -> int:
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _approximate_tokens(text)
+
+
+def count_tokens(text: Any, model: Optional[str] = None) -> int:
+    """Number of tokens in text (non-strings are counted as their JSON form)"""
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, default=str)
+    return _text_tokens(text, model)
+
+
+def item_tokens(item: Any, model: Optional[str] = None) -> int:
+    """Tokens of one conversation item (message, tool call or tool output)"""
+    if isinstance(item, str):
+        return count_tokens(item, model) + MESSAGE_OVERHEAD_TOKENS
+    if not isinstance(item, dict):
+        return count_tokens(item, model)
+    content = item.get("content")
+    if isinstance(content, str):
+        return count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
+    if isinstance(content, list):
+        text = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+        return count_tokens(text, model) + MESSAGE_OVERHEAD_TOKENS
+    return count_tokens(item, model)
+
+
+def items_tokens(items: List[Any], model: Optional[str] = None) -> int:
+    return sum(item_tokens(item, model) for item in items)
+
+
+def _truncate_text(text: str, max_tokens: int, model: Optional[str]) -> str:
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return text
+    # Keep the head; character ratio is close enough for a cut point
+    keep = max(1, int(len(text) * max_tokens / total))
+    return f"{text[:keep]}\n...[truncated {total - max_tokens} tokens to fit the token budget]"
+
+
+def _compress_item(item: Any, max_tokens: int, model: Optional[str]) -> Any:
+    """Copy of item with its bulky text fields cut down to about max_tokens"""
+    if not isinstance(item, dict):
+        return item
+    compressed = dict(item)
+    content = item.get("content")
+    if isinstance(content, str):
+        compressed["content"] = _truncate_text(content, max_tokens, model)
+    elif isinstance(content, list):
+        compressed["content"] = [
+            dict(part, text=_truncate_text(part["text"], max_tokens, model))
+            if isinstance(part, dict) and isinstance(part.get("text"), str) else part
+            for part in content
+        ]
+    for key in ("output", "arguments"):
+        if isinstance(item.get(key), str):
+            compressed[key] = _truncate_text(item[key], max_tokens, model)
+    return compressed
+
+
+def _is_user_message(item: Any) -> bool:
+    return isinstance(item, str) or (isinstance(item, dict) and item.get("role") == "user")
+
+
+class TokenBudget:
+    """Per-stage input token budgets"""
+
+    def __init__(self, default_budget: int = 120000, stage_budgets: Optional[Dict[str, int]] = None):
+        self.default_budget = default_budget
+        self.stage_budgets = dict(stage_budgets or {})
+
+    @classmethod
+    def from_env(cls) -> "TokenBudget":
+        """Build budgets from TOKEN_BUDGET_DEFAULT and TOKEN_BUDGETS ('{"market_analysis": 60000}')"""
+        stage_budgets = json.loads(os.getenv("TOKEN_BUDGETS", "{}") or "{}")
+        return cls(
+            default_budget=int(os.getenv("TOKEN_BUDGET_DEFAULT", 120000)),
+            stage_budgets={stage: int(value) for stage, value in stage_budgets.items()},
+        )
+
+    @staticmethod
+    def context_limit(model: Optional[str]) -> int:
+        return MODEL_CONTEXT_WINDOWS.get(model or "", DEFAULT_CONTEXT_WINDOW) - OUTPUT_RESERVE_TOKENS
+
+    def budget_for(self, stage: str, model: Optional[str] = None) -> int:
+        return min(self.stage_budgets.get(stage, self.default_budget), self.context_limit(model))
+
+    def fit_items(self, stage: str, model: Optional[str], instructions: Optional[str],
+                  items: List[Any]) -> Tuple[List[Any], int, bool]:
+        """Compress and trim conversation items to the stage budget
+
+        Returns (items, estimated input tokens, changed). Only turns before the
+        latest user message are dropped, so the current request and its tool
+        calls always stay together.
+        """
+        budget = self.budget_for(stage, model)
+        fixed = count_tokens(instructions, model)
+        sizes = [item_tokens(item, model) for item in items]
+        total = fixed + sum(sizes)
+        if total <= budget:
+            return items, total, False
+
+        items = list(items)
+        # 1. Compress: truncate the largest single items first
+        for index in sorted(range(len(items)), key=lambda i: sizes[i], reverse=True):
+            if total <= budget or sizes[index] <= COMPRESS_ITEM_TOKENS:
+                break
+            items[index] = _compress_item(items[index], COMPRESS_ITEM_TOKENS, model)
+            new_size = item_tokens(items[index], model)
+            total -= sizes[index] - new_size
+            sizes[index] = new_size
+
+        # 2. Trim: drop whole turns from the start of the history
+        last_user = max((i for i, item in enumerate(items) if _is_user_message(item)), default=0)
+        drop = 0
+        while total > budget and drop < last_user:
+            total -= sizes[drop]
+            drop += 1
+            while drop < last_user and not _is_user_message(items[drop]):
+                total -= sizes[drop]
+                drop += 1
+        if drop:
+            items = items[drop:]
+
+        limit = self.context_limit(model)
+        if total > limit:
+            raise TokenBudgetExceeded(stage, total, limit)
+        if total > budget:
+            print(f"Token budget: stage {stage} still needs {total} tokens (budget {budget})")
+        return items, total, True
+
+    def fit_messages(self, stage: str, model: Optional[str],
+                     messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Compress chat completion messages to the stage budget (system messages are kept intact)"""
+        budget = self.budget_for(stage, model)
+        sizes = [item_tokens(message, model) for message in messages]
+        total = sum(sizes)
+        if total <= budget:
+            return messages, total, False
+        messages = list(messages)
+        for index in sorted(range(len(messages)), key=lambda i: sizes[i], reverse=True):
+            if total <= budget:
+                break
+            if messages[index].get("role") == "system":
+                continue
+            allowed = max(COMPRESS_ITEM_TOKENS, sizes[index] - (total - budget))
+            messages[index] = _compress_item(messages[index], allowed, model)
+            new_size = item_tokens(messages[index], model)
+            total -= sizes[index] - new_size
+            sizes[index] = new_size
+        limit = self.context_limit(model)
+        if total > limit:
+            raise TokenBudgetExceeded(stage, total, limit)
+        return messages, total, True
+
+
+_token_budget: Optional[TokenBudget] = None
+
+
+def get_token_budget() -> TokenBudget:
+    """Process-wide budgets, configured from the environment on first use"""
+    global _token_budget
+    if _token_budget is None:
+        _token_budget = TokenBudget.from_env()
+    return _token_budget
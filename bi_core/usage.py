@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token usage accounting per pipeline stage
+
+Every LLM call made through run_agent() / chat_completion() reports its input,
+cached input and output tokens under a stage name. Totals are kept for the
+whole process (exposed on /metrics) and, inside a track_usage() block, for
+the current request, so responses can show how much of each stage's prompt
+was served from the provider's prompt cache and how close the pre-flight
+token estimate was to the tokens actually billed.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class UsageTracker:
+    """Thread-safe token totals keyed by stage"""
+
+    FIELDS = ("requests", "input_tokens", "cached_tokens", "output_tokens",
+              "estimated_input_tokens", "trimmed_requests")
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, input_tokens: int = 0, cached_tokens: int = 0,
+               output_tokens: int = 0, requests: int = 1, estimated_input_tokens: int = 0,
+               trimmed: bool = False):
+        with self._lock:
+            totals = self._stages.setdefault(stage, dict.fromkeys(self.FIELDS, 0))
+            totals["requests"] += requests
+            totals["input_tokens"] += input_tokens
+            totals["cached_tokens"] += cached_tokens
+            totals["output_tokens"] += output_tokens
+            totals["estimated_input_tokens"] += estimated_input_tokens
+            totals["trimmed_requests"] += int(trimmed)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-stage totals plus cache hit rate and estimate error (estimated / actual - 1)"""
+        with self._lock:
+            stages = {stage: dict(totals) for stage, totals in self._stages.items()}
+        for totals in stages.values():
+            input_tokens = totals["input_tokens"]
+            totals["cache_hit_rate"] = round(totals["cached_tokens"] / input_tokens, 4) if input_tokens else 0.0
+            totals["estimate_error"] = (
+                round(totals["estimated_input_tokens"] / input_tokens - 1, 4) if input_tokens else 0.0
+            )
+        return stages
+
+
+_process_usage = UsageTracker()
+_request_usage: ContextVar[Optional[UsageTracker]] = ContextVar("request_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[UsageTracker]:
+    """Collect the usage of every LLM call made inside the block (including child tasks)"""
+    tracker = UsageTracker()
+    token = _request_usage.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _request_usage.reset(token)
+
+
+def record_usage(stage: str, input_tokens: int = 0, cached_tokens: int = 0, output_tokens: int = 0,
+                 requests: int = 1, estimated_input_tokens: int = 0, trimmed: bool = False):
+    """Add one call's usage to the process totals and to the current request, if tracked"""
+    args = (stage, input_tokens, cached_tokens, output_tokens, requests, estimated_input_tokens, trimmed)
+    _process_usage.record(*args)
+    tracker = _request_usage.get()
+    if tracker is not None:
+        tracker.record(*args)
+
+
+def usage_metrics() -> Dict[str, Dict[str, Any]]:
+    """Process-wide per-stage usage"""
+    return _process_usage.snapshot()
+
+
+def agent_usage(result) -> Tuple[int, int, int, int]:
+    """(requests, input, cached, output) tokens of an agent run result"""
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    if usage is None:
+        return 0, 0, 0, 0
+    details = getattr(usage, "input_tokens_details", None)
+    return (
+        getattr(usage, "requests", 0) or 0,
+        getattr(usage, "input_tokens", 0) or 0,
+        getattr(details, "cached_tokens", 0) or 0,
+        getattr(usage, "output_tokens", 0) or 0,
+    )
+
+
+def completion_usage(response) -> Tuple[int, int, int, int]:
+    """(requests, input, cached, output) tokens of a chat completion response"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 1, 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (
+        1,
+        getattr(usage, "prompt_tokens", 0) or 0,
+        getattr(details, "cached_tokens", 0) or 0,
+        getattr(usage, "completion_tokens", 0) or 0,
+    )
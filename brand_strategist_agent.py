@@ -8,10 +8,11 @@ from typing import Dict, List
 from jinja2 import Environment, FileSystemLoader
 from pydantic import BaseModel, Field, ConfigDict
 
-from agents import Agent, AgentOutputSchema, HostedMCPTool, ModelSettings, Runner
+from agents import Agent, AgentOutputSchema, HostedMCPTool, ModelSettings
+from bi_core import RetryPolicy, run_agent
+from bi_core.output_models import BrandStrategy, output_data, structured_output
 from dotenv import load_dotenv
 from pathlib import Path
-import time
 
 load_dotenv()
 BRAND_STRATEGIST_PROMPT = (Path(__file__).resolve().parent / "brand_strategist_prompt.md").read_text(encoding="utf-8")
@@ -24,29 +25,24 @@ brand_strategist_agent = Agent(
     model_settings=ModelSettings(
         top_p=0.9,
         temperature=0.7,
-    )
+    ),
+    output_type=structured_output(BrandStrategy)
 )
 
-async def run_with_retry(agent, input_msg, max_retries=3, delay=5):
-    """带重试机制的运行函数"""
-    for attempt in range(max_retries):
-        try:
-            print(f"尝试第 {attempt + 1} 次调用AI Agent...")
-            result = await asyncio.wait_for(
-                Runner.run(agent, input=input_msg),
-                timeout=60  # 60秒超时
-            )
-            return result
-        except asyncio.TimeoutError:
-            print(f"第 {attempt + 1} 次尝试超时")
-        except Exception as e:
-            print(f"第 {attempt + 1} 次尝试失败: {e}")
-        
-        if attempt < max_retries - 1:
-            print(f"等待 {delay} 秒后重试...")
-            await asyncio.sleep(delay)
-    
-    print("所有重试都失败了，使用模拟结果")
+async def run_with_retry(agent, input_msg, max_retries=3, delay=5, timeout=60):
+    """带重试机制的运行函数（指数退避 + 抖动，遵循 Retry-After，只重试可恢复的错误）"""
+    try:
+        print("调用AI Agent...")
+        return await run_agent(
+            agent,
+            input=input_msg,
+            timeout=timeout,  # 单次尝试超时
+            retry_policy=RetryPolicy(max_attempts=max_retries, base_delay=delay)
+        )
+    except Exception as e:
+        print(f"AI Agent 调用失败: {e}")
+
+    print("所有重试都失败了")
     return None
 
 def parse_arguments():
@@ -130,84 +126,32 @@ async def main():
     data = json.loads(path.read_text(encoding="utf-8"))
     data_json = json.dumps(data, ensure_ascii=False, indent=2)
 
-    example_json = """{
-    "chatapp_name": "Aurora Insights",
-    "chatapp_description": "An AI-powered brand platform that transforms analytical insights into compelling, market-ready product narratives.",
-    "chatapp_core_features": [
-        {
-        "feature_title": "Brand Positioning Engine",
-        "intro": "Defines the brand’s competitive edge and value promise using structured strategic logic."
-        }
-    ]
-    }"""
-
     msg = (
         "Help me to do brand design.\n"
         "No extra exlain and question.\n"
+        "'chatapp_core_features' MUST be 4.\n\n"
         "<data>\n"
         f"{data_json}\n"
-        "</data>\n\n"
-        "## Output Schema Example\n"
-        "'chatapp_core_features' MUST be 4. The output must follow this JSON structure:\n"
-        "```json\n"
-        f"{example_json}\n"
-        "```"
+        "</data>"
     )
     # 带重试机制的调用
     result = await run_with_retry(brand_strategist_agent, msg)
     
-    if result:
-        print("AI Agent 调用成功！")
-        print("=" * 50)
-        print(result.final_output)
-        print("=" * 50)
-        
-        # 保存AI Agent的结果到文件
-        result_file = outputs_dir / f"brand_strategy_{timestamp}.json"
-        try:
-            # 尝试解析AI返回的JSON
-            ai_result = json.loads(result.final_output)
-            result_file.write_text(json.dumps(ai_result, ensure_ascii=False, indent=2), encoding="utf-8")
-            print(f"AI Agent结果已保存到: {result_file.name}")
-        except json.JSONDecodeError:
-            # 如果不是JSON格式，保存原始文本
-            result_file.write_text(result.final_output, encoding="utf-8")
-            print(f"AI Agent结果已保存到: {result_file.name}")
-    else:
-        print("AI Agent 调用失败，使用模拟结果")
-        # 生成模拟结果
-        mock_result = {
-            "chatapp_name": "Aurora Insights",
-            "chatapp_description": "An AI-powered brand platform that transforms analytical insights into compelling, market-ready product narratives.",
-            "chatapp_core_features": [
-                {
-                    "feature_title": "Brand Positioning Engine",
-                    "intro": "Defines the brand's competitive edge and value promise using structured strategic logic."
-                },
-                {
-                    "feature_title": "Market Intelligence Hub",
-                    "intro": "Aggregates and analyzes market data to identify opportunities and trends."
-                },
-                {
-                    "feature_title": "Audience Insight Generator",
-                    "intro": "Creates detailed audience personas and behavioral analysis."
-                },
-                {
-                    "feature_title": "Narrative Builder",
-                    "intro": "Transforms insights into compelling brand stories and messaging."
-                }
-            ]
-        }
-        
-        # 保存模拟结果
-        result_file = outputs_dir / f"brand_strategy_{timestamp}.json"
-        result_file.write_text(json.dumps(mock_result, ensure_ascii=False, indent=2), encoding="utf-8")
-        
-        print("=" * 50)
-        print("模拟品牌策略结果:")
-        print(json.dumps(mock_result, ensure_ascii=False, indent=2))
-        print("=" * 50)
-        print(f"结果已保存到: {result_file.name}")
+    if not result:
+        print("AI Agent 调用失败")
+        sys.exit(1)
+    
+    # 输出已由 output_type 校验为 BrandStrategy，无需再解析文本
+    ai_result = output_data(result.final_output)
+    print("AI Agent 调用成功！")
+    print("=" * 50)
+    print(json.dumps(ai_result, ensure_ascii=False, indent=2))
+    print("=" * 50)
+    
+    # 保存AI Agent的结果到文件
+    result_file = outputs_dir / f"brand_strategy_{timestamp}.json"
+    result_file.write_text(json.dumps(ai_result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"AI Agent结果已保存到: {result_file.name}")
 
 
 if __name__ == "__main__":
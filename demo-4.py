@@ -4,11 +4,15 @@ import sys
 import os
 import asyncio
 import copy
-from agents import Agent, Runner, function_tool, ModelSettings, HostedMCPTool, SQLiteSession, WebSearchTool
+from agents import Agent, function_tool, ModelSettings, HostedMCPTool, SQLiteSession, WebSearchTool
 from pathlib import Path
 from dotenv import load_dotenv
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from question_check_test import checkquestion_with_gpt
+from bi_core import DAG, run_agent, stage_agent
+from bi_core.dedup import QuestionClusterer, validate_deduplicated
+from bi_core.question_table import QuestionTable
+from bi_core.output_models import AudienceAnalysis, MarketAnalysis, output_data, output_json, structured_output
 
 
 load_dotenv()
@@ -25,57 +29,14 @@ CUSTOMER_ANALYSIS_PROMPT = (Path(__file__).resolve().parent / "demo2" / "audienc
 
 
 # 解析为DataFrame
-def parse_customer_analysis_to_dataframe(customer_data):
+def parse_customer_analysis_to_dataframe(customer_data, market_name=None):
     """
-    将customer_analysis数据解析为DataFrame，每个question为一行
+    将customer_analysis数据解析为列式问题表（QuestionTable，底层为DataFrame），每个question为一行
     支持多种JSON格式：segments, target_customers, 或直接的问题列表
     """
-    customers_data = []
+    return QuestionTable.from_customer_analysis(customer_data, market_name)
 
-    # 处理不同的JSON结构
-    if 'segments' in customer_data:
-        # 新格式：segments
-        segments = customer_data['segments']
-    elif 'target_customers' in customer_data:
-        # 旧格式：target_customers
-        segments = customer_data['target_customers']
-    elif isinstance(customer_data, list):
-        # 直接是segment列表
-        segments = customer_data
-    else:
-        # 如果都没有，返回空列表
-        print(f"Warning: Unknown customer data format: {list(customer_data.keys())}")
-        return []
 
-    for segment in segments:
-        # 基本信息 - 兼容不同的字段名
-        segment_name = segment.get('segment_name', segment.get('customer_name', 'Unknown'))
-        profile = segment.get('profile', {})
-        
-        base_info = {
-            'customer_name': segment_name,
-            'industry': profile.get('industry', 'Unknown'),
-            'company_size': profile.get('company_size', 'Unknown'),
-            'region': ', '.join(profile.get('region', [])) if isinstance(profile.get('region'), list) else profile.get('region', 'Unknown'),
-            'roles': ', '.join(profile.get('roles', [])) if isinstance(profile.get('roles'), list) else profile.get('roles', 'Unknown'),
-            'willingness_to_pay_tier': segment.get('willingness_to_pay', {}).get('tier', 'Unknown'),
-            'budget_range_usd': segment.get('willingness_to_pay', {}).get('budget_range_usd', 'Unknown')
-        }
-
-        # 为每个问题创建一行
-        valued_questions = segment.get('valued_questions', [])
-        for question in valued_questions:
-            question_info = base_info.copy()
-            question_info.update({
-                'question': question.get('question', ''),
-                'pain_point': question.get('mapped_pain_point', ''),
-                'problem_type': question.get('problem_type', ''),
-                'monetization_path': ', '.join(question.get('monetization_path', [])) if isinstance(question.get('monetization_path'), list) else question.get('monetization_path', ''),
-                'decision_value': question.get('decision_value', '')
-            })
-            customers_data.append(question_info)
-
-    return customers_data
 ### 2. 工具函数
 @function_tool
 def get_current_time() -> str:
@@ -130,187 +91,180 @@ async def main():
     # print(f"✓ Schema description saved to: {schema_path.name}\n")
 
     # ========== Step 2: Market Analysis ==========
-    print("=" * 60)
-    print("STEP 2: Market Analysis")
-    print("=" * 60)
-    
-    market_analysis = await Runner.run(
-        agent,
-        input=MARKET_ANALYSIS_PROMPT,
-        session=session
-    )
-    market_analysis_output = market_analysis.final_output
-    
-    market_path = output_dir / f"market_analysis_{timestamp}.md"
-    market_path.write_text(market_analysis_output, encoding="utf-8")
-    print(f"✓ Market analysis saved to: {market_path.name}")
-    
-    # 解析市场分析 JSON
-    market_analysis_json = json.loads(market_analysis_output)
-    # print(market_analysis_json)
-    
-    # 检查JSON结构并提取市场信息
-    if 'market_segments' in market_analysis_json:
-        market_segments = market_analysis_json['market_segments']
-    elif 'summary' in market_analysis_json:
-        # 如果没有market_segments，创建一个基于summary的市场段
-        market_segments = [{
-            'market_name': market_analysis_json['summary'].get('headline', 'Unknown Market'),
+    async def market_stage():
+        print("=" * 60)
+        print("STEP 2: Market Analysis")
+        print("=" * 60)
+        
+        # 阶段提示词放在系统指令中（稳定前缀，便于提示缓存），输入只说明要执行的流程
+        market_analysis = await run_agent(
+            stage_agent(agent, "market_analysis", MARKET_ANALYSIS_PROMPT, structured_output(MarketAnalysis)),
+            input="Run the market analysis workflow from your instructions on the connected Supabase data.",
+            session=session,
+            stage="market_analysis"
+        )
+        market_analysis_output = output_json(market_analysis.final_output)
+        
+        market_path = output_dir / f"market_analysis_{timestamp}.md"
+        market_path.write_text(market_analysis_output, encoding="utf-8")
+        print(f"✓ Market analysis saved to: {market_path.name}")
+        
+        market_analysis_json = output_data(market_analysis.final_output)
+        
+        # 提取市场信息；没有market_segments时，基于summary创建一个市场段
+        market_segments = market_analysis_json.get('market_segments') or [{
+            'market_name': market_analysis_json['summary']['headline'],
             'description': market_analysis_json['summary'].get('core_insight', ''),
             'strategy': market_analysis_json['summary'].get('strategic_call', '')
         }]
-    else:
-        # 如果都没有，创建一个默认的市场段
-        market_segments = [{
-            'market_name': 'Primary Market',
-            'description': 'Market analysis completed',
-            'strategy': 'Continue with customer analysis'
-        }]
+        return market_analysis_json, market_segments
     
     # 在受众分析之前测试
-    test_run = await Runner.run(
-        agent,
-        input=f"What was the TAM (Total Addressable Market) for {market_segments[0]['market_name']} that we just analyzed?",
-        session=session
-    )
-    print(f"Session test: {test_run.final_output[:100]}...")
-    # 创建一个深拷贝用于合并受众分析（保持原始市场分析不变）
-    integrated_analysis = copy.deepcopy(market_analysis_json)
-
-    print(f"\n📊 Found {len(market_segments)} market(s) to analyze:")
+    async def session_test_stage(market):
+        market_segments = market[1]
+        test_run = await run_agent(
+            agent,
+            input=f"What was the TAM (Total Addressable Market) for {market_segments[0]['market_name']} that we just analyzed?",
+            session=session,
+            stage="session_test"
+        )
+        print(f"Session test: {test_run.final_output[:100]}...")
+        return test_run.final_output
 
     # ========== Step 3: Customer Analysis for Each Market ==========
-    print("=" * 60)
-    print("STEP 3: Customer Analysis (循环处理每个市场)")
-    print("=" * 60)
-    
-    all_validation_reports = []
-    
-    for idx, market in enumerate(market_segments, 1):
-        market_name = market.get("market_name", f"market_{idx}")
-        print(f"\n[{idx}/{len(market_segments)}] Processing Market: {market_name}")
+    # 各市场共用同一个 session 上下文，因此在一个阶段内按顺序处理
+    async def customer_stage(market, session_test):
+        market_analysis_json, market_segments = market
+        # 创建一个深拷贝用于合并受众分析（保持原始市场分析不变）
+        integrated_analysis = copy.deepcopy(market_analysis_json)
+        customer_agent = stage_agent(
+            agent, "customer_analysis", CUSTOMER_ANALYSIS_PROMPT, structured_output(AudienceAnalysis)
+        )
 
-        # 3.1 执行受众分析 - 利用 session 上下文，无需传递完整市场数据
-        customer_prompt = f"""
-Based on our previous market analysis conversation, please focus on the market: **{market_name}**
+        print(f"\n📊 Found {len(market_segments)} market(s) to analyze:")
+        # 相近问题只验证一次，验证结果在各市场间共享
+        question_clusterer = QuestionClusterer.from_env()
+        cluster_reports = {}
 
-{CUSTOMER_ANALYSIS_PROMPT}
+        print("=" * 60)
+        print("STEP 3: Customer Analysis (循环处理每个市场)")
+        print("=" * 60)
+        
+        for idx, market_entry in enumerate(market_segments, 1):
+            market_name = market_entry.get("market_name", f"market_{idx}")
+            print(f"\n[{idx}/{len(market_segments)}] Processing Market: {market_name}")
 
-"""
-        try:
-            customer_analysis = await Runner.run(
-                agent,
-                input=customer_prompt,
-                session=session
+            # 3.1 执行受众分析 - 利用 session 上下文，无需传递完整市场数据
+            # 受众分析提示词在 customer_agent 的系统指令中，这里只传可变的市场名称
+            customer_prompt = (
+                "Run the audience analysis workflow from your instructions on the connected Supabase data.\n"
+                f"Based on our previous market analysis conversation, please focus on the market: **{market_name}**"
             )
-            customer_analysis_output = customer_analysis.final_output
-            
-            # 保存单个市场的受众分析
-            safe_market_name = market_name.replace(" ", "_").replace("/", "_")
-            customer_path = output_dir / f"customer_analysis_{safe_market_name}_{timestamp}.md"
-            customer_path.write_text(customer_analysis_output, encoding="utf-8")
-            print(f"   ✓ Customer analysis saved: {customer_path.name}")
-            
-            # 3.2 将受众分析合并到 integrated_analysis 中（不修改原始 market_analysis_json）
-            customer_json = json.loads(customer_analysis_output)
-            target_market_entry = None
-            for entry in integrated_analysis.get("market_segments", []):
-                if entry.get("market_name") == market_name:
-                    target_market_entry = entry
-                    break
+            try:
+                customer_analysis = await run_agent(
+                    customer_agent,
+                    input=customer_prompt,
+                    session=session,
+                    stage="customer_analysis"
+                )
+                customer_analysis_output = output_json(customer_analysis.final_output)
+                
+                # 保存单个市场的受众分析
+                safe_market_name = market_name.replace(" ", "_").replace("/", "_")
+                customer_path = output_dir / f"customer_analysis_{safe_market_name}_{timestamp}.md"
+                customer_path.write_text(customer_analysis_output, encoding="utf-8")
+                print(f"   ✓ Customer analysis saved: {customer_path.name}")
+                
+                # 3.2 将受众分析合并到 integrated_analysis 中（不修改原始 market_analysis_json）
+                customer_json = output_data(customer_analysis.final_output)
+                target_market_entry = None
+                for entry in integrated_analysis.get("market_segments", []):
+                    if entry.get("market_name") == market_name:
+                        target_market_entry = entry
+                        break
 
-            if target_market_entry is None:
-                target_market_entry = {"market_name": market_name}
-                integrated_analysis.setdefault("market_segments", []).append(target_market_entry)
+                if target_market_entry is None:
+                    target_market_entry = {"market_name": market_name}
+                    integrated_analysis.setdefault("market_segments", []).append(target_market_entry)
 
-            target_market_entry["customer_analysis"] = customer_json
-            print("   ✓ Customer analysis merged into integrated analysis")
-            
-            # # 3.3 数据建模验证
-            print(f"   → Running data modeling validation...")
-            market_reports = []
-            question_data = parse_customer_analysis_to_dataframe(customer_json)
-            print("=== question_check  ===")
-            reports_list = []
-            for question in question_data:
-                # print(i)
-                report = checkquestion_with_gpt(question, "schema_analysis_output")
-                reports_list.append(report)
-            
-            # 将验证报告也合并到 integrated_analysis 中
-            if market_name not in integrated_analysis:
-                integrated_analysis[market_name] = {}
-            integrated_analysis[market_name]["validation_reports"] = reports_list
-            print(f"   ✓ Validation complete: {len(reports_list)} questions validated\n")
+                target_market_entry["customer_analysis"] = customer_json
+                print("   ✓ Customer analysis merged into integrated analysis")
+                
+                # # 3.3 数据建模验证（同步 GPT 调用放到线程中执行）
+                print(f"   → Running data modeling validation...")
+                question_data = parse_customer_analysis_to_dataframe(customer_json, market_name).records()
+                print("=== question_check  ===")
+                reports_list = await asyncio.to_thread(
+                    validate_deduplicated, question_data,
+                    lambda question: checkquestion_with_gpt(question, "schema_analysis_output"),
+                    question_clusterer, cluster_reports
+                )
+                
+                # 将验证报告也合并到 integrated_analysis 中
+                if market_name not in integrated_analysis:
+                    integrated_analysis[market_name] = {}
+                integrated_analysis[market_name]["validation_reports"] = reports_list
+                print(f"   ✓ Validation complete: {len(reports_list)} questions validated\n")
 
-        except Exception as e:
-            print(f"   ✗ Error processing market {market_name}: {e}\n")
-            # 确保使用正确的键名
-            if market_name not in integrated_analysis:
-                integrated_analysis[market_name] = {}
-            integrated_analysis[market_name]["customer_analysis"] = {
-                "error": str(e),
-                "status": "failed"
-            }
+            except Exception as e:
+                print(f"   ✗ Error processing market {market_name}: {e}\n")
+                # 确保使用正确的键名
+                if market_name not in integrated_analysis:
+                    integrated_analysis[market_name] = {}
+                integrated_analysis[market_name]["customer_analysis"] = {
+                    "error": str(e),
+                    "status": "failed"
+                }
+        return integrated_analysis
 
     # ========== Step 4: 保存完整的分析结果 ==========
-    print("=" * 60)
-    print("STEP 4: Saving Complete Analysis Results")
-    print("=" * 60)
-    
-    # 4.1 保存纯市场分析（不含受众分析）
-    pure_market_analysis = {
-        "metadata": {
-            "analysis_type": "market_analysis_only",
-            "analysis_timestamp": timestamp,
-            "analysis_date": datetime.now().isoformat(),
-        },
-        "markets": market_analysis_json
-    }
-    
-    pure_market_path = output_dir / f"market_analysis_pure_{timestamp}.json"
-    pure_market_path.write_text(
-        json.dumps(pure_market_analysis, indent=2, ensure_ascii=False),
-        encoding="utf-8"
-    )
-    print(f"✓ Pure market analysis saved: {pure_market_path.name}")
-    
-    # 4.2 保存集成分析（市场分析 + 受众分析）
-    integrated_analysis_output = {
-        "metadata": {
-            "analysis_type": "integrated_market_and_customer",
-            "analysis_timestamp": timestamp,
-            "analysis_date": datetime.now().isoformat(),
-        },
-        "markets": integrated_analysis
-    }
-    
-    # 将验证报告添加到集成分析中
-    if market_name in integrated_analysis and "customer_analysis" in integrated_analysis[market_name]:
-        # 如果customer_analysis是字典格式，直接添加validation_reports
-        if isinstance(integrated_analysis[market_name]["customer_analysis"], dict):
-            integrated_analysis[market_name]["customer_analysis"]["validation_reports"] = reports_list
-        # 如果customer_analysis是列表格式，添加到第一个元素
-        elif isinstance(integrated_analysis[market_name]["customer_analysis"], list) and len(integrated_analysis[market_name]["customer_analysis"]) > 0:
-     
-            integrated_analysis[market_name]["customer_analysis"][0]["validation_reports"] = reports_list
-    integrated_path = output_dir / f"integrated_analysis_{timestamp}.json"
-    integrated_path.write_text(
-        json.dumps(integrated_analysis_output, indent=2, ensure_ascii=False),
-        encoding="utf-8"
-    )
-    print(f"✓ Integrated analysis saved: {integrated_path.name}")
-    
-    # 4.3 保存所有验证报告汇总
-    
-    
-    # # 返回关键数据供后续使用
-    # return {
-    #     "market_analysis": market_analysis_json,
-    #     "integrated_analysis": integrated_analysis,
-    #     "validation_reports": all_validation_reports,
-    #     "timestamp": timestamp
-    # }
+    def save_stage(market, customer_analysis):
+        print("=" * 60)
+        print("STEP 4: Saving Complete Analysis Results")
+        print("=" * 60)
+        
+        # 4.1 保存纯市场分析（不含受众分析）
+        pure_market_analysis = {
+            "metadata": {
+                "analysis_type": "market_analysis_only",
+                "analysis_timestamp": timestamp,
+                "analysis_date": datetime.now().isoformat(),
+            },
+            "markets": market[0]
+        }
+        
+        pure_market_path = output_dir / f"market_analysis_pure_{timestamp}.json"
+        pure_market_path.write_text(
+            json.dumps(pure_market_analysis, indent=2, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        print(f"✓ Pure market analysis saved: {pure_market_path.name}")
+        
+        # 4.2 保存集成分析（市场分析 + 受众分析，验证报告已按市场合并）
+        integrated_analysis_output = {
+            "metadata": {
+                "analysis_type": "integrated_market_and_customer",
+                "analysis_timestamp": timestamp,
+                "analysis_date": datetime.now().isoformat(),
+            },
+            "markets": customer_analysis
+        }
+        
+        integrated_path = output_dir / f"integrated_analysis_{timestamp}.json"
+        integrated_path.write_text(
+            json.dumps(integrated_analysis_output, indent=2, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        print(f"✓ Integrated analysis saved: {integrated_path.name}")
+        return integrated_analysis_output
+
+    pipeline = DAG("demo_4")
+    pipeline.add_stage("market", market_stage)
+    pipeline.add_stage("session_test", session_test_stage, inputs=["market"])
+    pipeline.add_stage("customer_analysis", customer_stage, inputs=["market", "session_test"])
+    pipeline.add_stage("save", save_stage, inputs=["market", "customer_analysis"])
+    outcome = await pipeline.run()
+    print(f"stage timings: {json.dumps(outcome.timings)}")
 
 
 if __name__ == "__main__":
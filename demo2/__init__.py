@@ -12,6 +12,7 @@ __author__ = "AI Analysis Team"
 
 # Import core functions for easy access
 from .demo_2_core import (
+    get_session,
     initialize_agent,
     run_schema_analysis,
     run_market_analysis,
@@ -20,6 +21,7 @@ from .demo_2_core import (
 )
 
 __all__ = [
+    "get_session",
     "initialize_agent",
     "run_schema_analysis", 
     "run_market_analysis",
@@ -10,7 +10,10 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any
 
-from agents import Agent, Runner, function_tool, ModelSettings, HostedMCPTool, SQLiteSession, WebSearchTool
+from agents import Agent, function_tool, ModelSettings, HostedMCPTool, SQLiteSession, WebSearchTool
+from bi_core import run_agent, stage_agent
+from bi_core.startup import read_prompt
+from bi_core.output_models import AudienceAnalysis, MarketAnalysis, output_json, structured_output
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -22,6 +25,10 @@ def get_current_time() -> str:
     """Get current time in ISO format"""
     return datetime.now().astimezone().isoformat()
 
+def get_session(user_name: str) -> SQLiteSession:
+    """The user's persistent conversation session"""
+    return SQLiteSession(user_name, f"{user_name}_conversations.db")
+
 async def initialize_agent(
     supabase_project_url: str,
     supabase_access_token: str,
@@ -39,7 +46,7 @@ async def initialize_agent(
         Initialized Agent instance
     """
     # Read prompt files
-    BUSINESS_EXPERT_PROMPT = (Path(__file__).resolve().parent / "system_prompt.md").read_text(encoding="utf-8")
+    BUSINESS_EXPERT_PROMPT = read_prompt(Path(__file__).resolve().parent / "system_prompt.md")
     
     # Create agent
     agent = Agent(
@@ -67,24 +74,26 @@ async def initialize_agent(
     
     return agent
 
-async def run_schema_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
+async def run_schema_analysis(agent: Agent, user_name: str, session=None) -> Dict[str, Any]:
     """
     Run schema analysis
     
     Args:
         agent: Initialized agent
         user_name: User identifier
+        session: Session to use instead of the user's own (e.g. a SessionFork branch)
         
     Returns:
         Dictionary containing output and generated files
     """
-    session = SQLiteSession(user_name, f"{user_name}_conversations.db")
+    session = session if session is not None else get_session(user_name)
     
     print(" =======  schema analysis ======= ")
-    schema_analysis = await Runner.run(
+    schema_analysis = await run_agent(
         agent,
         input="use supabase mcp tools, give me a data analysis report in Supabase public schema.",
-        session=session
+        session=session,
+        stage="schema_analysis"
     )
     
     output = schema_analysis.final_output
@@ -100,30 +109,33 @@ async def run_schema_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
         "files": [str(md_path)]
     }
 
-async def run_market_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
+async def run_market_analysis(agent: Agent, user_name: str, session=None) -> Dict[str, Any]:
     """
     Run market analysis
     
     Args:
         agent: Initialized agent
         user_name: User identifier
+        session: Session to use instead of the user's own (e.g. a SessionFork branch)
         
     Returns:
         Dictionary containing output and generated files
     """
     # Read market analysis prompt
-    MARKET_ANALYSIS_PROMPT = (Path(__file__).resolve().parent / "market_analysis_prompt.md").read_text(encoding="utf-8")
+    MARKET_ANALYSIS_PROMPT = read_prompt(Path(__file__).resolve().parent / "market_analysis_prompt.md")
     
-    session = SQLiteSession(user_name, f"{user_name}_conversations.db")
+    session = session if session is not None else get_session(user_name)
     
     print("======== Market Analysis ========")
-    market_analysis = await Runner.run(
-        agent,
-        input=MARKET_ANALYSIS_PROMPT,
-        session=session
+    # The stage prompt goes into the system instructions so it stays in the cacheable prefix
+    market_analysis = await run_agent(
+        stage_agent(agent, "market_analysis", MARKET_ANALYSIS_PROMPT, structured_output(MarketAnalysis)),
+        input="Run the market analysis workflow from your instructions on the connected Supabase data.",
+        session=session,
+        stage="market_analysis"
     )
     
-    output = market_analysis.final_output
+    output = output_json(market_analysis.final_output)
     
     # Save to file
     output_dir = Path(__file__).resolve().parent / "outputs"
@@ -136,30 +148,32 @@ async def run_market_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
         "files": [str(md_path)]
     }
 
-async def run_audience_analysis(agent: Agent, user_name: str) -> Dict[str, Any]:
+async def run_audience_analysis(agent: Agent, user_name: str, session=None) -> Dict[str, Any]:
     """
     Run audience analysis
     
     Args:
         agent: Initialized agent
         user_name: User identifier
+        session: Session to use instead of the user's own (e.g. a SessionFork branch)
         
     Returns:
         Dictionary containing output and generated files
     """
     # Read audience analysis prompt
-    AUDIENCE_ANALYSIS_PROMPT = (Path(__file__).resolve().parent / "audience_analysis_prompt.md").read_text(encoding="utf-8")
+    AUDIENCE_ANALYSIS_PROMPT = read_prompt(Path(__file__).resolve().parent / "audience_analysis_prompt.md")
     
-    session = SQLiteSession(user_name, f"{user_name}_conversations.db")
+    session = session if session is not None else get_session(user_name)
     
     print("======== audience Analysis =========")
-    audience_analysis = await Runner.run(
-        agent, 
-        input=AUDIENCE_ANALYSIS_PROMPT,
-        session=session
+    audience_analysis = await run_agent(
+        stage_agent(agent, "audience_analysis", AUDIENCE_ANALYSIS_PROMPT, structured_output(AudienceAnalysis)),
+        input="Run the audience analysis workflow from your instructions on the connected Supabase data.",
+        session=session,
+        stage="audience_analysis"
     )
     
-    output = audience_analysis.final_output
+    output = output_json(audience_analysis.final_output)
     
     # Save to file
     output_dir = Path(__file__).resolve().parent / "outputs"
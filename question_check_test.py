@@ -1,18 +1,17 @@
 import json
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
+from bi_core import chat_completion, openai_client
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-def checkquestion_with_gpt(question_info, tables_info):
-    # print(table_name,schema_data,sample_data)
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    # print(client)
-    prompt = f"""
-You are a data analysis and modeling expert. Below is the database table information: {tables_info}.
-Please determine, based on {tables_info}, whether it is possible to answer the following question from the data: {question_info.get("question")}.
+# Static instructions go first (system message) and the table information
+# before the per-question part, so checks with the same tables share a prefix
+# that the provider's prompt cache can serve. Callers pass only the slice of
+# the schema relevant to the question (SchemaIndex.slice) as tables_info.
+QUESTION_CHECK_INSTRUCTIONS = """
+You are a data analysis and modeling expert. You are given database table information and a question object.
 
 For each question, output a JSON object with the following requirements:
 
@@ -32,7 +31,7 @@ Output format:
 
 The result must be in English.
 
-The output must be in JSON format, based on the original {question_info} object, with the following additional fields:
+The output must be in JSON format, based on the original question object, with the following additional fields:
 
 sql_query: the executable SQL statement if applicable; otherwise NULL if modeling is required or the question cannot be answered.
 
@@ -45,9 +44,24 @@ query_type:
 3 → cannot be answered from the data.
 """
 
-    response = client.chat.completions.create(
+def checkquestion_with_gpt(question_info, tables_info):
+    # print(table_name,schema_data,sample_data)
+    client = openai_client()
+    # print(client)
+    prompt = f"""
+Below is the database table information: {tables_info}.
+Please determine, based on the table information, whether it is possible to answer the following question from the data: {question_info.get("question")}.
+Question object: {question_info}
+"""
+
+    response = chat_completion(
+        client,
         model="gpt-5-nano",
-        messages=[{"role": "user", "content": prompt}],
+        messages=[
+            {"role": "system", "content": QUESTION_CHECK_INSTRUCTIONS},
+            {"role": "user", "content": prompt}
+        ],
+        stage="question_check",
         # temperature=0
     )
     # print(response)
@@ -2,10 +2,13 @@
 """
 启动 Analysis API 服务的脚本
 """
-import uvicorn
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
+from bi_core.server import run_server
+from bi_core.startup import mask_secret
+
 def main():
     """启动 API 服务"""
     # 加载环境变量
@@ -20,11 +23,11 @@ def main():
     print("=" * 60)
     print("RENDER 环境变量检查")
     print("=" * 60)
-    print(f"OPENAI_API_KEY: {openai_key}")
+    print(f"OPENAI_API_KEY: {mask_secret(openai_key)}")
     print(f"密钥长度: {len(openai_key) if openai_key else 0}")
     print(f"包含星号: {'*' in openai_key if openai_key else False}")
     print(f"SUPABASE_PROJECT_URL: {os.getenv('SUPABASE_PROJECT_URL')}")
-    print(f"SUPABASE_ACCESS_TOKEN: {os.getenv('SUPABASE_ACCESS_TOKEN')}")
+    print(f"SUPABASE_ACCESS_TOKEN: {mask_secret(os.getenv('SUPABASE_ACCESS_TOKEN'))}")
     print(f"USER_NAME: {os.getenv('USER_NAME')}")
     print(f"DATA_REVIEW_RESULT: {os.getenv('DATA_REVIEW_RESULT')}")
     print(f"ENVIRONMENT: {os.getenv('ENVIRONMENT')}")
@@ -35,7 +38,7 @@ def main():
             print(f"警告: OPENAI_API_KEY 可能无效 (包含星号或长度不足)")
             print("将使用降级方案")
         else:
-            print(f"OPENAI_API_KEY 已设置: {openai_key[:20]}...")
+            print(f"OPENAI_API_KEY 已设置: {mask_secret(openai_key)}")
     
     if missing_vars:
         print(f"警告: 以下环境变量未设置: {', '.join(missing_vars)}")
@@ -50,15 +53,12 @@ def main():
     # 获取端口，Render 会通过环境变量 PORT 指定端口
     port = int(os.environ.get("PORT", 8000))
     
-    # 检查是否为开发环境
-    is_development = os.environ.get("ENVIRONMENT", "production") == "development"
-    
-    uvicorn.run(
+    # ENVIRONMENT=development: 单进程热重载; 否则多 worker 生产模式 (WEB_CONCURRENCY 等)
+    run_server(
         "analysis_api:app",  # 使用 AI 分析 API
         host="0.0.0.0",
         port=port,
-        reload=is_development,  # 只在开发环境启用热重载
-        log_level="info"
+        app_dir=str(Path(__file__).resolve().parent)
     )
 
 if __name__ == "__main__":
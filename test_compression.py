@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.compression 请求体解压测试（离线，pytest）
+"""
+import asyncio
+import gzip
+import threading
+import tracemalloc
+import zlib
+
+import pytest
+
+from bi_core import compression
+from bi_core.compression import (CompressionMiddleware, RequestBodyTooLarge, RequestDecompressionMiddleware,
+                                  decompress_body)
+
+PAYLOAD = b'{"tables_info": [' + b'{"table_name": "listings", "columns": ["id", "price"]},' * 2000 + b'{}]}'
+# 256 MB of zeros: a few hundred KB compressed
+BOMB_SIZE = 256 * 1024 * 1024
+
+
+def _compress(encoding, data):
+    if encoding == "gzip":
+        return gzip.compress(data)
+    if encoding == "deflate":
+        return zlib.compress(data)
+    if encoding == "br":
+        return pytest.importorskip("brotli").compress(data, quality=1)
+    return pytest.importorskip("zstandard").ZstdCompressor(level=1).compress(data)
+
+
+def _bomb(encoding):
+    if encoding in ("gzip", "deflate"):
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 31 if encoding == "gzip" else zlib.MAX_WBITS)
+        block = bytes(1024 * 1024)
+        return b"".join(compressor.compress(block) for _ in range(BOMB_SIZE // len(block))) + compressor.flush()
+    return _compress(encoding, bytes(BOMB_SIZE))
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "br", "zstd"])
+def test_round_trip(encoding):
+    assert decompress_body(_compress(encoding, PAYLOAD), encoding, len(PAYLOAD)) == PAYLOAD
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "br", "zstd"])
+def test_bomb_is_stopped_at_the_limit(encoding):
+    bomb = _bomb(encoding)
+    tracemalloc.start()
+    try:
+        with pytest.raises(RequestBodyTooLarge):
+            decompress_body(bomb, encoding, 1024 * 1024)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Never more than the limit plus a chunk or two is held, not the expanded bomb
+    assert peak < 8 * 1024 * 1024
+
+
+def test_unsupported_encodings_are_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        decompress_body(b"data", "compress", 100)
+    monkeypatch.setattr(compression, "zstandard", None)
+    with pytest.raises(ValueError):
+        decompress_body(b"data", "zstd", 100)
+
+
+def test_br_needs_a_decoder_that_caps_its_output(monkeypatch):
+    brotli = pytest.importorskip("brotli")
+
+    class OldDecompressor:
+        process = brotli.Decompressor.process
+
+    monkeypatch.setattr(brotli, "Decompressor", OldDecompressor)
+    with pytest.raises(ValueError):
+        decompress_body(_compress("br", PAYLOAD), "br", len(PAYLOAD))
+
+
+async def _upload(middleware, chunks, content_length=None):
+    """Send a gzip body in the given chunks, returning (status, chunks read, body seen by the app)"""
+    headers = [(b"content-encoding", b"gzip")]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {"type": "http", "method": "POST", "path": "/review", "headers": headers}
+    pending = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+               for i, chunk in enumerate(chunks)]
+    read, seen, sent = [0], [], []
+
+    async def receive():
+        read[0] += 1
+        return pending.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    async def app(scope, receive, send):
+        seen.append((await receive())["body"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    await middleware(app)(scope, receive, send)
+    return sent[0]["status"], read[0], seen
+
+
+def _decompression(**kwargs):
+    return lambda app: RequestDecompressionMiddleware(app, paths=["/review"], **kwargs)
+
+
+def test_oversized_compressed_upload_stops_reading():
+    # Never decoded, so the chunks need not be valid gzip
+    chunks = [bytes(1024)] * 16
+    status, read, seen = asyncio.run(_upload(_decompression(max_compressed_size=4096), chunks))
+    assert status == 413 and seen == []
+    assert read == 5 < len(chunks)
+
+
+def test_declared_content_length_over_the_cap_is_rejected_unread():
+    status, read, _ = asyncio.run(_upload(_decompression(max_compressed_size=1024), [bytes(4096)], 4096))
+    assert status == 413 and read == 0
+
+
+def test_large_bodies_are_decoded_in_a_worker_thread(monkeypatch):
+    threads = []
+
+    def tracking(body, encoding, max_size):
+        threads.append(threading.current_thread())
+        return decompress_body(body, encoding, max_size)
+
+    monkeypatch.setattr(compression, "decompress_body", tracking)
+    body = gzip.compress(PAYLOAD)
+    for offload_size in (len(body), len(body) + 1):
+        status, _, seen = asyncio.run(_upload(_decompression(offload_size=offload_size), [body]))
+        assert status == 200 and seen == [PAYLOAD]
+    assert threads[0] is not threading.main_thread() and threads[1] is threading.main_thread()
+
+
+def test_large_responses_are_compressed_in_a_worker_thread(monkeypatch):
+    threads = []
+    encoder_class = compression._GzipEncoder
+
+    class TrackingEncoder(encoder_class):
+        def compress(self, data):
+            threads.append(threading.current_thread())
+            return super().compress(data)
+
+    monkeypatch.setattr(compression, "_GzipEncoder", TrackingEncoder)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": PAYLOAD, "more_body": True})
+        await send({"type": "http.response.body", "body": b"{}", "more_body": False})
+
+    async def scenario():
+        middleware = CompressionMiddleware(app, encodings=["gzip"], offload_size=1024)
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(scope, None, send)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert gzip.decompress(b"".join(m.get("body", b"") for m in sent[1:])) == PAYLOAD + b"{}"
+    assert threads[0] is not threading.main_thread() and threads[1] is threading.main_thread()
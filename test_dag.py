@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.dag / bi_core.checkpoints 流水线与断点续跑测试（离线，pytest）
+"""
+import asyncio
+import threading
+
+import pytest
+
+from bi_core.checkpoints import CheckpointStore, RunCheckpointCache
+from bi_core.dag import DAG, SkipStage, StageFailed
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints.db"))
+
+
+def _pipeline(calls, fail_report=False):
+    """market -> segments -> report, with schema alongside; every call is recorded"""
+    dag = DAG("test")
+
+    def stage(name, value):
+        def run(**kwargs):
+            calls.append(name)
+            if name == "report" and fail_report:
+                raise RuntimeError("model unavailable")
+            return value
+        return run
+
+    dag.add_stage("market", stage("market", {"headline": "A"}), cache_key="market")
+    dag.add_stage("schema", stage("schema", ["listings"]), blocking=True, cache_key="schema")
+    dag.add_stage("segments", stage("segments", ["A"]), inputs=["market"], cache_key="segments")
+    dag.add_stage("report", stage("report", "done"), inputs=["segments", "schema"], cache_key="report",
+                  retries=1, retry_delay=0)
+    return dag
+
+
+def test_failed_stage_raises_after_its_retries(store):
+    calls = []
+    store.start_run("r1", {"analysis_type": "integrated"})
+    with pytest.raises(StageFailed) as failure:
+        asyncio.run(_pipeline(calls, fail_report=True).run(cache=RunCheckpointCache(store, "r1")))
+    assert failure.value.stage == "report" and isinstance(failure.value.cause, RuntimeError)
+    assert calls.count("report") == 2
+    # Stages that finished before the failure are checkpointed, the failed one is not
+    assert sorted(store.completed_steps("r1")) == ["market", "schema", "segments"]
+
+
+def test_resume_runs_only_the_stages_without_a_checkpoint(store):
+    with pytest.raises(StageFailed):
+        asyncio.run(_pipeline([], fail_report=True).run(cache=RunCheckpointCache(store, "r1")))
+
+    calls = []
+    result = asyncio.run(_pipeline(calls).run(cache=RunCheckpointCache(store, "r1")))
+    assert calls == ["report"]
+    assert result.status == {"market": "cached", "schema": "cached", "segments": "cached", "report": "done"}
+    assert result["segments"] == ["A"] and result["report"] == "done"
+    # Another run id shares nothing
+    calls.clear()
+    asyncio.run(_pipeline(calls).run(cache=RunCheckpointCache(store, "r2")))
+    assert sorted(calls) == ["market", "report", "schema", "segments"]
+
+
+def test_skipped_blocking_stage_skips_its_dependents():
+    threads = []
+    dag = DAG("test")
+
+    def schema():
+        threads.append(threading.current_thread())
+        raise SkipStage()
+
+    dag.add_stage("schema", schema, blocking=True)
+    dag.add_stage("validation", lambda schema: "never", inputs=["schema"])
+    dag.add_stage("market", lambda: "market")
+    dag.add_stage("audit", lambda: "never", blocking=True, when=lambda enabled: enabled, inputs=["enabled"])
+    result = asyncio.run(dag.run({"enabled": False}))
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert result.status == {"schema": "skipped", "validation": "skipped", "market": "done", "audit": "skipped"}
+    assert not result.ran("validation") and result["market"] == "market"
+
+
+def test_checkpoint_step_saves_only_successful_results(store):
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("timeout")
+        return {"segments": 3}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.step("r1", "customer_analysis:A", flaky))
+    assert store.load_step("r1", "customer_analysis:A") is None
+    assert asyncio.run(store.step("r1", "customer_analysis:A", flaky)) == {"segments": 3}
+    assert asyncio.run(store.step("r1", "customer_analysis:A", flaky)) == {"segments": 3}
+    assert len(attempts) == 2
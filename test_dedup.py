@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.dedup 相似问题聚类测试（离线，pytest）
+"""
+import pytest
+
+from bi_core.dedup import QuestionClusterer, normalize_question, question_key, validate_deduplicated
+
+
+def _merged(first, second, threshold=0.8):
+    first_id, second_id = QuestionClusterer(threshold).assign([first, second])
+    return first_id == second_id
+
+
+def test_rephrasings_merge():
+    assert _merged("Which neighbourhoods have the highest average nightly price?",
+                   "Which neighbourhoods have the highest average nightly prices?")
+    assert _merged("How many listings are there per room type?", "How many listings are there per room type")
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Which neighbourhoods have the highest average nightly price?",
+     "Which neighbourhoods have the lowest average nightly price?"),
+    ("Which hosts have the most listings?", "Which hosts have the least listings?"),
+    ("How many listings are priced above the neighbourhood average?",
+     "How many listings are priced below the neighbourhood average?"),
+    ("Did the number of reviews increase after the summer season?",
+     "Did the number of reviews decrease after the summer season?"),
+    ("哪些街区的平均价格最高？", "哪些街区的平均价格最低？"),
+])
+def test_opposite_directions_never_merge(first, second):
+    assert not _merged(first, second, threshold=0.1)
+
+
+def test_different_numbers_never_merge():
+    assert not _merged("Reviews in the last 6 months", "Reviews in the last 12 months", threshold=0.1)
+
+
+def test_synonymous_directions_share_a_key():
+    assert question_key(normalize_question("Top rated hosts")) == question_key(normalize_question("Best rated hosts"))
+    assert question_key(normalize_question("Average price in 2023")) == (("2023",), ())
+
+
+def test_exact_threshold_only_merges_identical_text():
+    clusterer = QuestionClusterer(threshold=1)
+    assert clusterer.assign(["How many listings?", "how many listings", "How many listing?"]) == [0, 0, 1]
+
+
+def test_clusters_persist_across_calls():
+    clusterer = QuestionClusterer()
+    assert clusterer.assign(["Which hosts have the most listings?"]) == [0]
+    assert clusterer.assign(["Which hosts have the least listings?", "which hosts have the most listings"]) == [1, 0]
+
+
+def test_validate_deduplicated_fans_out_reports():
+    checked = []
+
+    def check(question):
+        checked.append(question["question"])
+        return dict(question, query_type=1, sql_query="SELECT 1")
+
+    questions = [{"question": "Which hosts have the most listings?", "segment": "a"},
+                 {"question": "Which hosts have the most listings", "segment": "b"},
+                 {"question": "Which hosts have the least listings?", "segment": "c"}]
+    reports = validate_deduplicated(questions, check, QuestionClusterer())
+    assert checked == ["Which hosts have the most listings?", "Which hosts have the least listings?"]
+    assert [report["segment"] for report in reports] == ["a", "b", "c"]
+    assert reports[1]["representative_question"] == "Which hosts have the most listings?"
+    assert "representative_question" not in reports[2]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.export 流式导出测试（离线，pytest）
+"""
+import csv
+import io
+import json
+
+import orjson
+import pytest
+
+from bi_core.export import ExportError, MissingSection, export_section, flatten, iter_items
+
+SEGMENT = {
+    "segment_name": "Investors",
+    "profile": {"industry": "Real estate", "region": ["EU", "US"]},
+    "valued_questions": [
+        {"question": "Which neighbourhoods have the highest price?", "decision_value": "High"},
+        {"question": "How many listings per room type?", "decision_value": "Low"},
+    ],
+}
+INTEGRATED = {
+    "run_id": "r1",
+    "market_segments": [{"market_name": "A", "tam_usd": 10}, {"market_name": "B", "tam_usd": 2.5}],
+    "integrated_analysis": {"markets": {"market_segments": [
+        {"market_name": "A", "customer_analysis": {"segments": [SEGMENT]}},
+        {"market_name": "B"},
+    ]}},
+    "validation_reports": [
+        {"question": 'He said "hi" [ok] {x}', "query_type": 1, "sql_validation": {"valid": True}},
+        {"question": "back\\slash", "query_type": "2", "sql_validation": None},
+    ],
+}
+ANALYZE = {
+    "market_analysis": json.dumps({"market_segments": [{"market_name": "C"}]}),
+    "audience_analysis": json.dumps({"segments": [SEGMENT]}),
+    "question_validation": [{"question": "q", "query_type": 3}],
+    "data_compliance": {"tables_audited": [{"table_name": "listings", "allowed_to_use": True}],
+                        "final_conclusion": True},
+}
+
+
+def _bytes(document, indent=False):
+    return json.dumps(document, indent=2 if indent else None).encode("utf-8")
+
+
+def _export(document, section, export_format="ndjson"):
+    return b"".join(export_section(_bytes(document), section, export_format))
+
+
+@pytest.mark.parametrize("indent", [False, True])
+def test_iter_items_matches_decoded_document(indent):
+    raw = _bytes(INTEGRATED, indent)
+    assert list(iter_items(raw, "/validation_reports/*")) == INTEGRATED["validation_reports"]
+    assert list(iter_items(raw, "/market_segments/1/tam_usd")) == [2.5]
+    assert list(iter_items(raw, "/integrated_analysis/markets/market_segments/*/market_name")) == ["A", "B"]
+    assert list(iter_items(raw, "/missing/*")) == []
+
+
+def test_malformed_document_raises():
+    with pytest.raises(ExportError):
+        list(iter_items(b'{"a": [1, 2', "/a/*"))
+
+
+def test_flatten_writes_nested_values_as_json():
+    assert flatten({"a": 1, "b": {"c": [1]}, "d": None}) == {"a": 1, "b": '{"c":[1]}', "d": None}
+    assert flatten("text") == {"value": "text"}
+
+
+def test_ndjson_rows_of_integrated_run():
+    lines = [orjson.loads(line) for line in _export(INTEGRATED, "validation_reports").splitlines()]
+    assert [line["question"] for line in lines] == [r["question"] for r in INTEGRATED["validation_reports"]]
+    markets = [orjson.loads(line) for line in _export(INTEGRATED, "markets").splitlines()]
+    assert markets == [{"market_name": "A", "tam_usd": 10}, {"market_name": "B", "tam_usd": 2.5}]
+
+
+def test_csv_has_union_of_columns_and_text_for_mixed_types():
+    rows = list(csv.reader(io.StringIO(_export(INTEGRATED, "validation_reports", "csv").decode("utf-8"))))
+    assert rows[0] == ["question", "query_type", "sql_validation"]
+    assert rows[1] == ['He said "hi" [ok] {x}', "1", '{"valid":true}']
+    assert rows[2] == ["back\\slash", "2", ""]
+
+
+def test_question_rows_of_both_layouts():
+    integrated = [orjson.loads(line) for line in _export(INTEGRATED, "questions").splitlines()]
+    assert [(row["market"], row["customer_name"], row["region"]) for row in integrated] == [
+        ("A", "Investors", "EU, US"), ("A", "Investors", "EU, US")]
+    analyzed = [orjson.loads(line) for line in _export(ANALYZE, "questions").splitlines()]
+    assert [row["question"] for row in analyzed] == [q["question"] for q in SEGMENT["valued_questions"]]
+    assert analyzed[0]["market"] is None
+
+
+def test_analyze_layout_sections():
+    assert orjson.loads(_export(ANALYZE, "markets")) == {"market_name": "C"}
+    assert orjson.loads(_export(ANALYZE, "validation_reports")) == {"question": "q", "query_type": 3}
+    assert orjson.loads(_export(ANALYZE, "audits")) == {"table_name": "listings", "allowed_to_use": True}
+
+
+def test_missing_and_unknown_sections():
+    with pytest.raises(MissingSection):
+        export_section(_bytes(INTEGRATED), "audits", "csv")
+    with pytest.raises(ExportError):
+        export_section(_bytes(INTEGRATED), "nope", "csv")
+    with pytest.raises(ExportError):
+        export_section(_bytes(INTEGRATED), "markets", "xml")
+
+
+def test_parquet_round_trip():
+    parquet = pytest.importorskip("pyarrow.parquet")
+    table = parquet.read_table(io.BytesIO(_export(INTEGRATED, "validation_reports", "parquet")))
+    assert table.num_rows == 2
+    assert table.column("query_type").to_pylist() == ["1", "2"]
+
+
+def test_question_table_parquet_without_pyarrow(monkeypatch):
+    from bi_core import question_table
+
+    monkeypatch.setattr(question_table, "pyarrow", None)
+    table = question_table.QuestionTable.from_customer_analysis({"segments": [SEGMENT]}, "A")
+    with pytest.raises(ImportError):
+        table.to_parquet(io.BytesIO())
+
+
+def test_export_refuses_results_above_the_size_limit(monkeypatch, tmp_path):
+    import sys
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "benchmarks"))
+    from bench_api import load_bi_app
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setenv("CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("IDEMPOTENCY_DB", str(tmp_path / "idempotency.db"))
+    app = load_bi_app()
+    module = sys.modules["bi_api_app"]
+    # Non-ASCII text: the limit is in bytes, not characters
+    stored = json.dumps(dict(INTEGRATED, note="é" * 100), ensure_ascii=False).encode("utf-8")
+    module.checkpoint_store.save_step_raw("r1", module.INTEGRATED_RESULT_STEP, stored.decode("utf-8"))
+    assert module.checkpoint_store.step_size("r1", module.INTEGRATED_RESULT_STEP) == len(stored)
+
+    client = TestClient(app)
+    monkeypatch.setattr(module, "EXPORT_MAX_BYTES", len(stored))
+    assert client.get("/runs/r1/export/markets").status_code == 200
+    monkeypatch.setattr(module, "EXPORT_MAX_BYTES", len(stored) - 1)
+    response = client.get("/runs/r1/export/markets")
+    assert response.status_code == 413 and str(len(stored)) in response.json()["detail"]
+    assert client.get("/runs/missing/export/markets").status_code == 404
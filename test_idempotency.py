@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.idempotency Idempotency-Key 中间件测试（离线，pytest）
+"""
+import asyncio
+import json
+
+import pytest
+
+from bi_core.idempotency import IdempotencyMiddleware, IdempotencyStore
+
+
+class Endpoint:
+    """ASGI app answering with the queued (status, delay) outcomes and counting its calls"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes) or [(200, 0)]
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        status, delay = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        body = json.dumps({"call": self.calls, "echo": message["body"].decode()}).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IdempotencyStore(str(tmp_path / "idempotency.db"))
+
+
+def _middleware(endpoint, store, **kwargs):
+    kwargs.setdefault("poll_interval", 0.01)
+    return IdempotencyMiddleware(endpoint, store=store, **kwargs)
+
+
+async def _post(app, body=b"{}", key="k1", method="POST"):
+    headers = [(b"idempotency-key", key.encode())] if key else []
+    scope = {"type": "http", "method": method, "path": "/analyze", "headers": headers}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    headers = {k.decode(): v.decode() for k, v in sent[0]["headers"]}
+    return sent[0]["status"], headers, json.loads(sent[1]["body"])
+
+
+def test_completed_response_is_replayed(store):
+    endpoint = Endpoint()
+    app = _middleware(endpoint, store)
+
+    async def scenario():
+        return await _post(app), await _post(app)
+
+    (first_status, first_headers, first), (status, headers, replayed) = asyncio.run(scenario())
+    assert first_status == status == 200
+    assert replayed == first and endpoint.calls == 1
+    assert headers["idempotent-replayed"] == "true" and "idempotent-replayed" not in first_headers
+
+
+def test_key_reused_with_another_body_is_rejected(store):
+    endpoint = Endpoint()
+    app = _middleware(endpoint, store)
+
+    async def scenario():
+        await _post(app, b'{"a": 1}')
+        return await _post(app, b'{"a": 2}')
+
+    assert asyncio.run(scenario())[0] == 422
+    assert endpoint.calls == 1
+
+
+def test_requests_without_a_key_pass_through(store):
+    endpoint = Endpoint()
+    app = _middleware(endpoint, store)
+
+    async def scenario():
+        await _post(app, key=None)
+        await _post(app, key=None)
+        await _post(app, method="PUT")
+
+    asyncio.run(scenario())
+    assert endpoint.calls == 3
+
+
+def test_concurrent_retry_waits_for_the_running_execution(store):
+    endpoint = Endpoint((200, 0.1))
+    app = _middleware(endpoint, store)
+
+    async def scenario():
+        return await asyncio.gather(_post(app), _post(app))
+
+    (_, _, first), (status, headers, second) = asyncio.run(scenario())
+    assert status == 200 and second == first and endpoint.calls == 1
+    assert headers["idempotent-replayed"] == "true"
+
+
+def test_waiter_runs_the_request_after_a_server_error(store):
+    endpoint = Endpoint((503, 0.1), (200, 0))
+    app = _middleware(endpoint, store)
+
+    async def scenario():
+        return await asyncio.gather(_post(app), _post(app))
+
+    (failed_status, _, _), (status, headers, body) = asyncio.run(scenario())
+    assert failed_status == 503
+    assert status == 200 and body["call"] == 2 and "idempotent-replayed" not in headers
+    assert store.get("/analyze:k1")["status"] == "completed"
+
+
+def test_only_one_waiter_runs_after_a_server_error(store):
+    endpoint = Endpoint((503, 0.1), (200, 0.1))
+    app = _middleware(endpoint, store)
+
+    async def scenario():
+        return await asyncio.gather(_post(app), _post(app), _post(app))
+
+    _, second, third = asyncio.run(scenario())
+    assert endpoint.calls == 2
+    assert second[0] == third[0] == 200 and second[2] == third[2]
+    assert sorted("idempotent-replayed" in headers for _, headers, _ in (second, third)) == [False, True]
+
+
+def test_other_worker_polls_the_shared_store(store):
+    endpoint, other_endpoint = Endpoint((503, 0.1), (200, 0.1)), Endpoint()
+    app = _middleware(endpoint, store)
+    other = _middleware(other_endpoint, IdempotencyStore(store.db_path))
+
+    async def scenario():
+        failed = asyncio.ensure_future(_post(app))
+        await asyncio.sleep(0.02)
+        # Polls until the first worker releases the key, then runs the request itself
+        retried = await _post(other)
+        return await failed, retried, await _post(app)
+
+    (failed_status, _, _), (status, _, body), (_, headers, replayed) = asyncio.run(scenario())
+    assert failed_status == 503 and status == 200
+    assert endpoint.calls == 1 and other_endpoint.calls == 1
+    assert replayed == body and headers["idempotent-replayed"] == "true"
+
+
+def test_wait_timeout_returns_409(store):
+    endpoint = Endpoint((200, 0.3))
+    app = _middleware(endpoint, store, wait_timeout=0.05)
+
+    async def scenario():
+        return await asyncio.gather(_post(app), _post(app))
+
+    (first_status, _, _), (status, headers, _) = asyncio.run(scenario())
+    assert first_status == 200 and status == 409 and "retry-after" in headers
+    assert endpoint.calls == 1
+
+
+def test_cancelled_execution_releases_the_key(store):
+    endpoint = Endpoint((200, 10), (200, 0))
+    app = _middleware(endpoint, store)
+
+    async def scenario():
+        running = asyncio.ensure_future(_post(app))
+        await asyncio.sleep(0.05)
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        return await _post(app)
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 200 and body["call"] == 2
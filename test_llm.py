@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.llm 请求级 API 密钥测试（离线，pytest）
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bi_core import llm, rate_limiter
+from bi_core.llm import current_api_key, openai_client, run_agent, use_api_key
+from bi_core.rate_limiter import RateLimiter, key_fingerprint
+
+KEY_A = "sk-a" + "a" * 60
+KEY_B = "sk-b" + "b" * 60
+
+
+@pytest.fixture(autouse=True)
+def env_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-env" + "e" * 60)
+    monkeypatch.setattr(rate_limiter, "_rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+
+
+def test_keys_stay_with_their_own_task():
+    async def request(api_key, delay):
+        with use_api_key(api_key):
+            await asyncio.sleep(delay)
+            in_thread = await asyncio.to_thread(lambda: openai_client().api_key)
+            return current_api_key(), in_thread
+
+    async def scenario():
+        return await asyncio.gather(request(KEY_A, 0.02), request(KEY_B, 0.01))
+
+    assert asyncio.run(scenario()) == [(KEY_A, KEY_A), (KEY_B, KEY_B)]
+    assert current_api_key().startswith("sk-env")
+
+
+def test_run_agent_passes_the_request_key_to_its_model_provider(monkeypatch):
+    from agents import Agent, Runner
+
+    seen = {}
+
+    async def fake_run(cls, agent, input, **kwargs):
+        await asyncio.sleep(0.01)
+        seen[input] = kwargs["run_config"].model_provider
+        return SimpleNamespace(final_output="ok", raw_responses=[], context_wrapper=SimpleNamespace(usage=None))
+
+    monkeypatch.setattr(Runner, "run", classmethod(fake_run))
+    agent = Agent(name="test", instructions="Answer briefly.", model="gpt-4.1-mini")
+
+    async def request(api_key, text):
+        with use_api_key(api_key):
+            return await run_agent(agent, text)
+
+    async def scenario():
+        await asyncio.gather(request(KEY_A, "a"), request(KEY_B, "b"), run_agent(agent, "env"))
+
+    asyncio.run(scenario())
+    assert seen["a"] is llm._model_provider(KEY_A) and seen["b"] is llm._model_provider(KEY_B)
+    assert seen["a"].openai_provider._stored_api_key == KEY_A
+    assert seen["env"] not in (seen["a"], seen["b"])
+    stats = rate_limiter.get_rate_limiter().metrics()
+    assert {f"gpt-4.1-mini:{key_fingerprint(key)}" for key in (KEY_A, KEY_B)} <= set(stats)
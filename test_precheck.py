@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.precheck 规则预分类测试（离线，pytest）
+"""
+import pytest
+
+from bi_core.precheck import QuestionPrecheck
+from bi_core.schema_index import SchemaIndex
+
+SCHEMA = {"description": {"tables": [
+    {
+        "table_name": "listings",
+        "columns": [{"name": "id", "type": "bigint"}, {"name": "neighbourhood_group", "type": "text"},
+                    {"name": "neighbourhood", "type": "text"}, {"name": "room_type", "type": "text"},
+                    {"name": "price", "type": "numeric"}, {"name": "minimum_nights", "type": "integer"}],
+        "sample_data": [
+            {"id": 1, "neighbourhood_group": "Brooklyn", "neighbourhood": "Williamsburg",
+             "room_type": "Private room", "price": 90, "minimum_nights": 2},
+            {"id": 2, "neighbourhood_group": "Manhattan", "neighbourhood": "Harlem",
+             "room_type": "Entire home/apt", "price": 150, "minimum_nights": 3},
+        ],
+    },
+    {
+        "table_name": "reviews",
+        "columns": [{"name": "listing_id", "type": "bigint"}, {"name": "date", "type": "date"},
+                    {"name": "comments", "type": "text"}],
+        "sample_data": [{"listing_id": 1, "date": "2024-01-02",
+                         "comments": "Lovely stay, spotless apartment and a very helpful host"}],
+    },
+]}}
+
+
+@pytest.fixture
+def precheck(monkeypatch):
+    monkeypatch.delenv("QUESTION_PRECHECK", raising=False)
+    return QuestionPrecheck.from_schema(SCHEMA)
+
+
+def _classify(precheck, text):
+    return precheck.classify({"question": text})
+
+
+def test_count_breakdown_gets_templated_sql(precheck):
+    report = _classify(precheck, "How many listings per room type?")
+    assert report["query_type"] == 1 and report["precheck"]["rule"] == "count"
+    assert 'GROUP BY "room_type"' in report["sql_query"]
+
+
+def test_rank_orders_by_direction(precheck):
+    highest = _classify(precheck, "Which room types have the highest average price?")
+    lowest = _classify(precheck, "Which room types have the lowest average price?")
+    assert highest["sql_query"].endswith("DESC LIMIT 10")
+    assert lowest["sql_query"].endswith("ASC LIMIT 10")
+
+
+def test_trend_buckets_the_date_column(precheck):
+    report = _classify(precheck, "How many reviews per month?")
+    assert report["precheck"]["rule"] == "trend"
+    assert "date_trunc('month', \"date\")" in report["sql_query"]
+
+
+def test_sample_value_hits_go_to_the_model(precheck):
+    assert _classify(precheck, "How many listings are in Brooklyn?") is None
+    assert _classify(precheck, "Which private room listings have the highest average price?") is None
+
+
+def test_unmatched_questions_go_to_the_model(precheck):
+    assert _classify(precheck, "What do guests say about cleanliness?") is None
+    assert _classify(precheck, "How is the stock market doing?") is None
+
+
+def test_rules_never_return_query_type_3(precheck):
+    questions = ["What do guests say about cleanliness?", "How many listings are in Brooklyn?",
+                 "How many listings per room type?", "Weather forecast for tomorrow", "布鲁克林有多少房源？"]
+    reports = [_classify(precheck, text) for text in questions]
+    assert all(report is None or report["query_type"] == 1 for report in reports)
+
+
+def test_wrap_counts_model_calls(precheck):
+    check = precheck.wrap(lambda question: dict(question, query_type=3, sql_query=None))
+    assert check({"question": "What do guests say about cleanliness?"})["query_type"] == 3
+    assert check({"question": "How many listings per room type?"})["query_type"] == 1
+    assert precheck.counts == {"model": 1, "count": 1}
+
+
+def test_disabled_precheck_sends_everything_to_the_model(monkeypatch):
+    monkeypatch.setenv("QUESTION_PRECHECK", "false")
+    assert _classify(QuestionPrecheck.from_schema(SCHEMA), "How many listings per room type?") is None
+
+
+def test_value_terms_still_shape_the_schema_slice():
+    index = SchemaIndex.from_schema(SCHEMA)
+    assert ("listings", "neighbourhood_group") in index.lookup("brooklyn")
+    assert not index.lookup("brooklyn", values=False)
+    assert index.slice("How many listings are in Brooklyn?").startswith("listings(neighbourhood_group text")
+
+
+def test_type_3_questions_reach_the_model_and_keep_its_answer(monkeypatch, tmp_path):
+    import json
+    import sys
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "benchmarks"))
+    from bench_api import load_bi_app
+
+    import question_check_test
+    from bi_core.sql_check import validate_reports
+
+    seen = {}
+
+    def model(question, tables_info):
+        # Stand-in for question_check: nothing in the schema answers these
+        seen[question["question"]] = tables_info
+        return dict(question, sql_query=None, query_type=3)
+
+    monkeypatch.delenv("QUESTION_PRECHECK", raising=False)
+    monkeypatch.setenv("CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("IDEMPOTENCY_DB", str(tmp_path / "idempotency.db"))
+    monkeypatch.setattr(question_check_test, "checkquestion_with_gpt", model)
+    load_bi_app()
+    precheck, check, catalog = sys.modules["bi_api_app"].build_question_check(json.dumps(SCHEMA))
+
+    unanswerable = ["What do guests say about cleanliness?", "How is the stock market doing?"]
+    reports = [check({"question": text}) for text in unanswerable + ["How many listings per room type?"]]
+    counts = validate_reports(reports, catalog)
+
+    assert list(seen) == unanswerable
+    # The model sees the free-text column that might hold the answer before ruling it out
+    assert "comments text" in seen[unanswerable[0]]
+    assert [report["query_type"] for report in reports] == [3, 3, 1]
+    assert all("precheck" not in report and report["sql_query"] is None for report in reports[:2])
+    assert precheck.counts == {"model": 2, "count": 1}
+    assert counts["checked"] == 1 and counts["downgraded"] == 0
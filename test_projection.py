@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.projection 字段投影与分页测试（离线，pytest）
+"""
+import json
+
+import pytest
+
+from bi_core.projection import PageRequest, ProjectionError, paginate, project, view_results
+
+DOC = {
+    "run_id": "r1",
+    "validation_reports": [{"q": f"question {i}", "t": i % 3, "sql": f"SELECT {i}"} for i in range(5)],
+    "market_analysis": json.dumps({"summary": {"headline": "h"}, "market_segments": [{"market_name": "A"}]}),
+}
+
+
+def test_indexed_pointers_keep_every_element():
+    result = project(DOC, ["/validation_reports/0", "/validation_reports/2"])
+    assert result == {"validation_reports": [DOC["validation_reports"][0], DOC["validation_reports"][2]]}
+
+
+def test_fields_of_different_elements_are_not_merged():
+    result = project(DOC, ["/validation_reports/0/q", "/validation_reports/2/t"])
+    assert result == {"validation_reports": [{"q": "question 0"}, {"t": 2}]}
+
+
+def test_fields_of_one_element_are_merged():
+    result = project(DOC, ["/validation_reports/1/q", "/validation_reports/1/t"])
+    assert result == {"validation_reports": [{"q": "question 1", "t": 1}]}
+
+
+def test_wildcard_and_index_merge_by_position():
+    result = project(DOC, ["/validation_reports/*/q", "/validation_reports/3/sql"])
+    reports = result["validation_reports"]
+    assert [report["q"] for report in reports] == [f"question {i}" for i in range(5)]
+    assert reports[3] == {"q": "question 3", "sql": "SELECT 3"}
+    assert all("sql" not in report for index, report in enumerate(reports) if index != 3)
+
+
+def test_whole_list_absorbs_element_projections():
+    result = project(DOC, ["/validation_reports", "/validation_reports/4/q"])
+    assert result["validation_reports"] == DOC["validation_reports"]
+
+
+def test_json_text_outputs_are_decoded():
+    result = project(DOC, ["/market_analysis/market_segments/*/market_name", "/run_id"])
+    assert result == {"market_analysis": {"market_segments": [{"market_name": "A"}]}, "run_id": "r1"}
+
+
+def test_missing_pointers_select_nothing():
+    assert project(DOC, ["/nope", "/validation_reports/99"]) == {}
+    with pytest.raises(ProjectionError):
+        project(DOC, ["no-slash"])
+
+
+def test_pages_follow_the_cursor_to_the_end():
+    seen, cursor = [], None
+    while True:
+        page_doc, page = paginate(DOC, "/validation_reports", cursor, limit=2)
+        seen.extend(report["q"] for report in page_doc["validation_reports"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"question {i}" for i in range(5)]
+    assert page["total"] == 5
+
+
+def test_cursor_is_bound_to_its_section():
+    _, page = paginate(DOC, "/validation_reports", limit=2)
+    with pytest.raises(ProjectionError):
+        paginate(DOC, "/market_analysis/market_segments", page["next_cursor"])
+
+
+def test_view_results_pages_then_projects():
+    results, page = view_results(DOC, ["/validation_reports/*/q"],
+                                 PageRequest(section="/validation_reports", limit=2))
+    assert results == {"validation_reports": [{"q": "question 0"}, {"q": "question 1"}]}
+    assert page["offset"] == 0 and page["next_cursor"]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.rate_limiter 限流测试（离线，pytest）
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from bi_core import rate_limiter
+from bi_core.rate_limiter import RateLimiter, key_fingerprint
+
+
+def test_queued_callers_wait_in_order():
+    limiter = RateLimiter(rpm_limit=60, tpm_limit=0)
+    waits = [limiter._reserve("m", None, 0)[1] for _ in range(62)]
+    assert waits[:60] == [0.0] * 60
+    assert 0 < waits[60] < waits[61]
+
+
+def test_cancelled_waiter_refunds_its_reservation():
+    limiter = RateLimiter(rpm_limit=60, tpm_limit=6000)
+
+    async def scenario():
+        await limiter.acquire_async("m", None, estimated_tokens=6000)
+        waiter = asyncio.ensure_future(limiter.acquire_async("m", None, estimated_tokens=3000))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # Without the refund the next caller would queue behind the cancelled one
+        return limiter._reserve("m", None, 0)[1]
+
+    assert asyncio.run(scenario()) < 1
+    stats = limiter.metrics()["m:default"]
+    assert stats["requests"] == 2 and stats["estimated_tokens"] == 6000 and stats["waiting"] == 0
+
+
+def test_zero_limits_never_wait():
+    limiter = RateLimiter(rpm_limit=0, tpm_limit=0)
+    assert all(limiter.acquire("m", None, 10 ** 6) == 0 for _ in range(1000))
+
+
+def test_sync_acquire_refuses_to_block_the_event_loop():
+    limiter = RateLimiter(rpm_limit=0, tpm_limit=0)
+
+    async def on_loop():
+        return limiter.acquire("m", None, 1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(on_loop())
+
+
+def test_review_queued_on_the_limiter_does_not_stall_other_requests(monkeypatch, tmp_path):
+    """/review waits for an empty bucket in a worker thread while /health keeps answering"""
+    httpx = pytest.importorskip("httpx")
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "benchmarks"))
+    from bench_api import load_bi_app
+    from fake_backend import FakeBackend
+
+    monkeypatch.setenv("CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("IDEMPOTENCY_DB", str(tmp_path / "idempotency.db"))
+    api_key = "sk-" + "x" * 60
+    limiter = RateLimiter(rpm_limit=60, tpm_limit=0)
+    # Drain the bucket: the audit's request has to wait about a second
+    for _ in range(60):
+        limiter._reserve("gpt-4o-mini", api_key, 0)
+    monkeypatch.setattr(rate_limiter, "_rate_limiter", limiter)
+
+    async def scenario(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            review = asyncio.ensure_future(client.post("/review", json={
+                "supabase_project_id": "p", "supabase_access_token": "t", "openai_api_key": api_key,
+                "tables_info": [{"table_name": "listings", "columns": ["id"], "sample_data": [{"id": 1}]}],
+            }))
+            await asyncio.sleep(0.1)
+            started = time.monotonic()
+            health = await client.get("/health")
+            health_latency = time.monotonic() - started
+            assert not review.done()
+            return health, health_latency, await review
+
+    with FakeBackend(latency_scale=0):
+        health, health_latency, review = asyncio.run(scenario(load_bi_app()))
+    assert health.status_code == 200 and health_latency < 0.5
+    assert review.status_code == 200 and review.json()["tables_audited"][0]["allowed_to_use"] is True
+    assert limiter.metrics()[f"gpt-4o-mini:{key_fingerprint(api_key)}"]["queued_requests"] == 1
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.resilience 重试与熔断测试（离线，pytest）
+"""
+import asyncio
+import itertools
+
+import pytest
+
+from bi_core import resilience
+from bi_core.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_retry, call_with_retry_async
+
+NO_DELAY = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+_names = itertools.count()
+
+
+def _half_open_breaker():
+    """A breaker (registered under a fresh name) that lets the next call through as its probe"""
+    name = f"test-{next(_names)}"
+    breaker = resilience.get_circuit_breaker(name)
+    breaker.reset_timeout = 0
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return name, breaker
+
+
+def test_retryable_errors_are_retried():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise TimeoutError()
+        return "ok"
+
+    assert call_with_retry(flaky, f"test-{next(_names)}", NO_DELAY) == "ok"
+    assert len(calls) == 3
+
+
+def test_non_retryable_error_fails_once():
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        call_with_retry(bad_request, f"test-{next(_names)}", NO_DELAY)
+    assert len(calls) == 1
+
+
+def test_cancelled_probe_frees_the_half_open_breaker():
+    name, breaker = _half_open_breaker()
+
+    async def scenario():
+        probe = asyncio.ensure_future(call_with_retry_async(lambda: asyncio.sleep(10), name, NO_DELAY))
+        await asyncio.sleep(0.01)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def healthy():
+            return "ok"
+        return await call_with_retry_async(healthy, name, NO_DELAY)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_non_retryable_probe_does_not_close_the_breaker():
+    name, breaker = _half_open_breaker()
+
+    def bad_request():
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        call_with_retry(bad_request, name, NO_DELAY)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # The probe slot was released, so the next call probes again
+    assert call_with_retry(lambda: "ok", name, NO_DELAY) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_fails_fast():
+    name, breaker = _half_open_breaker()
+    breaker.reset_timeout = 60
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(lambda: "never", name, NO_DELAY)
+    assert breaker.snapshot()["rejected_calls"] == 1
+
+
+def test_invalid_output_is_retried_without_tripping_the_breaker():
+    from agents.exceptions import ModelBehaviorError
+
+    name, breaker = _half_open_breaker()
+    calls = []
+
+    def malformed_then_valid():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ModelBehaviorError("Invalid JSON when parsing output")
+        return "ok"
+
+    assert call_with_retry(malformed_then_valid, name, NO_DELAY) == "ok"
+    assert len(calls) == 3
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_brand_strategy_falls_back_after_retries_are_exhausted(monkeypatch, tmp_path):
+    import sys
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "benchmarks"))
+    from bench_api import load_bi_app
+    from fastapi.testclient import TestClient
+
+    import brand_strategist_agent
+
+    async def exhausted(agent, input_msg, **kwargs):
+        return None
+
+    monkeypatch.setenv("CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("IDEMPOTENCY_DB", str(tmp_path / "idempotency.db"))
+    monkeypatch.setattr(brand_strategist_agent, "run_with_retry", exhausted)
+    app = load_bi_app()
+    module = sys.modules["bi_api_app"]
+    response = TestClient(app).post("/brand-strategy", json={
+        "supabase_project_id": "p", "supabase_access_token": "t", "analysis_data": {"a": 1}})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["brand_strategy"] == module.FALLBACK_BRAND_STRATEGY
+    assert "default brand strategy" in body["message"]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.sampling 有界表概况测试（离线，pytest）
+"""
+import json
+
+import pytest
+
+from bi_core.sampling import MAX_COLUMN_NAMES, TableSampler
+
+ROOM_TYPES = ["Private room", "Entire home/apt", "Shared room"]
+
+
+def _table(rows, extra_columns=0):
+    return {
+        "table_name": "listings",
+        "row_count": rows,
+        "columns": [{"name": "id", "type": "bigint"}, {"name": "room_type", "type": "text"},
+                    {"name": "price", "type": "numeric"}, {"name": "description", "type": "text"}]
+                   + [f"extra_{i}" for i in range(extra_columns)],
+        "sample_data": [{"id": i, "room_type": ROOM_TYPES[i % 3], "price": 50 + i % 200,
+                         "description": f"Listing {i} " + "cosy flat near the park " * 40}
+                        for i in range(rows)],
+    }
+
+
+@pytest.fixture
+def sampler(monkeypatch):
+    for name in ("SAMPLE_ROWS", "SAMPLE_VALUE_CHARS", "SAMPLE_COLUMNS"):
+        monkeypatch.delenv(name, raising=False)
+    return TableSampler.from_env()
+
+
+def test_sample_rows_are_capped_and_cover_every_category(sampler):
+    profile = sampler.profile(_table(1000))
+    assert profile["sample_row_count"] == 1000
+    assert len(profile["sample_rows"]) == sampler.max_rows == 5
+    assert {row["room_type"] for row in profile["sample_rows"]} == set(ROOM_TYPES)
+    assert profile["column_stats"]["price"] == {"type": "numeric", "non_null": 1000, "distinct": 200,
+                                                "min": 50, "max": 249, "top_values": [50, 51, 52]}
+
+
+def test_small_tables_keep_every_row(sampler):
+    assert [row["id"] for row in sampler.profile(_table(3))["sample_rows"]] == [0, 1, 2]
+
+
+def test_profile_size_does_not_grow_with_the_rows(sampler):
+    sizes = [len(json.dumps(sampler.profile(_table(rows)))) for rows in (100, 10000)]
+    assert abs(sizes[0] - sizes[1]) < 100
+    # Long text is cut to max_value_chars
+    description = sampler.profile(_table(10))["sample_rows"][0]["description"]
+    assert description.startswith("Listing 0 cosy") and description.endswith("chars)")
+    assert len(description) < sampler.max_value_chars + 20
+
+
+def test_profile_is_deterministic_per_table(sampler):
+    assert sampler.profile(_table(500)) == sampler.profile(_table(500))
+
+
+def test_settings_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SAMPLE_ROWS", "2")
+    monkeypatch.setenv("SAMPLE_COLUMNS", "2")
+    profile = TableSampler.from_env().profile(_table(100))
+    assert len(profile["sample_rows"]) == 2
+    assert list(profile["column_stats"]) == ["id", "room_type"]
+    assert all(list(row) == ["id", "room_type"] for row in profile["sample_rows"])
+
+
+def test_column_names_are_capped(sampler):
+    profile = sampler.profile(_table(10, extra_columns=MAX_COLUMN_NAMES))
+    assert len(profile["columns"]) == MAX_COLUMN_NAMES
+    assert profile["more_columns"] == 4
+    assert len(profile["column_stats"]) == sampler.max_columns
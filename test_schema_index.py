@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.schema_index 问题相关的 schema 切片测试（离线，pytest）
+"""
+import pytest
+
+from bi_core.schema_index import SchemaIndex
+
+WIDE_COLUMNS = [{"name": f"attribute_{i}", "type": "text"} for i in range(30)]
+SCHEMA = {"description": {"tables": [
+    {
+        "table_name": "listings",
+        "columns": [{"name": "id", "type": "bigint"}, {"name": "host_id", "type": "bigint"},
+                    {"name": "room_type", "type": "text"}, {"name": "price", "type": "numeric"}] + WIDE_COLUMNS,
+        "sample_data": [{"id": i, "room_type": room_type, "price": 100 + i}
+                        for i, room_type in enumerate(["Private room", "Entire home/apt", "Private room",
+                                                       "Shared room", "Hotel room"])],
+    },
+    {
+        "table_name": "reviews",
+        "columns": [{"name": "listing_id", "type": "bigint"}, {"name": "date", "type": "date"},
+                    {"name": "comments", "type": "text"}],
+        "sample_data": [{"listing_id": 1, "date": "2024-01-02", "comments": "Spotless " * 20}],
+    },
+    {"table_name": "calendar", "columns": [{"name": "listing_id", "type": "bigint"}, {"name": "date", "type": "date"},
+                                           {"name": "available", "type": "boolean"}]},
+    {"table_name": "neighbourhoods", "columns": [{"name": "neighbourhood", "type": "text"}]},
+    {"table_name": "hosts", "columns": [{"name": "host_id", "type": "bigint"}, {"name": "host_name", "type": "text"}]},
+]}}
+
+
+@pytest.fixture
+def index(monkeypatch):
+    for name in ("SCHEMA_SLICE_TABLES", "SCHEMA_SLICE_COLUMNS", "SCHEMA_SLICE_SAMPLES"):
+        monkeypatch.delenv(name, raising=False)
+    return SchemaIndex.from_schema(SCHEMA)
+
+
+def test_relevance_spreads_a_term_over_its_hits(index):
+    scores = index.relevance("What do reviews comments say about availability?")
+    assert scores["reviews"]["comments"] == 1.0
+    assert scores["calendar"]["available"] == 1.0
+    assert "listings" not in scores
+
+
+def test_slice_keeps_the_most_relevant_tables(index):
+    lines = index.slice("Average price per room type of listings with review comments", max_tables=2).splitlines()
+    assert lines[0].startswith("listings(room_type text")
+    assert lines[1].startswith("reviews(comments text")
+    assert lines[-1] == "Other tables: calendar, neighbourhoods, hosts"
+
+
+def test_slice_caps_columns_but_keeps_relevant_and_key_columns(index):
+    line = index.slice("Average price per room type", max_columns=5).splitlines()[0]
+    columns = [part.split(" ")[0] for part in line[len("listings("):].split("; ")]
+    # Relevant columns first, then keys, then the rest up to the cap
+    assert columns[:4] == ["room_type", "price", "id", "host_id"]
+    assert line.endswith("; +29 more columns)")
+
+
+def test_slice_samples_are_distinct_capped_and_only_for_relevant_columns(index):
+    listings, reviews = index.slice("room types and review comments", max_samples=2).splitlines()[:2]
+    assert 'room_type text e.g. "Private room", "Entire home/apt";' in listings
+    assert "Shared room" not in listings and "e.g. 10" not in listings
+    # Long values are cut
+    assert '"Spotless Spotless' in reviews and len(reviews) < 120
+
+
+def test_slice_settings_come_from_the_environment(monkeypatch, index):
+    monkeypatch.setenv("SCHEMA_SLICE_TABLES", "1")
+    monkeypatch.setenv("SCHEMA_SLICE_SAMPLES", "0")
+    lines = index.slice("Average price per room type of listings with review comments").splitlines()
+    assert len(lines) == 2 and "e.g." not in lines[0]
+
+
+def test_unmatched_question_gets_every_table_without_samples(index):
+    lines = index.slice("How is the stock market doing?").splitlines()
+    assert [line.split("(")[0] for line in lines] == ["listings", "reviews", "calendar", "neighbourhoods", "hosts"]
+    assert not any("e.g." in line for line in lines)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.sessions 会话分支测试（离线，pytest）
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+from bi_core.sessions import BatchSessions, SessionFork
+
+
+class MemorySession:
+    """In-memory stand-in for SQLiteSession"""
+
+    def __init__(self, session_id, items=None):
+        self.session_id = session_id
+        self.items = list(items or [])
+
+    async def get_items(self, limit=None):
+        return list(self.items)
+
+    async def add_items(self, items):
+        self.items.extend(items)
+
+
+def _turn(text):
+    return {"role": "user", "content": text}
+
+
+def test_fork_branches_see_the_prefix_and_only_their_own_turns():
+    parent = MemorySession("u1", [_turn("earlier")])
+
+    async def scenario():
+        async with SessionFork(parent) as fork:
+            market, audience = fork.branch("market"), fork.branch("audience")
+            await market.add_items([_turn("market")])
+            await audience.add_items([_turn("audience")])
+            seen = await market.get_items(), await audience.get_items()
+            await fork.merge("audience", "market")
+            return seen
+
+    market_view, audience_view = asyncio.run(scenario())
+    assert market_view == [_turn("earlier"), _turn("market")]
+    assert audience_view == [_turn("earlier"), _turn("audience")]
+    assert parent.items == [_turn("earlier"), _turn("audience"), _turn("market")]
+
+
+def test_failed_parallel_section_leaves_the_parent_untouched():
+    parent = MemorySession("u1")
+
+    async def scenario():
+        async with SessionFork(parent) as fork:
+            await fork.branch("market").add_items([_turn("market")])
+            raise RuntimeError("stage failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+    assert parent.items == []
+
+
+def test_batch_runs_of_one_user_overlap_and_merge_in_index_order():
+    parents = {"u1": MemorySession("u1", [_turn("earlier")]), "u2": MemorySession("u2")}
+    sessions = BatchSessions(parents.__getitem__)
+    running, peak = [0], [0]
+
+    def analysis(text, delay, fail=False):
+        async def run(session):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            try:
+                await asyncio.sleep(delay)
+                if fail:
+                    raise RuntimeError(text)
+                history = await session.get_items()
+                await session.add_items([_turn(text)])
+                return history
+            finally:
+                running[0] -= 1
+        return run
+
+    async def scenario():
+        results = await asyncio.gather(
+            sessions.run("u1", 0, analysis("first", 0.05)),
+            sessions.run("u1", 1, analysis("second", 0.01)),
+            sessions.run("u1", 2, analysis("failed", 0.02, fail=True)),
+            sessions.run("u2", 3, analysis("other user", 0.01)),
+            return_exceptions=True,
+        )
+        return results, await sessions.merge()
+
+    (first, second, failed, _), merged = asyncio.run(scenario())
+    assert peak[0] == 4
+    # Every run saw the history from before the batch, not its siblings' turns
+    assert first == second == [_turn("earlier")]
+    assert isinstance(failed, RuntimeError)
+    assert merged == 3
+    assert parents["u1"].items == [_turn("earlier"), _turn("first"), _turn("second")]
+    assert parents["u2"].items == [_turn("other user")]
+
+
+def test_analyze_batch_forks_the_session_per_item(monkeypatch, tmp_path):
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "benchmarks"))
+    from bench_api import load_bi_app
+    from fake_backend import FakeBackend
+    from fastapi.testclient import TestClient
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("IDEMPOTENCY_DB", str(tmp_path / "idempotency.db"))
+
+    with FakeBackend(stage_latency={"market": 0.1, "audience": 0.1}):
+        app = load_bi_app()
+        module = sys.modules["bi_api_app"]
+        running, peak = [0], [0]
+        run_stored_analysis = module.run_stored_analysis
+
+        async def tracked(request, agents=None, session=None):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            try:
+                return await run_stored_analysis(request, agents, session)
+            finally:
+                running[0] -= 1
+
+        monkeypatch.setattr(module, "run_stored_analysis", tracked)
+        item = {"supabase_project_id": "p", "supabase_access_token": "t", "user_name": "batch_user"}
+        response = TestClient(app).post("/analyze/batch", json=[
+            dict(item, analysis_type="market"), dict(item, analysis_type="audience")
+        ])
+
+    assert response.status_code == 200 and response.json()["summary"]["succeeded"] == 2
+    # The default user_name is shared by most batches, so its items must not be serialized
+    assert peak[0] == 2
+    history = asyncio.run(module.get_session("batch_user").get_items())
+    prompts = [turn["content"] for turn in history if turn["role"] == "user"]
+    assert len(prompts) == 2
+    assert "market analysis" in prompts[0].lower() and "audience analysis" in prompts[1].lower()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bi_core.sql_check SQL 干运行校验测试（离线，pytest）
+"""
+import pytest
+
+from bi_core import sql_check
+from bi_core.sql_check import SQLCatalog, check_sql, validate_reports
+
+SCHEMA = {"description": {"tables": [
+    {"table_name": "listings",
+     "columns": [{"name": "id", "type": "bigint"}, {"name": "room_type", "type": "text"},
+                 {"name": "price", "type": "numeric"}, {"name": "last_review", "type": "date"}],
+     "sample_data": []},
+    {"table_name": "reviews", "columns": ["listing_id", "date", "comments"],
+     "sample_data": [{"listing_id": 1, "date": "2024-01-02", "comments": "Great stay"}]},
+]}}
+CATALOG = SQLCatalog.from_schema(SCHEMA)
+
+
+def test_sqlglot_is_installed():
+    # Without it Postgres-only syntax comes back unverified instead of checked
+    assert sql_check.sqlglot is not None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT date_trunc('month', \"date\") AS month, COUNT(*) FROM reviews GROUP BY 1 ORDER BY 1",
+    "SELECT room_type, AVG(price)::numeric(10, 2) FROM public.listings GROUP BY room_type",
+    "SELECT date_trunc('week', last_review)::date, COUNT(*) FILTER (WHERE price > 100) FROM listings GROUP BY 1",
+    "SELECT l.id, r.comments FROM listings l JOIN reviews r ON r.listing_id = l.id "
+    "WHERE r.date >= NOW() - INTERVAL '30 days'",
+    "WITH counts AS (SELECT listing_id, COUNT(*) AS n FROM reviews GROUP BY listing_id) "
+    "SELECT l.room_type, AVG(c.n) FROM listings l JOIN counts c ON c.listing_id = l.id GROUP BY 1",
+])
+def test_postgres_queries_resolve(sql):
+    assert check_sql(sql, CATALOG) == {"valid": True}
+
+
+@pytest.mark.parametrize("sql, stage", [
+    ("SELECT date_trunc('month', reviewed_at) FROM reviews", "resolve"),
+    ("SELECT host_name::text FROM listings", "resolve"),
+    ("SELECT * FROM hosts", "resolve"),
+    ("SELECT 1; SELECT 2", "parse"),
+    ("DELETE FROM listings", "parse"),
+])
+def test_invalid_queries_are_rejected(sql, stage):
+    result = check_sql(sql, CATALOG)
+    assert result["valid"] is False and result["stage"] == stage
+
+
+def test_invalid_sql_answers_are_downgraded():
+    reports = [
+        {"question": "q1", "query_type": 1, "sql_query": "SELECT date_trunc('day', \"date\") FROM reviews"},
+        {"question": "q2", "query_type": 1, "sql_query": "SELECT guest_count FROM listings"},
+        {"question": "q3", "query_type": 1, "sql_query": None},
+        {"question": "q4", "query_type": 3, "sql_query": None},
+    ]
+    counts = validate_reports(reports, CATALOG)
+    assert counts == {"checked": 3, "valid": 1, "invalid": 2, "unverified": 0, "downgraded": 2}
+    assert [report["query_type"] for report in reports] == [1, 2, 2, 3]
+    assert reports[1]["sql_validation"]["original_query_type"] == 1
+    assert "sql_validation" not in reports[3]
+
+
+def test_shadow_database_catches_unknown_columns_without_sqlglot(monkeypatch):
+    monkeypatch.setattr(sql_check, "sqlglot", None)
+    assert check_sql("SELECT room_type FROM listings", CATALOG) == {"valid": True}
+    assert check_sql("SELECT guest_count FROM listings", CATALOG)["stage"] == "shadow_db"
+    assert check_sql("SELECT price::int FROM listings", CATALOG)["valid"] is None